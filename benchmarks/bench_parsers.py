@@ -0,0 +1,402 @@
+"""
+以 HTML 樣本量測各 extract_* 函數與解析樹建立的耗時與記憶體配置
+
+樣本來自 benchmarks/corpus 中的頁面（搜尋結果、查無資料、一般公司、獨資商號、
+有 512 家分公司的大型企業與換頁回應，含網站的頁首、導覽列、表單與頁尾），
+manifest.json 記錄每個檔案要執行的解析項目；模擬網站產生的頁面只作為額外樣本。
+也可以加入 HtmlArchive 封存的頁面，或以 --export-corpus 將封存的頁面匯出到樣本目錄。
+結果可存為基準，之後的執行與基準比較並標出變慢或配置變多的項目。
+
+    python benchmarks/bench_parsers.py --save-baseline
+    python benchmarks/bench_parsers.py            # 與基準比較，有退步時結束代碼為 1
+    python benchmarks/bench_parsers.py --archive downloads/archive --export-corpus benchmarks/corpus
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+import bs4
+import lxml.etree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_findbiz  # noqa: E402
+import scrape_and_print as scraper  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "corpus")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "parser_baseline.json")
+MANIFEST = "manifest.json"
+
+# 詳細資料頁需要執行的解析項目（與 HTTP 快速路徑相同）
+DETAIL_KINDS = [
+    "detail",
+    "tabs_complete",
+    "shareholder",
+    "manager",
+    "branch",
+    "factory",
+    "shareholder_paging",
+    "manager_paging",
+    "branch_paging",
+    "factory_paging",
+]
+
+# 封存頁面種類對應的解析項目
+ARCHIVE_KINDS = {
+    "search": ["search"],
+    "detail": ["detail"],
+    **{kind: [kind, f"{kind}_paging"] for kind in mock_findbiz.TABS},
+}
+
+# 小於此秒數或 KB 數的差異視為量測雜訊
+NOISE_SECONDS = 2e-6
+NOISE_KB = 1.0
+
+
+def _company(registration_number, **sizes):
+    """以模擬網站的資料產生器建立公司，並依 sizes 調整各頁籤的筆數"""
+    company = mock_findbiz.MockCompanies(large_rate=1.0).get(registration_number)
+    for kind, count in sizes.items():
+        rows = company[kind]
+        company[kind] = [rows[i % len(rows)] for i in range(count)] if rows else []
+    return company
+
+
+def load_corpus(corpus_dir):
+    """
+    讀取樣本目錄中的 HTML 檔，解析項目依 manifest.json，未列出的檔案視為詳細資料頁
+
+    Returns:
+        list: (名稱, HTML, 解析項目列表)
+    """
+    manifest = {}
+    manifest_path = os.path.join(corpus_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    corpus = []
+    for filename in sorted(os.listdir(corpus_dir)):
+        if not filename.endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(corpus_dir, filename), encoding="utf-8") as f:
+            html = f.read()
+        entry = manifest.get(filename, {})
+        # 換頁回應只有頁籤內容，包成容器後才能以整頁的選擇器解析
+        if entry.get("container"):
+            html = scraper._wrap_fragment(html, entry["container"])
+        corpus.append((f"file:{filename}", html, entry.get("kinds", DETAIL_KINDS)))
+    return corpus
+
+
+def iter_archive_pages(archive_dir):
+    """
+    逐一產生 HtmlArchive 中每家公司最新一次查詢的頁面
+
+    Yields:
+        tuple: (統一編號, 頁面種類, 頁碼, HTML)
+    """
+    archive = scraper.HtmlArchive(archive_dir)
+    seen = set()
+    for registration_number in archive.registration_numbers():
+        entry = archive.latest(registration_number)
+        for page in entry["pages"] if entry else []:
+            kind = page["kind"]
+            # HTTP 快速路徑以同一份詳細資料頁記錄每個頁籤，依頁面與種類去除重複
+            if (page["sha256"], kind) in seen or kind not in ARCHIVE_KINDS:
+                continue
+            seen.add((page["sha256"], kind))
+            html = archive.get(page["sha256"], page["codec"])
+            yield registration_number, kind, page["page"], html
+
+
+def export_corpus(archive_dir, corpus_dir):
+    """
+    將 HtmlArchive 中的頁面匯出為樣本目錄中的 HTML 檔，並更新 manifest.json
+
+    Returns:
+        int: 匯出的檔案數
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest_path = os.path.join(corpus_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    exported = 0
+    for registration_number, kind, page_num, html in iter_archive_pages(archive_dir):
+        filename = f"{registration_number}_{kind}_{page_num}.html"
+        with open(os.path.join(corpus_dir, filename), "w", encoding="utf-8") as f:
+            f.write(html)
+        entry = {"kinds": ARCHIVE_KINDS[kind]}
+        if kind in mock_findbiz.TABS:
+            entry["container"] = mock_findbiz.TABS[kind][1]
+        manifest[filename] = entry
+        exported += 1
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return exported
+
+
+def build_corpus(corpus_dir=DEFAULT_CORPUS, archive_dir=None, generated=True):
+    """
+    建立量測樣本
+
+    Args:
+        corpus_dir: 樣本目錄，None 表示不使用
+        archive_dir: 額外加入的 HtmlArchive 封存目錄
+        generated: 是否加入模擬網站產生的頁面
+
+    Returns:
+        list: (名稱, HTML, 解析項目列表)
+    """
+    corpus = load_corpus(corpus_dir) if corpus_dir else []
+
+    if archive_dir:
+        for registration_number, kind, page_num, html in iter_archive_pages(archive_dir):
+            if kind in mock_findbiz.TABS:
+                html = scraper._wrap_fragment(html, mock_findbiz.TABS[kind][1])
+            corpus.append(
+                (f"archive:{registration_number}:{kind}:{page_num}", html, ARCHIVE_KINDS[kind])
+            )
+
+    if generated:
+        corpus.extend(build_generated_corpus())
+    return corpus
+
+
+def build_generated_corpus():
+    """
+    以模擬網站產生額外的樣本，頁面只有解析需要的結構，不含網站的頁首與腳本
+
+    Returns:
+        list: (名稱, HTML, 解析項目列表)
+    """
+    small = _company("22099131", shareholder=7, manager=2, branch=2, factory=1)
+    sole = _company("04595257", shareholder=1, manager=0, branch=0, factory=0)
+    conglomerate = _company("22178368", shareholder=30, manager=20, branch=500, factory=60)
+
+    return [
+        ("mock:search_result", mock_findbiz.render_search("22099131", small), ["search"]),
+        ("mock:search_not_found", mock_findbiz.render_search("22099131", None), ["search"]),
+        (
+            "mock:sole_proprietor_empty_tabs",
+            mock_findbiz.render_detail("04595257", sole, page_size=10),
+            DETAIL_KINDS,
+        ),
+        ("mock:small_company", mock_findbiz.render_detail("22099131", small, page_size=10), DETAIL_KINDS),
+        (
+            "mock:conglomerate_500_branches",
+            mock_findbiz.render_detail("22178368", conglomerate, page_size=1000),
+            DETAIL_KINDS,
+        ),
+        (
+            "mock:conglomerate_first_page",
+            mock_findbiz.render_detail("22178368", conglomerate, page_size=10),
+            DETAIL_KINDS,
+        ),
+        (
+            "mock:factory_page_fragment",
+            scraper._wrap_fragment(
+                mock_findbiz.render_table("factory", conglomerate["factory"], 3, 10),
+                "tabFactoryContent",
+            ),
+            ["factory", "factory_paging"],
+        ),
+    ]
+
+
+def _time(func, repeat):
+    """回傳每次呼叫的最短與中位數秒數"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    samples = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return min(samples), statistics.median(samples)
+
+
+def _allocations(func):
+    """
+    回傳單次呼叫期間 Python 物件配置的峰值、呼叫結束後仍保留的記憶體（位元組）與新增的區塊數
+
+    tracemalloc 只追蹤 Python 的配置，lxml 在 libxml2 中建立的解析樹不會計入。
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        blocks = sum(
+            stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0
+        )
+        del result
+    finally:
+        tracemalloc.stop()
+    return peak - base, current - base, blocks
+
+
+def run(corpus, backends=("bs4", "lxml"), repeat=5):
+    """
+    量測每份樣本在各解析後端下建立解析樹與執行各解析項目的成本
+
+    Returns:
+        dict: "樣本/後端/項目" 對應的 seconds、median_seconds、peak_kb、retained_kb、blocks
+    """
+    results = {}
+    for name, html, kinds in corpus:
+        for backend in backends:
+            if backend == "lxml":
+                build = lambda: scraper.parse_html_tree(html)  # noqa: E731
+                extractors = scraper.PAGE_EXTRACTORS_LXML
+            else:
+                build = lambda: bs4.BeautifulSoup(html, "lxml")  # noqa: E731
+                extractors = scraper.PAGE_EXTRACTORS
+            tree = build()
+            operations = [("construct", build)]
+            operations.extend(
+                (kind, lambda extractor=extractors[kind]: extractor(tree)) for kind in kinds
+            )
+            for operation, func in operations:
+                best, median = _time(func, repeat)
+                peak, retained, blocks = _allocations(func)
+                results[f"{name}/{backend}/{operation}"] = {
+                    "seconds": best,
+                    "median_seconds": median,
+                    "peak_kb": round(peak / 1024, 1),
+                    "retained_kb": round(retained / 1024, 1),
+                    "blocks": blocks,
+                    "html_kb": round(len(html.encode("utf-8")) / 1024, 1),
+                }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    與基準比較，耗時或峰值配置超過基準 (1 + threshold) 倍的項目視為退步
+
+    Returns:
+        list: (項目, 指標, 基準值, 本次值, 比例)
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if (
+            current["seconds"] > previous["seconds"] * (1 + threshold)
+            and current["seconds"] - previous["seconds"] > NOISE_SECONDS
+        ):
+            regressions.append(
+                (key, "seconds", previous["seconds"], current["seconds"],
+                 current["seconds"] / previous["seconds"])
+            )
+        if (
+            current["peak_kb"] > previous["peak_kb"] * (1 + threshold)
+            and current["peak_kb"] - previous["peak_kb"] > NOISE_KB
+        ):
+            regressions.append(
+                (key, "peak_kb", previous["peak_kb"], current["peak_kb"],
+                 current["peak_kb"] / previous["peak_kb"])
+            )
+    return regressions
+
+
+def print_table(results, baseline=None):
+    """以表格列出每個項目的耗時與配置，有基準時附上與基準的比例"""
+    print(f"{'項目':<58} {'耗時(µs)':>10} {'峰值(KB)':>10} {'保留(KB)':>10} {'比基準':>7}")
+    for key, current in results.items():
+        ratio = ""
+        if baseline and key in baseline and baseline[key]["seconds"]:
+            ratio = f"{current['seconds'] / baseline[key]['seconds']:.2f}x"
+        print(
+            f"{key:<60} {current['seconds'] * 1e6:>12.1f} {current['peak_kb']:>12.1f} "
+            f"{current['retained_kb']:>12.1f} {ratio:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測 HTML 解析函數的耗時與記憶體配置")
+    parser.add_argument("--backend", nargs="+", choices=["bs4", "lxml"], default=["bs4", "lxml"])
+    parser.add_argument("--repeat", type=int, default=5, help="每個項目重複量測的次數")
+    parser.add_argument(
+        "--corpus", default=DEFAULT_CORPUS, help="樣本目錄（預設 benchmarks/corpus），依 manifest.json 解析"
+    )
+    parser.add_argument("--archive", help="額外加入 HtmlArchive 封存中每家公司最新的頁面")
+    parser.add_argument(
+        "--export-corpus", metavar="DIR", help="將 --archive 封存中的頁面匯出到樣本目錄後結束"
+    )
+    parser.add_argument("--no-mock", action="store_true", help="不加入模擬網站產生的頁面")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基準檔路徑")
+    parser.add_argument("--save-baseline", action="store_true", help="將本次結果存為基準")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="超過基準多少比例視為退步（預設 0.25）"
+    )
+    parser.add_argument("--filter", help="只量測名稱包含此字串的樣本")
+    args = parser.parse_args(argv)
+
+    if args.export_corpus:
+        if not args.archive:
+            parser.error("--export-corpus 需要同時指定 --archive")
+        exported = export_corpus(args.archive, args.export_corpus)
+        print(f"已將 {exported} 個頁面匯出到 {args.export_corpus}")
+        return 0
+
+    corpus = build_corpus(args.corpus, args.archive, generated=not args.no_mock)
+    if args.filter:
+        corpus = [sample for sample in corpus if args.filter in sample[0]]
+    results = run(corpus, backends=args.backend, repeat=args.repeat)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                        "beautifulsoup4": bs4.__version__,
+                        "lxml": ".".join(map(str, lxml.etree.LXML_VERSION)),
+                    },
+                    "results": results,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"\n已將基準存到 {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"\n找不到基準 {args.baseline}，以 --save-baseline 建立")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"\n沒有超過基準 {args.threshold:.0%} 的退步")
+        return 0
+    print(f"\n{len(regressions)} 個項目超過基準 {args.threshold:.0%}:")
+    for key, metric, previous, current, ratio in regressions:
+        print(f"  {key} {metric}: {previous:.6g} -> {current:.6g} ({ratio:.2f}x)")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
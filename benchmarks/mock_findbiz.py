@@ -0,0 +1,456 @@
+"""
+商工登記公示資料查詢網站的本機模擬伺服器，供離線量測爬蟲效能使用
+
+提供查詢首頁（queryInit.do）、搜尋結果、詳細資料頁（queryCmpyDetail.do）與各頁籤的換頁請求，
+可設定回應延遲、錯誤比例與查無資料比例。公司資料依統一編號產生，同一個統一編號每次回應相同；
+指定 --archive 時優先使用 HtmlArchive 封存的真實詳細資料頁。
+
+    python benchmarks/mock_findbiz.py --port 8800 --latency 0.2 --error-rate 0.01
+    FINDBIZ_BASE_URL=http://127.0.0.1:8800 python scrape_and_print.py
+"""
+
+import argparse
+import html
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+QUERY_INIT_PATH = "/fts/query/QueryBar/queryInit.do"
+SEARCH_PATH = "/fts/query/QueryList/queryList.do"
+DETAIL_PATH = "/fts/query/QueryCmpyDetail/queryCmpyDetail.do"
+PAGE_PATH = "/fts/query/QueryCmpyDetail/queryCmpyDetailPage.do"
+STATS_PATH = "/__stats"
+
+# 頁籤代號、容器 id、標題與表格欄位
+TABS = {
+    "shareholder": (
+        "tabShareHolder",
+        "tabShareHolderContent",
+        "董監事資料",
+        ["序號", "職稱", "姓名", "所代表法人", "持有股份數(股)"],
+    ),
+    "manager": ("tabMgr", "tabMgrContent", "經理人資料", ["序號", "姓名", "到職日期"]),
+    "branch": (
+        "tabBrCmpy",
+        "tabBrCmpyContent",
+        "分公司資料",
+        ["序號", "統一編號", "分公司名稱", "登記現況", "分公司核准設立日期", "最後核准變更日期"],
+    ),
+    "factory": (
+        "tabFactory",
+        "tabFactoryContent",
+        "工廠資料",
+        ["序號", "登記編號", "工廠名稱", "登記現況", "工廠登記核准日期", "最後核准變更日期"],
+    ),
+}
+
+_INIT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>商工登記公示資料查詢服務</title></head><body>
+<div id="agreeBox"><p>使用本服務前請先同意使用條款</p>
+<button id="agree" type="button"
+ onclick="document.getElementById('agreeBox').style.display='none';">同意</button></div>
+<form id="qryForm" method="post" action="{search_path}">
+<input id="qryCond" name="qryCond" type="text">
+<button id="qryBtn" type="submit">查詢</button>
+</form></body></html>"""
+
+_PAGE_SCRIPT = """<script>
+function showTab(id) {{
+    var panes = document.querySelectorAll('.tab-pane');
+    for (var i = 0; i < panes.length; i++) {{
+        panes[i].style.display = panes[i].id === id ? 'block' : 'none';
+    }}
+}}
+function gotoPage(tab, containerId, page) {{
+    var xhr = new XMLHttpRequest();
+    xhr.open('POST', '{page_path}');
+    xhr.setRequestHeader('Content-Type', 'application/x-www-form-urlencoded');
+    xhr.onload = function () {{
+        if (xhr.status === 200) {{
+            document.querySelector('#' + containerId + ' .table-responsive').outerHTML =
+                xhr.responseText;
+        }}
+    }};
+    xhr.send('banNo={ban_no}&tab=' + tab + '&pageNo=' + page);
+}}
+function gotoPageFact(page) {{
+    gotoPage('factory', 'tabFactoryContent', page);
+}}
+function showPrint() {{
+    document.getElementById('printArea').style.display = 'block';
+}}
+</script>"""
+
+
+def roc_date(rng):
+    """產生民國年格式的日期字串"""
+    return f"{rng.randint(60, 113):03d}年{rng.randint(1, 12):02d}月{rng.randint(1, 28):02d}日"
+
+
+class MockCompanies:
+    """
+    依統一編號產生固定的模擬公司資料
+
+    同一個統一編號永遠產生相同的資料，部分公司設定為大型企業，
+    擁有大量分公司與工廠，用來觀察多頁頁籤的處理成本。
+    """
+
+    def __init__(
+        self,
+        not_found_rate=0.0,
+        large_rate=0.02,
+        large_branches=500,
+        large_factories=60,
+        seed=0,
+    ):
+        """
+        Args:
+            not_found_rate: 查無資料的統一編號比例
+            large_rate: 大型企業的比例
+            large_branches: 大型企業的分公司數
+            large_factories: 大型企業的工廠數
+            seed: 隨機種子，相同種子產生相同的資料
+        """
+        self.not_found_rate = not_found_rate
+        self.large_rate = large_rate
+        self.large_branches = large_branches
+        self.large_factories = large_factories
+        self.seed = seed
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, ban_no):
+        """
+        Returns:
+            dict 或 None: 公司資料，查無此公司時為 None
+        """
+        with self._lock:
+            if ban_no not in self._cache:
+                self._cache[ban_no] = self._generate(ban_no)
+            return self._cache[ban_no]
+
+    def _generate(self, ban_no):
+        if not ban_no.isdigit():
+            return None
+        rng = random.Random(f"{self.seed}:{ban_no}")
+        if rng.random() < self.not_found_rate:
+            return None
+        large = rng.random() < self.large_rate
+        name = f"模擬{ban_no}股份有限公司"
+        branch_count = self.large_branches if large else rng.choice([0, 0, 0, 1, 2, 3])
+        factory_count = self.large_factories if large else rng.choice([0, 0, 1, 2])
+        return {
+            "name": name,
+            "base": [
+                ("統一編號", ban_no),
+                ("登記現況", "核准設立"),
+                ("公司名稱", name),
+                ("資本總額(元)", f"{rng.randint(1, 10000) * 100000:,}"),
+                ("代表人姓名", f"代表人{ban_no[-3:]}"),
+                ("公司所在地", f"臺北市中正區模擬路{rng.randint(1, 300)}號"),
+                ("登記機關", "臺北市政府"),
+                ("核准設立日期", roc_date(rng)),
+                ("最後核准變更日期", roc_date(rng)),
+            ],
+            "shareholder": [
+                [f"{i:04d}", rng.choice(["董事長", "董事", "監察人"]), f"董監事{i}", "",
+                 f"{rng.randint(1, 10 ** 6):,}"]
+                for i in range(1, rng.randint(3, 9) + 1)
+            ],
+            "manager": [
+                [f"{i:04d}", f"經理人{i}", roc_date(rng)]
+                for i in range(1, rng.randint(0, 4) + 1)
+            ],
+            "branch": [
+                [str(i), f"{rng.randint(0, 10 ** 8 - 1):08d}", f"{name}第{i}分公司", "核准設立",
+                 roc_date(rng), roc_date(rng)]
+                for i in range(1, branch_count + 1)
+            ],
+            "factory": [
+                [str(i), f"99{rng.randint(0, 10 ** 6 - 1):06d}", f"第{i}廠", "生產中",
+                 roc_date(rng), roc_date(rng)]
+                for i in range(1, factory_count + 1)
+            ],
+        }
+
+
+def render_table(kind, rows, page, page_size):
+    """產生頁籤的 .table-responsive 區塊（換頁請求也回傳同樣的區塊）"""
+    _, container_id, _, headers = TABS[kind]
+    pages = max(1, -(-len(rows) // page_size))
+    page = min(max(page, 1), pages)
+    parts = ['<div class="table-responsive"><table class="table table-striped"><thead><tr>']
+    parts.extend(f"<th>{header}</th>" for header in headers)
+    parts.append("</tr></thead><tbody>")
+    if not rows:
+        parts.append(f'<tr><td colspan="{len(headers)}">查無符合結果</td></tr>')
+    for row in rows[(page - 1) * page_size : page * page_size]:
+        cells = [html.escape(value) for value in row]
+        if kind == "factory":
+            cells[2] = f'<a href="#">{cells[2]}</a>'
+        parts.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+    if pages > 1:
+        parts.append(
+            f'<tr><td colspan="{len(headers)}">共{len(rows)}筆、分{pages}頁</td></tr>'
+        )
+    parts.append("</tbody></table>")
+    if pages > 1:
+        # 與網站相同，只列出目前頁附近的頁碼
+        first = max(1, page - 4)
+        parts.append('<ul class="pagination">')
+        for number in range(first, min(pages, first + 9) + 1):
+            css = ' class="active"' if number == page else ""
+            parts.append(
+                f'<li{css}><a href="#" onclick="gotoPage(\'{kind}\', \'{container_id}\', '
+                f'{number}); return false;">{number}</a></li>'
+            )
+        parts.append("</ul>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def render_search(ban_no, company):
+    """產生搜尋結果頁"""
+    if company is None:
+        body = '<div id="vParagraph"><div class="alert alert-warning">查無符合條件資料</div></div>'
+    else:
+        detail_url = f"{DETAIL_PATH}?banNo={ban_no}"
+        body = (
+            '<div id="vParagraph"><div class="panel panel-default">'
+            f'<div class="panel-heading"><a href="{detail_url}">{html.escape(company["name"])}</a></div>'
+            f'<div style="padding: 5px 10px;">統一編號:{ban_no},登記機關:臺北市政府,'
+            "登記現況:核准設立,資料種類:公司</div>"
+            f"<span class=\"moreLinkMouseOut\" onclick=\"location.href='{detail_url}'\">詳細資料</span>"
+            "</div></div>"
+        )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>查詢結果</title></head>'
+        f"<body>{body}</body></html>"
+    )
+
+
+def render_detail(ban_no, company, page_size):
+    """產生詳細資料頁，所有頁籤的第一頁都在同一份 HTML 中"""
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>公司基本資料</title>',
+        _PAGE_SCRIPT.format(page_path=PAGE_PATH, ban_no=ban_no),
+        '</head><body><ul class="nav nav-tabs">',
+        '<li><a id="tabCmpy" href="#" onclick="showTab(\'tabCmpyContent\'); return false;">'
+        "公司基本資料</a></li>",
+    ]
+    for tab_id, container_id, title, _ in TABS.values():
+        parts.append(
+            f'<li><a id="{tab_id}" href="#" onclick="showTab(\'{container_id}\'); '
+            f'return false;">{title}</a></li>'
+        )
+    parts.append(
+        '</ul><a id="friendlyPrint" href="#" onclick="showPrint(); return false;">友善列印</a>'
+    )
+    parts.append(
+        '<div id="tabCmpyContent" class="tab-pane"><table class="table table-striped"><tbody>'
+    )
+    for key, value in company["base"]:
+        parts.append(f"<tr><td>{key}</td><td>{html.escape(value)}</td></tr>")
+    parts.append("</tbody></table></div>")
+    for kind, (_, container_id, _, _) in TABS.items():
+        parts.append(f'<div id="{container_id}" class="tab-pane" style="display:none">')
+        if kind == "shareholder":
+            parts.append("<div>最近一次登載日期：113年06月04日</div>")
+        parts.append(render_table(kind, company[kind], 1, page_size))
+        parts.append("</div>")
+    parts.append(
+        f'<div id="printArea" style="display:none"><h1>{html.escape(company["name"])}</h1></div>'
+    )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+class RecordedPages:
+    """從 HtmlArchive 封存中取得真實的詳細資料頁"""
+
+    def __init__(self, archive_dir):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from scrape_and_print import HtmlArchive
+
+        self.archive = HtmlArchive(archive_dir)
+
+    def detail(self, ban_no):
+        """
+        Returns:
+            str 或 None: 以 HTTP 快速路徑封存的完整詳細資料頁
+        """
+        for entry in reversed(self.archive.entries(ban_no)):
+            if entry.get("source") != "http":
+                continue
+            for page in entry["pages"]:
+                if page["kind"] == "detail":
+                    return self.archive.get(page["sha256"], page["codec"])
+        return None
+
+
+def make_server(
+    host="127.0.0.1",
+    port=8800,
+    latency=0.0,
+    jitter=0.0,
+    error_rate=0.0,
+    slow_rate=0.0,
+    slow_latency=30.0,
+    page_size=10,
+    companies=None,
+    recorded=None,
+    seed=0,
+):
+    """
+    建立模擬伺服器（尚未開始服務，呼叫 serve_forever() 開始）
+
+    Args:
+        host: 監聽的位址
+        port: 監聽的連接埠，0 表示由系統指定
+        latency: 每個回應的平均延遲秒數
+        jitter: 延遲的標準差
+        error_rate: 回應 HTTP 503 的比例
+        slow_rate: 回應特別慢的比例，用來模擬網站壅塞
+        slow_latency: 特別慢的回應的延遲秒數
+        page_size: 各頁籤每頁筆數
+        companies: MockCompanies，預設為不含查無資料的公司
+        recorded: 可選的 RecordedPages
+        seed: 延遲與錯誤注入的隨機種子
+
+    Returns:
+        ThreadingHTTPServer: server.stats 為各路徑的請求數與錯誤數
+    """
+    companies = companies or MockCompanies()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": {}, "errors": 0, "slow": 0}
+    stats_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def _handle(self):
+            parts = urlsplit(self.path)
+            params = parse_qs(parts.query)
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                params.update(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+            if parts.path == STATS_PATH:
+                with stats_lock:
+                    self._send(200, json.dumps(stats), "application/json")
+                return
+
+            with stats_lock:
+                stats["requests"][parts.path] = stats["requests"].get(parts.path, 0) + 1
+            with rng_lock:
+                delay = max(0.0, rng.gauss(latency, jitter)) if jitter else latency
+                roll = rng.random()
+            if roll < slow_rate:
+                delay = slow_latency
+                with stats_lock:
+                    stats["slow"] += 1
+            if delay:
+                time.sleep(delay)
+            if slow_rate <= roll < slow_rate + error_rate:
+                with stats_lock:
+                    stats["errors"] += 1
+                self._send(503, "<html><body>系統忙碌中，請稍後再試</body></html>")
+                return
+
+            ban_no = (params.get("banNo") or params.get("qryCond") or [""])[0].strip()
+            if parts.path == QUERY_INIT_PATH:
+                self._send(200, _INIT_PAGE.format(search_path=SEARCH_PATH))
+            elif parts.path == SEARCH_PATH:
+                self._send(200, render_search(ban_no, companies.get(ban_no)))
+            elif parts.path == DETAIL_PATH:
+                body = recorded.detail(ban_no) if recorded is not None else None
+                company = companies.get(ban_no)
+                if body is None and company is None:
+                    self._send(404, "<html><body>查無資料</body></html>")
+                else:
+                    self._send(200, body or render_detail(ban_no, company, page_size))
+            elif parts.path == PAGE_PATH:
+                company = companies.get(ban_no)
+                kind = (params.get("tab") or [""])[0]
+                if company is None or kind not in TABS:
+                    self._send(404, "")
+                else:
+                    page = int((params.get("pageNo") or ["1"])[0])
+                    self._send(200, render_table(kind, company[kind], page, page_size))
+            else:
+                self._send(404, "<html><body>Not Found</body></html>")
+
+        def _send(self, status, body, content_type="text/html"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.stats = stats
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="商工登記公示資料查詢網站的本機模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽的位址")
+    parser.add_argument("--port", type=int, default=8800, help="監聽的連接埠")
+    parser.add_argument("--latency", type=float, default=0.0, help="每個回應的平均延遲秒數")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延遲的標準差")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回應 HTTP 503 的比例")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="特別慢的回應比例")
+    parser.add_argument("--slow-latency", type=float, default=30.0, help="特別慢的回應延遲秒數")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="查無資料的統一編號比例")
+    parser.add_argument("--large-rate", type=float, default=0.02, help="大型企業的比例")
+    parser.add_argument("--page-size", type=int, default=10, help="各頁籤每頁筆數")
+    parser.add_argument("--archive", help="HtmlArchive 封存目錄，有封存的統一編號回應真實頁面")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = make_server(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        page_size=args.page_size,
+        companies=MockCompanies(
+            not_found_rate=args.not_found_rate, large_rate=args.large_rate, seed=args.seed
+        ),
+        recorded=RecordedPages(args.archive) if args.archive else None,
+        seed=args.seed,
+    )
+    host, port = server.server_address[:2]
+    logging.info(f"模擬網站已啟動: http://{host}:{port}{QUERY_INIT_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
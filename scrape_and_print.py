@@ -3,17 +3,54 @@ import logging
 import time
 import re
 import base64
+import cProfile
+import io
+import csv
+import gzip
+import hashlib
+import json
+import itertools
+import queue
+import socket
+import sys
+import threading
+import tracemalloc
+import multiprocessing
+import pstats
+import zlib
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import psycopg2
+import requests
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+from requests.adapters import HTTPAdapter
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from urllib3.util.retry import Retry
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import (
+    TimeoutException,
+    NoSuchElementException,
+    WebDriverException,
+)
 from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup
+import lxml.html
+import numpy as np
+from lxml import etree
 from sqlalchemy import create_engine, text
-from datetime import datetime
+from datetime import date, datetime
+
+try:
+    import zstandard
+except ImportError:  # 未安裝 zstandard 時 HTML 封存改用 gzip 壓縮
+    zstandard = None
 
 DB_CONFIG = {
     "dbname": os.environ.get("POSTGRES_DB", "company_data"),
@@ -31,6 +68,45 @@ default_url = (
 DATABASE_URL = os.getenv("DATABASE_URL", default_url)
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 
+# 商工登記公示資料查詢網址，可改指向本機的模擬網站（見 benchmarks/mock_findbiz.py）
+BASE_URL = os.environ.get("FINDBIZ_BASE_URL", "https://findbiz.nat.gov.tw").rstrip("/")
+QUERY_INIT_URL = f"{BASE_URL}/fts/query/QueryBar/queryInit.do"
+DETAIL_URL_TEMPLATE = BASE_URL + "/fts/query/QueryCmpyDetail/queryCmpyDetail.do?banNo={}"
+
+# 所有查詢執行緒合計對網站的請求速率上限（每秒請求數）
+DEFAULT_REQUESTS_PER_SECOND = float(os.environ.get("FINDBIZ_REQUESTS_PER_SECOND", "1"))
+
+# 不需要重新查詢的查詢結果：成功取得資料，或網站確定沒有此公司
+FINAL_OUTCOMES = {"成功", "查無符合資料", "統一編號格式錯誤"}
+
+# 批次統計報告的失敗清單最多保留的統一編號數，超過的只計數
+MAX_REPORTED_FAILURES = int(os.environ.get("FINDBIZ_REPORT_MAX_FAILURES", "10000"))
+
+# 批次查詢進度檔，設為空字串時不記錄進度
+CHECKPOINT_PATH = os.environ.get(
+    "FINDBIZ_CHECKPOINT", os.path.join("downloads", "checkpoint.jsonl")
+)
+
+# 原始 HTML 封存目錄，設為空字串時不封存
+ARCHIVE_DIR = os.environ.get("FINDBIZ_ARCHIVE_DIR", os.path.join("downloads", "archive"))
+
+# 提供 /metrics 統計資料的連接埠，0 表示不啟動
+METRICS_PORT = int(os.environ.get("FINDBIZ_METRICS_PORT", "0"))
+
+# 是否依網站的回應狀況自動調整同時查詢數與請求速率（workers 與請求速率成為上限）
+ADAPTIVE_CONCURRENCY = os.environ.get("FINDBIZ_ADAPTIVE", "0") != "0"
+
+# 查無符合資料的統一編號在多少天內不再查詢，0 表示不使用快取
+NOT_FOUND_TTL_DAYS = float(os.environ.get("FINDBIZ_NOT_FOUND_TTL_DAYS", "30"))
+
+# 以 cProfile 與 tracemalloc 剖析的統一編號（逗號分隔）與抽樣比例，皆未設定時不剖析
+PROFILE_IDS = os.environ.get("FINDBIZ_PROFILE_IDS", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("FINDBIZ_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("FINDBIZ_PROFILE_DIR", os.path.join("downloads", "profiles"))
+
+# 網站顯示查無資料的訊息元素
+NOT_FOUND_LOCATOR = (By.XPATH, "//div[contains(text(), '查無') or contains(text(), '無此統一編號')]")
+
 
 # 設定日誌記錄
 logging.basicConfig(
@@ -94,6 +170,971 @@ def setup_driver():
             raise
 
 
+class DriverPool:
+    """
+    WebDriver 連線池，讓多次查詢共用已啟動的 Chrome，避免每家公司都重新啟動瀏覽器
+
+    借出前會做健康檢查，已當掉的 driver 會被關閉並重新建立；
+    歸還時會清除 cookies 與瀏覽器儲存空間，並回到查詢首頁，避免前一家公司的狀態殘留。
+    """
+
+    def __init__(self, size=1, max_uses=200, rate_limiter=None):
+        """
+        Args:
+            size: 池中最多同時存在的 driver 數量
+            max_uses: 單一 driver 最多使用次數，超過後回收重建，避免 Chrome 記憶體持續增長
+            rate_limiter: 可選的 RateLimiter，重置 driver 時回到查詢首頁也計入請求速率
+        """
+        self.size = size
+        self.max_uses = max_uses
+        self.rate_limiter = rate_limiter
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """
+        借出一個可用的 driver，池內沒有閒置的 driver 且未達上限時建立新的
+
+        Args:
+            timeout: 等待其他使用者歸還 driver 的最長秒數，None 表示一直等待
+
+        Returns:
+            WebDriver 實例
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._closed:
+                raise RuntimeError("WebDriver 連線池已關閉")
+
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = None
+
+            if driver is None:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        driver = setup_driver()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    self._uses[id(driver)] = 0
+                    logging.info(f"WebDriver 連線池建立新的 driver ({self._created}/{self.size})")
+                    return self._checkout(driver)
+
+                # 短暫等待後重新檢查，期間若有 driver 被關閉即可改為建立新的
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutException("等待可用的 WebDriver 超時")
+                try:
+                    driver = self._idle.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+            if self._is_healthy(driver):
+                return self._checkout(driver)
+
+            logging.warning("WebDriver 健康檢查失敗，關閉並重新建立")
+            self._discard(driver)
+
+    def release(self, driver, reusable=True):
+        """
+        歸還 driver，清除狀態後放回池中；無法重用時直接關閉
+
+        Args:
+            driver: 由 acquire() 借出的 WebDriver 實例
+            reusable: 呼叫端認為 driver 已不可用時傳入 False
+        """
+        if driver is None:
+            return
+
+        if (
+            self._closed
+            or not reusable
+            or self._uses.get(id(driver), 0) >= self.max_uses
+            or not self._reset(driver, self.rate_limiter)
+        ):
+            self._discard(driver)
+            return
+
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """以 with 語法借用 driver，離開區塊時自動歸還"""
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """關閉池中所有閒置的 driver，之後歸還的 driver 也會直接關閉"""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+    def _checkout(self, driver):
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        return driver
+
+    def _discard(self, driver):
+        self._uses.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"關閉 WebDriver 時發生錯誤: {e}")
+
+    @staticmethod
+    def _is_healthy(driver):
+        """確認瀏覽器行程與 WebDriver session 仍可回應"""
+        try:
+            driver.execute_script("return document.readyState")
+            return True
+        except WebDriverException:
+            return False
+
+    @staticmethod
+    def _reset(driver, rate_limiter=None):
+        """清除 cookies 與網頁儲存空間，並回到查詢首頁"""
+        try:
+            driver.delete_all_cookies()
+            driver.execute_script(
+                "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+            )
+            throttle(rate_limiter)
+            driver.get(QUERY_INIT_URL)
+            return True
+        except WebDriverException as e:
+            logging.warning(f"重置 WebDriver 狀態失敗: {e}")
+            return False
+
+
+class RateLimiter:
+    """
+    執行緒安全的令牌桶限速器，控制所有查詢執行緒對網站發出的總請求速率
+
+    每秒補充 rate 個令牌，最多累積 capacity 個；每次對網站發出請求前需取得一個令牌。
+    rate 為 0 或負數時不限速，只累計請求數。
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate: 每秒允許的請求數，0 表示不限速
+            capacity: 令牌桶容量，即允許的瞬間突發請求數
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # 累計發出的請求數，供請求預算使用
+        self.requests = 0
+
+    def acquire(self, tokens=1):
+        """阻塞直到取得指定數量的令牌"""
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    self.requests += tokens
+                    return
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.requests += tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def set_rate(self, rate):
+        """調整每秒允許的請求數（0 表示不限速），已累積的令牌依原本的速率計算"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed_tokens = (now - self._updated) * self.rate if self.rate > 0 else self.capacity
+            self._tokens = min(self.capacity, self._tokens + elapsed_tokens)
+            self._updated = now
+            self.rate = float(rate)
+
+
+def throttle(rate_limiter):
+    """對網站發出請求前呼叫，未設定限速器時不做任何事"""
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+
+
+# 表示網站過載或無法正常回應的查詢結果
+CONGESTION_OUTCOMES = {
+    "查詢超時，無結果",
+    "無法找到輸入欄位",
+    "無法找到查詢按鈕",
+    "無法獲取詳細資料",
+    "無法獲取資料",
+    "發生錯誤",
+}
+
+# 網站正常回應的查詢結果
+RESPONSIVE_OUTCOMES = {"成功", "查無符合資料", "僅獲取基本資訊"}
+
+# 以頁面載入時間判斷網站回應速度的階段，這些階段都在取得限速器令牌後才開始計時，
+# 否則速率調低後在限速器中排隊的時間會被當成頁面變慢而再次減速
+LATENCY_STAGES = ("search", "detail_page", "http_detail")
+
+
+def is_congestion_status(status):
+    """
+    判斷 http_errors 的 status 標籤是否代表網站過載
+
+    5xx 與 429 代表過載，連線失敗或逾時以例外類別名稱記錄，同樣視為過載；
+    404 等其他狀態碼是針對單一統一編號的回應，與網站負載無關。
+    """
+    if not status or not status.isdigit():
+        return True
+    code = int(status)
+    return code == 429 or code >= 500
+
+
+class AimdController:
+    """
+    以加法增加、乘法減少（AIMD）調整同時查詢的公司數與請求速率
+
+    每完成一輪（與目前同時查詢數相同家數）網站正常回應的查詢，同時查詢數加 1、請求速率加 rate_step；
+    出現查詢逾時、錯誤頁面、HTTP 5xx 或 429，或頁面載入時間超過近期基準的 latency_factor 倍時，
+    兩者都乘上 decrease。
+    減少後 cooldown 秒內不再因其他訊號減少，避免同一次壅塞中陸續失敗的查詢讓速率一路降到最低。
+
+    訊號來自 metrics：以 metrics.add_listener(controller) 註冊後，查詢流程記錄的頁面載入時間、
+    查詢結果與 HTTP 錯誤都會通知控制器。查詢執行緒在查詢前後呼叫 acquire() 與 release()。
+    """
+
+    def __init__(
+        self,
+        rate_limiter,
+        max_concurrency,
+        max_rate,
+        min_rate=None,
+        initial_concurrency=1,
+        initial_rate=None,
+        rate_step=None,
+        decrease=0.5,
+        latency_factor=3.0,
+        min_latency=2.0,
+        cooldown=10.0,
+    ):
+        """
+        Args:
+            rate_limiter: 要調整速率的 RateLimiter
+            max_concurrency: 同時查詢數上限（通常為 workers）
+            max_rate: 請求速率上限（每秒請求數）
+            min_rate: 請求速率下限，預設為上限的 1/20
+            initial_concurrency: 起始的同時查詢數
+            initial_rate: 起始的請求速率，預設為上限的一半
+            rate_step: 每輪增加的請求速率，預設為上限的 1/10
+            decrease: 壅塞時同時查詢數與請求速率乘上的比例
+            latency_factor: 頁面載入時間超過基準多少倍視為壅塞
+            min_latency: 頁面載入時間低於此秒數時不視為壅塞
+            cooldown: 減少後多少秒內不再減少
+        """
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.max_rate = float(max_rate)
+        self.min_rate = self.max_rate / 20 if min_rate is None else float(min_rate)
+        self.rate_step = self.max_rate / 10 if rate_step is None else float(rate_step)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_latency = min_latency
+        self.cooldown = cooldown
+        self.concurrency = float(min(max(initial_concurrency, 1), self.max_concurrency))
+        self.rate = self.max_rate / 2 if initial_rate is None else float(initial_rate)
+        self.rate = min(max(self.rate, self.min_rate), self.max_rate)
+        self.baseline_latency = None
+        self.increases = 0
+        self.decreases = 0
+        self._active = 0
+        self._successes = 0
+        self._hold_until = 0.0
+        self._condition = threading.Condition()
+        rate_limiter.set_rate(self.rate)
+
+    @property
+    def limit(self):
+        """目前允許同時查詢的公司數"""
+        return int(self.concurrency)
+
+    def acquire(self):
+        """阻塞直到同時查詢數低於目前的上限"""
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        """一家公司查詢結束"""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def on_observe(self, stage, seconds):
+        if stage not in LATENCY_STAGES:
+            return
+        with self._condition:
+            if self.baseline_latency is None:
+                self.baseline_latency = seconds
+                return
+            threshold = max(self.min_latency, self.baseline_latency * self.latency_factor)
+            if seconds <= threshold:
+                # 只以正常的樣本更新基準，壅塞時的延遲不會把基準一起拉高
+                self.baseline_latency = 0.9 * self.baseline_latency + 0.1 * seconds
+                return
+            self._backoff(f"{stage} 耗時 {seconds:.1f} 秒，基準 {self.baseline_latency:.1f} 秒")
+
+    def on_count(self, name, value, labels):
+        if name == "http_errors":
+            if not is_congestion_status(labels.get("status")):
+                return
+            with self._condition:
+                self._backoff(f"HTTP 錯誤 {labels.get('status')}")
+        elif name == "outcomes":
+            outcome = labels.get("outcome")
+            with self._condition:
+                if outcome in CONGESTION_OUTCOMES:
+                    self._backoff(outcome)
+                elif outcome in RESPONSIVE_OUTCOMES:
+                    self._grow(value)
+
+    def _grow(self, completed):
+        self._successes += completed
+        if self._successes < self.limit:
+            return
+        self._successes = 0
+        concurrency = min(self.concurrency + 1, self.max_concurrency)
+        rate = min(self.rate + self.rate_step, self.max_rate)
+        if concurrency == self.concurrency and rate == self.rate:
+            return
+        self.increases += 1
+        self._apply(concurrency, rate)
+        logging.debug(f"網站回應正常，同時查詢數調整為 {self.limit}，請求速率 {self.rate:.2f}/秒")
+
+    def _backoff(self, reason):
+        now = time.monotonic()
+        self._successes = 0
+        if now < self._hold_until:
+            return
+        self._hold_until = now + self.cooldown
+        self.decreases += 1
+        self._apply(
+            max(self.concurrency * self.decrease, 1.0),
+            max(self.rate * self.decrease, self.min_rate),
+        )
+        logging.warning(
+            f"網站可能過載（{reason}），同時查詢數降為 {self.limit}，請求速率降為 {self.rate:.2f}/秒"
+        )
+
+    def _apply(self, concurrency, rate):
+        self.concurrency = concurrency
+        if rate != self.rate:
+            self.rate = rate
+            self.rate_limiter.set_rate(rate)
+        self._condition.notify_all()
+
+    def summary(self):
+        """目前的調整狀態"""
+        with self._condition:
+            return {
+                "同時查詢數": self.limit,
+                "請求速率": round(self.rate, 3),
+                "頁面載入基準(秒)": (
+                    round(self.baseline_latency, 3) if self.baseline_latency is not None else None
+                ),
+                "增加次數": self.increases,
+                "減少次數": self.decreases,
+            }
+
+
+# 回傳頁面是否仍在載入中：document 尚未載入完成，或 jQuery 仍有未完成的 AJAX 請求
+_AJAX_BUSY_SCRIPT = """
+return document.readyState !== 'complete'
+    || (typeof window.jQuery !== 'undefined' && window.jQuery.active > 0);
+"""
+
+# 回傳表格的簡易特徵 [列數, 文字長度, 第一列資料]，找不到表格時回傳 null
+_TABLE_SIGNATURE_SCRIPT = """
+var table = document.querySelector(arguments[0]);
+if (!table) { return null; }
+var firstRow = table.tBodies.length && table.tBodies[0].rows.length
+    ? table.tBodies[0].rows[0].textContent : '';
+return [table.rows.length, (table.textContent || '').length, firstRow];
+"""
+
+
+class AdaptiveWaiter:
+    """
+    以條件取代固定秒數等待的等待引擎
+
+    每個階段（例如搜尋結果、各頁籤表格）會記錄實際等待時間，
+    逾時上限依該階段近期觀察到的延遲調整：頁面很快就緒時立即返回，
+    網站變慢時則自動給予更長的等待時間。
+    """
+
+    def __init__(
+        self,
+        default_timeout=20,
+        min_timeout=5,
+        max_timeout=60,
+        poll_interval=0.1,
+        settle_time=0.3,
+        history=50,
+    ):
+        """
+        Args:
+            default_timeout: 樣本不足時使用的逾時秒數
+            min_timeout: 學習後逾時秒數的下限
+            max_timeout: 學習後逾時秒數的上限
+            poll_interval: 檢查條件的間隔秒數
+            settle_time: 表格內容需維持不變多少秒才視為載入完成
+            history: 每個階段保留的最近延遲樣本數
+        """
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.history = history
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def timeout_for(self, stage):
+        """依近期延遲的 p95 計算該階段的逾時秒數"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < 5:
+            return self.default_timeout
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return min(self.max_timeout, max(self.min_timeout, p95 * 3))
+
+    def record(self, stage, seconds):
+        """記錄某階段的一次等待時間"""
+        with self._lock:
+            samples = self._samples.setdefault(stage, [])
+            samples.append(seconds)
+            if len(samples) > self.history:
+                del samples[0]
+
+    def wait(self, driver, stage, condition, record_timeout=True):
+        """
+        等待條件成立，並記錄該階段的等待時間
+
+        Args:
+            driver: WebDriver 實例
+            stage: 階段名稱，用來區分各階段的延遲統計
+            condition: 接受 driver 的 callable，回傳真值代表條件成立
+            record_timeout: 逾時時是否將逾時秒數計入樣本（可有可無的元素應傳入 False）
+
+        Returns:
+            condition 的回傳值
+
+        Raises:
+            TimeoutException: 超過該階段的逾時秒數條件仍未成立
+        """
+        timeout = self.timeout_for(stage)
+        start = time.monotonic()
+        try:
+            result = WebDriverWait(
+                driver, timeout, poll_frequency=self.poll_interval
+            ).until(condition)
+        except TimeoutException:
+            if record_timeout:
+                self.record(stage, timeout)
+            raise
+        self.record(stage, time.monotonic() - start)
+        return result
+
+    @staticmethod
+    def ajax_idle(driver):
+        """頁面載入完成且沒有進行中的 AJAX 請求"""
+        return not driver.execute_script(_AJAX_BUSY_SCRIPT)
+
+    def element_ready(self, locator):
+        """元素已出現且頁面沒有進行中的 AJAX 請求"""
+        presence = EC.presence_of_element_located(locator)
+
+        def condition(driver):
+            element = presence(driver)
+            return element if element and self.ajax_idle(driver) else False
+
+        return condition
+
+    def table_stable(self, selector, previous=None):
+        """
+        表格已出現、沒有進行中的 AJAX 請求，且列數與內容在 settle_time 內不再變動
+
+        Args:
+            selector: 表格的 CSS 選擇器
+            previous: 先前取得的表格特徵，提供時需等到表格內容與其不同（用於換頁）
+        """
+        state = {"signature": None, "since": 0.0}
+
+        def condition(driver):
+            signature = driver.execute_script(_TABLE_SIGNATURE_SCRIPT, selector)
+            if not signature or signature == previous or not self.ajax_idle(driver):
+                state["signature"] = None
+                return False
+            now = time.monotonic()
+            if signature != state["signature"]:
+                state["signature"] = signature
+                state["since"] = now
+                return False
+            return signature if now - state["since"] >= self.settle_time else False
+
+        return condition
+
+
+# 所有查詢執行緒共用的等待引擎，讓各階段的延遲統計可以跨公司累積
+wait_engine = AdaptiveWaiter()
+
+
+# 各階段耗時直方圖的上界（秒）
+METRIC_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _bucket_quantile(bounds, counts, total, q):
+    """以直方圖各區間內線性內插估計分位數（同 Prometheus 的 histogram_quantile）"""
+    if not total:
+        return None
+    rank = q * total
+    lower = 0.0
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    # 落在最後一個區間之外時只能回報上界
+    return bounds[-1]
+
+
+class Metrics:
+    """
+    記錄查詢流程各階段耗時的直方圖與查詢結果的計數器（執行緒安全）
+
+    可輸出為 Prometheus 文字格式或 JSON 快照，用來觀察各階段的尾端延遲與整體吞吐量。
+    """
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        """
+        Args:
+            buckets: 直方圖各區間的上界（秒），由小到大
+        """
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        註冊在每次記錄時通知的物件
+
+        Args:
+            listener: 提供 on_observe(stage, seconds) 與 on_count(name, value, labels) 的物件
+        """
+        with self._lock:
+            self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+        """取消註冊 add_listener 加入的物件"""
+        with self._lock:
+            self._listeners = [item for item in self._listeners if item is not listener]
+
+    def observe(self, stage, seconds):
+        """記錄某階段的一次耗時"""
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets)
+        )
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "max": 0.0,
+                }
+            histogram["counts"][index] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+            listeners = self._listeners
+        for listener in listeners:
+            listener.on_observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """以 with 語法記錄區塊的耗時，區塊拋出例外時同樣記錄"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def count(self, name, value=1, **labels):
+        """
+        增加計數器
+
+        Args:
+            name: 計數器名稱，例如 outcomes
+            value: 增加的數量
+            labels: 計數器的標籤，例如 outcome="成功"
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            listeners = self._listeners
+        for listener in listeners:
+            listener.on_count(name, value, labels)
+
+    def reset(self):
+        """清除所有已記錄的資料"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        產生目前的統計快照
+
+        Returns:
+            dict: stages 為各階段的次數、總耗時、最大值與估計的 p50/p95/p99，
+                counters 為各計數器依標籤分組的數值
+        """
+        with self._lock:
+            histograms = {
+                stage: (list(h["counts"]), h["sum"], h["max"])
+                for stage, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+            started = self.started
+
+        bounds = self.buckets + (float("inf"),)
+        stages = {}
+        for stage, (counts, total_seconds, max_seconds) in sorted(histograms.items()):
+            total = sum(counts)
+            stats = {
+                "count": total,
+                "sum": round(total_seconds, 3),
+                "mean": round(total_seconds / total, 3) if total else None,
+                "max": round(max_seconds, 3),
+            }
+            for label, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                value = _bucket_quantile(bounds, counts, total, q)
+                stats[label] = round(min(value, max_seconds), 3) if value is not None else None
+            stats["buckets"] = dict(zip([str(b) for b in self.buckets] + ["+Inf"], counts))
+            stages[stage] = stats
+
+        counter_groups = {}
+        for (name, labels), value in sorted(counters.items()):
+            label_text = ",".join(f"{k}={v}" for k, v in labels) or "total"
+            counter_groups.setdefault(name, {})[label_text] = value
+
+        elapsed = time.time() - started
+        return {
+            "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "elapsed_seconds": round(elapsed, 1),
+            "stages": stages,
+            "counters": counter_groups,
+        }
+
+    def prometheus_text(self):
+        """輸出 Prometheus 文字格式（text/plain; version=0.0.4）"""
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+        with self._lock:
+            histograms = {
+                stage: (list(h["counts"]), h["sum"]) for stage, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP findbiz_stage_duration_seconds 查詢流程各階段的耗時",
+            "# TYPE findbiz_stage_duration_seconds histogram",
+        ]
+        for stage, (counts, total_seconds) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+                cumulative += count
+                lines.append(
+                    f'findbiz_stage_duration_seconds_bucket{{stage="{escape(stage)}",le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'findbiz_stage_duration_seconds_sum{{stage="{escape(stage)}"}} {total_seconds}'
+            )
+            lines.append(
+                f'findbiz_stage_duration_seconds_count{{stage="{escape(stage)}"}} {cumulative}'
+            )
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE findbiz_{name}_total counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name != name:
+                    continue
+                label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+                lines.append(
+                    f"findbiz_{name}_total{{{label_text}}} {value}"
+                    if label_text
+                    else f"findbiz_{name}_total {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory):
+        """
+        將 JSON 快照與 Prometheus 文字格式寫入 directory 下的 metrics.json 與 metrics.prom
+
+        Returns:
+            tuple: (JSON 檔路徑, Prometheus 檔路徑)
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = (os.path.join(directory, "metrics.json"), os.path.join(directory, "metrics.prom"))
+        contents = (
+            json.dumps(self.snapshot(), ensure_ascii=False, indent=2),
+            self.prometheus_text(),
+        )
+        for path, content in zip(paths, contents):
+            tmp_path = f"{path}.part"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return paths
+
+    def log_summary(self):
+        """將各階段的次數與 p50/p95/p99 寫入日誌"""
+        snapshot = self.snapshot()
+        for stage, stats in snapshot["stages"].items():
+            logging.info(
+                f"  階段 {stage}: {stats['count']} 次，p50 {stats['p50']} 秒，"
+                f"p95 {stats['p95']} 秒，p99 {stats['p99']} 秒，最長 {stats['max']} 秒"
+            )
+
+
+# 所有查詢執行緒共用的統計資料
+metrics = Metrics()
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=None):
+    """
+    在背景執行緒提供 /metrics（Prometheus 文字格式）與 /metrics.json
+
+    Args:
+        port: 監聽的連接埠
+        host: 監聽的位址
+        registry: 要輸出的 Metrics，預設為模組共用的 metrics
+
+    Returns:
+        ThreadingHTTPServer: 呼叫 shutdown() 停止服務
+    """
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = registry.prometheus_text().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(registry.snapshot(), ensure_ascii=False).encode("utf-8")
+                content_type = "application/json; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"統計資料服務已啟動: http://{host}:{port}/metrics")
+    return server
+
+
+class Profiler:
+    """
+    以 cProfile 與 tracemalloc 剖析指定或抽樣的統一編號的整個查詢過程
+
+    每家被剖析的公司在輸出目錄產生 <統一編號>-<時間>.prof（可用 pstats 或 snakeviz 開啟）
+    與 <統一編號>-<時間>.alloc.txt（配置增加最多的程式位置與累計耗時最多的函數）。
+    沒有指定統一編號且抽樣比例為 0 時不做任何事，可以在正式環境保持啟用。
+
+    cProfile 只記錄執行查詢的執行緒；tracemalloc 是整個行程共用的，
+    並行查詢時配置報告也會包含同一時間其他執行緒的配置。
+    """
+
+    def __init__(self, registration_numbers=None, sample_rate=None, output_dir=None, top=30):
+        """
+        Args:
+            registration_numbers: 一定要剖析的統一編號，預設依環境變數 FINDBIZ_PROFILE_IDS
+            sample_rate: 其餘統一編號中被剖析的比例（0 到 1），
+                預設依環境變數 FINDBIZ_PROFILE_SAMPLE_RATE
+            output_dir: 輸出目錄，預設依環境變數 FINDBIZ_PROFILE_DIR
+            top: 報告中列出的項目數
+        """
+        if registration_numbers is None:
+            registration_numbers = PROFILE_IDS.split(",")
+        self.registration_numbers = {
+            number.strip() for number in registration_numbers if number.strip()
+        }
+        self.sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.output_dir = output_dir or PROFILE_DIR
+        self.top = top
+        self.enabled = bool(self.registration_numbers) or self.sample_rate > 0
+        self._lock = threading.Lock()
+        self._active = 0
+        self._started_tracemalloc = False
+
+    def wants(self, registration_number):
+        """是否剖析此統一編號"""
+        if not self.enabled:
+            return False
+        if registration_number in self.registration_numbers:
+            return True
+        # 依統一編號的雜湊抽樣，重新執行時剖析的是同一批公司
+        return zlib.crc32(registration_number.encode("utf-8")) < self.sample_rate * 2**32
+
+    def profile(self, registration_number):
+        """
+        剖析一次查詢的 context manager，不需剖析時回傳不做任何事的 nullcontext
+
+        Args:
+            registration_number: 統一編號
+        """
+        if not self.wants(registration_number):
+            return nullcontext()
+        return self._profile(registration_number)
+
+    @contextmanager
+    def _profile(self, registration_number):
+        with self._lock:
+            # 已由其他程式啟動的 tracemalloc 不由這裡停止
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._active += 1
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        started_at = datetime.now()
+        start = time.monotonic()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.monotonic() - start
+            after = tracemalloc.take_snapshot()
+            traced = tracemalloc.get_traced_memory()
+            with self._lock:
+                self._active -= 1
+                if self._active == 0 and self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+            try:
+                self._write(registration_number, started_at, elapsed, profile, before, after, traced)
+            except Exception as e:
+                logging.warning(f"無法寫入統一編號 {registration_number} 的剖析結果: {e}")
+
+    def _write(self, registration_number, started_at, elapsed, profile, before, after, traced):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 同一秒內在不同執行緒剖析同一家公司時檔名不能重複，因此加上微秒與執行緒名稱
+        prefix = os.path.join(
+            self.output_dir,
+            f"{registration_number}-{started_at.strftime('%Y%m%dT%H%M%S%f')}"
+            f"-{threading.current_thread().name}",
+        )
+        profile.dump_stats(f"{prefix}.prof")
+
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        differences = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        current, peak = traced
+        lines = [
+            f"統一編號 {registration_number} 剖析於 {started_at.isoformat(timespec='seconds')}，"
+            f"耗時 {elapsed:.2f} 秒",
+            f"tracemalloc 目前追蹤 {current / 1024:.1f} KB，追蹤期間峰值 {peak / 1024:.1f} KB",
+            "",
+            f"配置增加最多的 {self.top} 個程式位置:",
+        ]
+        for stat in differences[: self.top]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"  {stat.size_diff / 1024:+10.1f} KB {stat.count_diff:+8d} 個區塊  "
+                f"{frame.filename}:{frame.lineno}"
+            )
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(self.top)
+        lines.extend(["", f"累計耗時最多的 {self.top} 個函數:", stream.getvalue()])
+        with open(f"{prefix}.alloc.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        logging.info(f"統一編號 {registration_number} 的剖析結果已寫入 {prefix}.prof")
+
+
+# 未指定 profiler 時查詢使用的剖析設定（依環境變數，預設停用）
+default_profiler = Profiler()
+
+
+def table_signature(driver, selector):
+    """取得表格目前的特徵，用於換頁後判斷表格內容是否已更新"""
+    return driver.execute_script(_TABLE_SIGNATURE_SCRIPT, selector)
+
+
+# 一次取得多個容器的 outerHTML，找不到的容器回傳 null
+_FRAGMENTS_SCRIPT = """
+var result = {};
+for (var i = 0; i < arguments[0].length; i++) {
+    var el = document.getElementById(arguments[0][i]);
+    result[arguments[0][i]] = el ? el.outerHTML : null;
+}
+return result;
+"""
+
+# 是否只從瀏覽器取回各頁籤容器的 HTML，而非整份 page_source
+USE_FRAGMENTS = os.environ.get("FINDBIZ_FRAGMENT_MODE", "1") != "0"
+
+
+def fetch_fragments(driver, container_ids):
+    """
+    以單次 WebDriver 指令取得多個容器的 outerHTML
+
+    Args:
+        driver: WebDriver 實例
+        container_ids: 容器元素的 id 列表
+
+    Returns:
+        dict: id 對應 outerHTML，找不到的容器為空字串
+    """
+    fragments = driver.execute_script(_FRAGMENTS_SCRIPT, list(container_ids)) or {}
+    return {cid: fragments.get(cid) or "" for cid in container_ids}
+
+
 def create_output_directory(subdirectory=""):
     """
     創建輸出目錄，設置為當前工作目錄中的 downloads 資料夾
@@ -140,16 +1181,16 @@ def print_friendly_to_pdf(driver, output_filename):
         logging.info("找到友善列印按鈕，準備點擊")
         driver.execute_script("arguments[0].click();", friendly_print_btn)
 
-        # 等待"友善列印"視圖加載完成
-        time.sleep(5)  # 給予足夠時間加載列印視圖
-
-        # 檢查是否有列印視圖元素出現，確認列印視圖已加載
+        # 等待"友善列印"視圖加載完成，確認列印視圖元素出現且頁面已無進行中的請求
         try:
-            WebDriverWait(driver, 10).until(
-                EC.visibility_of_element_located((By.ID, "printArea"))
+            visible = EC.visibility_of_element_located((By.ID, "printArea"))
+            wait_engine.wait(
+                driver,
+                "print_view",
+                lambda d: visible(d) and wait_engine.ajax_idle(d),
             )
             logging.info("列印視圖已加載")
-        except:
+        except TimeoutException:
             logging.warning("無法確認列印視圖是否已加載，但仍將繼續")
 
         # 使用Chrome的列印功能將當前頁面保存為PDF
@@ -171,12 +1212,8 @@ def print_friendly_to_pdf(driver, output_filename):
             "pageRanges": "",  # 留空表示列印所有頁面
         }
 
-        # 執行列印命令
-        result = driver.execute_cdp_cmd("Page.printToPDF", print_options)
-
-        # 將Base64編碼的PDF數據寫入檔案
-        with open(output_filename, "wb") as f:
-            f.write(base64.b64decode(result["data"]))
+        # 執行列印命令，以串流方式取回PDF並分段寫入檔案
+        write_pdf_stream(driver, print_options, output_filename)
 
         logging.info(f"PDF已成功保存到: {output_filename}")
         return True
@@ -186,6 +1223,296 @@ def print_friendly_to_pdf(driver, output_filename):
         return False
 
 
+# 每次以 IO.read 取回的 PDF 資料大小
+PDF_STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def write_pdf_stream(driver, print_options, output_filename):
+    """
+    以 Page.printToPDF 的 ReturnAsStream 模式產生PDF，透過 IO.read 分段取回並寫入檔案，
+    避免大型PDF在記憶體中形成完整的 Base64 字串
+
+    先寫入暫存檔，完成後才改名為 output_filename，中途失敗不會留下不完整的PDF。
+    """
+    result = driver.execute_cdp_cmd(
+        "Page.printToPDF", {**print_options, "transferMode": "ReturnAsStream"}
+    )
+    tmp_filename = f"{output_filename}.part"
+    try:
+        with open(tmp_filename, "wb") as f:
+            # 不支援串流的舊版 Chrome 仍會直接回傳完整資料
+            if "stream" not in result:
+                f.write(base64.b64decode(result["data"]))
+            else:
+                handle = result["stream"]
+                try:
+                    while True:
+                        chunk = driver.execute_cdp_cmd(
+                            "IO.read", {"handle": handle, "size": PDF_STREAM_CHUNK_SIZE}
+                        )
+                        data = chunk.get("data", "")
+                        if chunk.get("base64Encoded"):
+                            f.write(base64.b64decode(data))
+                        else:
+                            f.write(data.encode("latin-1"))
+                        if chunk.get("eof"):
+                            break
+                finally:
+                    driver.execute_cdp_cmd("IO.close", {"handle": handle})
+        os.replace(tmp_filename, output_filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def company_fingerprint(company_data):
+    """
+    以詳細資料頁的內容計算公司資料指紋，資料未變更時友善列印的內容也不會改變
+
+    Returns:
+        str: sha256 十六進位字串
+    """
+    content = {"詳細基本資料": company_data.get("詳細基本資料", {})}
+    for name, _, _, _ in DETAIL_TABS:
+        content[name] = company_data.get(name, [])
+    serialized = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class PdfStore:
+    """
+    PDF 保存區：記錄每家公司目前 PDF 對應的資料指紋，資料未變更時不需重新產生；
+    資料變更而重新產生時，舊版本壓縮保存
+
+    目錄結構（root 預設為 downloads）:
+        company_<統一編號>_complete.pdf            目前版本
+        pdf_versions/<統一編號>/manifest.json     指紋、大小、產生耗時與各舊版本紀錄
+        pdf_versions/<統一編號>/<時間>-<指紋>.pdf.zst（或 .pdf.gz）
+    """
+
+    def __init__(self, root=None, keep_versions=5, codec=None):
+        """
+        Args:
+            root: PDF 輸出目錄，預設為 create_output_directory()
+            keep_versions: 每家公司最多保留的舊版本數
+            codec: 舊版本的壓縮方式 "zst" 或 "gz"，預設在已安裝 zstandard 時使用 zst
+        """
+        self.root = root or create_output_directory()
+        self.keep_versions = keep_versions
+        self.codec = codec or default_codec()
+        self._lock = threading.Lock()
+
+    def pdf_path(self, registration_number):
+        return os.path.join(self.root, f"company_{registration_number}_complete.pdf")
+
+    def staging_path(self, registration_number):
+        """產生中的 PDF 先寫在這裡，commit() 後才取代目前版本"""
+        return f"{self.pdf_path(registration_number)}.new"
+
+    def _version_dir(self, registration_number):
+        return os.path.join(self.root, "pdf_versions", registration_number)
+
+    def _manifest_path(self, registration_number):
+        return os.path.join(self._version_dir(registration_number), "manifest.json")
+
+    def manifest(self, registration_number):
+        """讀取某家公司的 PDF 紀錄，沒有時回傳空的紀錄"""
+        path = self._manifest_path(registration_number)
+        if not os.path.exists(path):
+            return {"current": None, "versions": []}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, registration_number, manifest):
+        path = self._manifest_path(registration_number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def is_current(self, registration_number, fingerprint):
+        """目前的 PDF 是否由相同指紋的資料產生"""
+        with self._lock:
+            current = self.manifest(registration_number)["current"]
+        return (
+            current is not None
+            and current["fingerprint"] == fingerprint
+            and os.path.exists(self.pdf_path(registration_number))
+        )
+
+    def commit(self, registration_number, fingerprint, staged_path, render_seconds):
+        """
+        以新產生的 PDF 取代目前版本，目前版本壓縮後移到 pdf_versions
+
+        Returns:
+            str: 目前版本的 PDF 路徑
+        """
+        with open(staged_path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        entry = {
+            "fingerprint": fingerprint,
+            "sha256": sha256,
+            "size": os.path.getsize(staged_path),
+            "render_seconds": round(render_seconds, 2),
+            "rendered_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        pdf_path = self.pdf_path(registration_number)
+
+        with self._lock:
+            manifest = self.manifest(registration_number)
+            previous = manifest["current"]
+            if previous is not None and os.path.exists(pdf_path):
+                if previous["sha256"] != sha256:
+                    manifest["versions"].append(
+                        self._keep_version(registration_number, previous, pdf_path)
+                    )
+                    self._prune(registration_number, manifest)
+
+            os.replace(staged_path, pdf_path)
+            manifest["current"] = entry
+            self._write_manifest(registration_number, manifest)
+        return pdf_path
+
+    def _keep_version(self, registration_number, entry, pdf_path):
+        """壓縮保存目前版本，回傳舊版本紀錄"""
+        timestamp = entry["rendered_at"].replace(":", "").replace("-", "")
+        filename = f"{timestamp}-{entry['fingerprint'][:12]}.pdf.{self.codec}"
+        path = os.path.join(self._version_dir(registration_number), filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(pdf_path, "rb") as f:
+            compressed = compress_bytes(f.read(), self.codec)
+        with open(path, "wb") as f:
+            f.write(compressed)
+        return {**entry, "file": filename, "compressed_size": len(compressed)}
+
+    def _prune(self, registration_number, manifest):
+        """只保留最新的 keep_versions 個舊版本"""
+        while len(manifest["versions"]) > self.keep_versions:
+            oldest = manifest["versions"].pop(0)
+            path = os.path.join(self._version_dir(registration_number), oldest["file"])
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class PdfRenderQueue:
+    """
+    背景PDF產生佇列，使用獨立的 WebDriver 連線池與並行數量，不佔用擷取資料的瀏覽器
+
+    查詢執行緒只需將統一編號放入佇列；佇列已滿時 submit() 會等待，
+    使PDF產生跟不上時擷取速度自然降下來。
+    """
+
+    _STOP = object()
+
+    def __init__(self, workers=1, rate_limiter=None, max_queue=None, store=None, on_error=None):
+        """
+        Args:
+            workers: 同時產生PDF的瀏覽器數量
+            rate_limiter: 可選的 RateLimiter，與資料擷取共用以控制對網站的總請求速率
+            max_queue: 佇列上限，預設為 workers 的 10 倍
+            store: 可選的 PdfStore，預設保存在 downloads 目錄
+            on_error: 可選的 callable(registration_number, error)，PDF 產生失敗時呼叫
+        """
+        self.workers = workers
+        self.rate_limiter = rate_limiter
+        self.store = store or PdfStore()
+        self.on_error = on_error
+        self.driver_pool = DriverPool(size=workers, rate_limiter=rate_limiter)
+        self.rendered = {}
+        self.errors = {}
+        self.unchanged = 0
+        self._queue = queue.Queue(maxsize=max_queue or workers * 10)
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"pdf-render-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, registration_number, fingerprint=None):
+        """
+        將一家公司排入PDF產生佇列，佇列已滿時等待
+
+        Args:
+            registration_number: 統一編號
+            fingerprint: company_fingerprint() 計算的資料指紋，與目前 PDF 相同時不重新產生
+        """
+        if fingerprint is not None and self.store.is_current(registration_number, fingerprint):
+            logging.info(f"統一編號 {registration_number} 的資料未變更，沿用既有PDF")
+            with self._lock:
+                self.unchanged += 1
+            return
+        self._queue.put((registration_number, fingerprint))
+        logging.info(f"統一編號 {registration_number} 已排入PDF產生佇列")
+
+    def close(self):
+        """產生佇列中剩餘的PDF後停止背景執行緒並關閉瀏覽器"""
+        for _ in self._threads:
+            self._queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+        self.driver_pool.close()
+        logging.info(
+            f"PDF產生階段結束: 成功 {len(self.rendered)} 家，失敗 {len(self.errors)} 家，"
+            f"資料未變更 {self.unchanged} 家"
+        )
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            registration_number, fingerprint = item
+            try:
+                self._render(registration_number, fingerprint)
+            except Exception as e:
+                logging.error(f"產生統一編號 {registration_number} 的PDF時發生錯誤: {e}")
+                with self._lock:
+                    self.errors[registration_number] = str(e)
+                if self.on_error is not None:
+                    try:
+                        self.on_error(registration_number, str(e))
+                    except Exception as callback_error:
+                        logging.error(f"處理PDF產生失敗通知時發生錯誤: {callback_error}")
+
+    def _render(self, registration_number, fingerprint):
+        staged_path = self.store.staging_path(registration_number)
+        driver = self.driver_pool.acquire()
+        if not driver:
+            raise RuntimeError("無法設置 WebDriver")
+        reusable = True
+        try:
+            # 連線池中的 driver 已清除 cookie，需與查詢相同先經過搜尋取得網站的查詢狀態，
+            # 等待公司基本資料表格載入後再開啟友善列印
+            failure = _search_company(driver, registration_number, self.rate_limiter)
+            if failure is not None:
+                raise RuntimeError(failure["查詢結果"])
+            _open_detail_link(driver, registration_number, self.rate_limiter)
+            wait_engine.wait(
+                driver, "detail_page", wait_engine.table_stable("#tabCmpyContent table.table")
+            )
+            throttle(self.rate_limiter)
+            start = time.monotonic()
+            with metrics.timer("pdf_render"):
+                pdf_result = print_friendly_to_pdf(driver, staged_path)
+            if not pdf_result:
+                raise RuntimeError("生成PDF失敗")
+            pdf_path = self.store.commit(
+                registration_number, fingerprint, staged_path, time.monotonic() - start
+            )
+            with self._lock:
+                self.rendered[registration_number] = pdf_path
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            # 瀏覽器層級的錯誤代表 driver 可能已損壞，不放回連線池
+            reusable = False
+            raise
+        finally:
+            self.driver_pool.release(driver, reusable=reusable)
+
+
 
 
 def init_database():
@@ -299,255 +1626,681 @@ def init_database():
             )
 
         logging.info("資料庫表已成功創建或已存在")
+
+        run_migrations()
         return True
 
     except Exception as e:
         logging.error(f"初始化資料庫失敗: {e}")
         return False
 
-def save_to_database(company_data, registration_number):
-    """
-    用 SQLAlchemy Engine 將公司資料寫入或更新到 PostgreSQL 資料庫。
 
-    Args:
-        company_data: dict，包含 keys:
-            '基本資料', '詳細基本資料',
-            '董監事資料', '經理人資料', '分公司資料', '工廠資料'
-        registration_number: str，8 位統一編號
-        pdf_path: str or None，若使用「友善列印」生成 PDF 的檔案路徑
-    """
-    try:
-        with engine.begin() as conn:
-            # 1. 準備公司基本資料
-            basic_info = company_data.get("基本資料", {})
-            detailed_info = company_data.get("詳細基本資料", {})
-            company_info = {**basic_info, **detailed_info}
+# 資料庫結構遷移：(版本, 說明, SQL 指令列表)，依版本順序套用，已套用的版本記錄在 schema_migrations
+MIGRATIONS = [
+    (
+        1,
+        "子表 company_id 索引",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_directors_company_id ON directors (company_id)",
+            "CREATE INDEX IF NOT EXISTS idx_managers_company_id ON managers (company_id)",
+            "CREATE INDEX IF NOT EXISTS idx_branch_companies_company_id "
+            "ON branch_companies (company_id)",
+            "CREATE INDEX IF NOT EXISTS idx_factories_company_id ON factories (company_id)",
+        ],
+    ),
+    (
+        2,
+        "民國日期欄位改為 DATE",
+        [
+            # 將「民國112年03月01日」、「112年03月01日」、「1120301」、「112/03/01」轉為 DATE
+            r"""
+            CREATE OR REPLACE FUNCTION roc_to_date(value TEXT) RETURNS DATE
+            LANGUAGE plpgsql IMMUTABLE AS $$
+            DECLARE
+                parts TEXT[];
+            BEGIN
+                IF value IS NULL OR btrim(value) = '' THEN
+                    RETURN NULL;
+                END IF;
+                parts := regexp_match(value, '(\d{2,3})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日');
+                IF parts IS NULL THEN
+                    parts := regexp_match(value, '^\s*(\d{2,3})(\d{2})(\d{2})\s*$');
+                END IF;
+                IF parts IS NULL THEN
+                    parts := regexp_match(value, '(\d{2,3})[/.-](\d{1,2})[/.-](\d{1,2})');
+                END IF;
+                IF parts IS NULL THEN
+                    RETURN NULL;
+                END IF;
+                RETURN make_date(parts[1]::INT + 1911, parts[2]::INT, parts[3]::INT);
+            EXCEPTION WHEN OTHERS THEN
+                RETURN NULL;
+            END
+            $$
+            """,
+            """
+            ALTER TABLE companies
+                ALTER COLUMN approval_date TYPE DATE USING roc_to_date(approval_date),
+                ALTER COLUMN last_change_date TYPE DATE USING roc_to_date(last_change_date)
+            """,
+            """
+            ALTER TABLE managers
+                ALTER COLUMN appointment_date TYPE DATE USING roc_to_date(appointment_date)
+            """,
+            """
+            ALTER TABLE branch_companies
+                ALTER COLUMN approval_date TYPE DATE USING roc_to_date(approval_date),
+                ALTER COLUMN last_change_date TYPE DATE USING roc_to_date(last_change_date)
+            """,
+            """
+            ALTER TABLE factories
+                ALTER COLUMN approval_date TYPE DATE USING roc_to_date(approval_date),
+                ALTER COLUMN last_change_date TYPE DATE USING roc_to_date(last_change_date)
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_companies_last_change_date "
+            "ON companies (last_change_date)",
+        ],
+    ),
+    (
+        3,
+        "登記現況與登記機關正規化",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS registration_statuses (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(50) UNIQUE NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS registration_authorities (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) UNIQUE NOT NULL
+            )
+            """,
+            r"""
+            INSERT INTO registration_statuses (name)
+            SELECT DISTINCT regexp_replace(btrim(registration_status), '\s+', '', 'g')
+              FROM companies
+             WHERE btrim(coalesce(registration_status, '')) <> ''
+            ON CONFLICT (name) DO NOTHING
+            """,
+            r"""
+            INSERT INTO registration_authorities (name)
+            SELECT DISTINCT regexp_replace(btrim(registration_authority), '\s+', '', 'g')
+              FROM companies
+             WHERE btrim(coalesce(registration_authority, '')) <> ''
+            ON CONFLICT (name) DO NOTHING
+            """,
+            """
+            ALTER TABLE companies
+                ADD COLUMN registration_status_id INTEGER REFERENCES registration_statuses(id),
+                ADD COLUMN registration_authority_id INTEGER
+                    REFERENCES registration_authorities(id)
+            """,
+            r"""
+            UPDATE companies c
+               SET registration_status_id = s.id
+              FROM registration_statuses s
+             WHERE s.name = regexp_replace(btrim(c.registration_status), '\s+', '', 'g')
+            """,
+            r"""
+            UPDATE companies c
+               SET registration_authority_id = a.id
+              FROM registration_authorities a
+             WHERE a.name = regexp_replace(btrim(c.registration_authority), '\s+', '', 'g')
+            """,
+            """
+            ALTER TABLE companies
+                DROP COLUMN registration_status,
+                DROP COLUMN registration_authority
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_companies_registration_status_id "
+            "ON companies (registration_status_id)",
+            # 提供與原本 companies 表相同欄位名稱的檢視表，方便查詢
+            """
+            CREATE OR REPLACE VIEW company_overview AS
+            SELECT c.*,
+                   s.name AS registration_status,
+                   a.name AS registration_authority
+              FROM companies c
+              LEFT JOIN registration_statuses s ON s.id = c.registration_status_id
+              LEFT JOIN registration_authorities a ON a.id = c.registration_authority_id
+            """,
+        ],
+    ),
+    (
+        4,
+        "多節點共用的查詢工作佇列",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS scrape_jobs (
+                id BIGSERIAL PRIMARY KEY,
+                registration_number VARCHAR(8) UNIQUE NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                worker_id TEXT,
+                lease_expires_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_scrape_jobs_claim "
+            "ON scrape_jobs (priority DESC, id) WHERE status IN ('pending', 'running')",
+            "CREATE INDEX IF NOT EXISTS idx_scrape_jobs_worker "
+            "ON scrape_jobs (worker_id) WHERE status = 'running'",
+        ],
+    ),
+    (
+        5,
+        "查無符合資料的統一編號快取",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS not_found_cache (
+                registration_number VARCHAR(8) PRIMARY KEY,
+                checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                hits INTEGER NOT NULL DEFAULT 1
+            )
+            """,
+        ],
+    ),
+]
 
-            # 清理並組裝要寫入 companies 的欄位
-            company_values = {
-                "registration_number": registration_number,
-                "company_name": company_info.get("公司名稱", ""),
-                "registration_authority": company_info.get("登記機關", ""),
-                "registration_status": company_info.get("登記現況", ""),
-                "address": company_info.get("公司所在地", ""),
-                "data_type": company_info.get("資料種類", ""),
-                "approval_date": company_info.get("核准設立日期", ""),
-                "last_change_date": company_info.get("最後核准變更日期", ""),
-                "capital_amount": company_info.get("資本總額(元)", "").replace(",", "")
-                or None,
-                "paid_in_capital": company_info.get("實收資本額(元)", "").replace(
-                    ",", ""
-                )
-                or None,
-                "share_value": company_info.get("每股金額(元)", "") or None,
-                "issued_shares": company_info.get("已發行股份總數(股)", "").replace(
-                    ",", ""
-                )
-                or None,
-                "representative": company_info.get("代表人姓名", ""),
-                "foreign_company_name": company_info.get("章程所訂外文公司名稱", ""),
-                "special_shares_status": company_info.get("複數表決權特別股", ""),
-                "veto_shares_status": company_info.get(
-                    "對於特定事項具否決權特別股", ""
-                ),
-                "business_items": company_info.get("所營事業資料", "").replace(
-                    "\n", " "
-                ),
-            }
+# 避免多個爬蟲節點同時執行遷移的 advisory lock 鍵值
+_MIGRATION_LOCK_KEY = 7_205_001
+
+
+def run_migrations():
+    """
+    依序套用尚未套用的資料庫結構遷移，每個版本在獨立的 transaction 中執行
 
-            # 2. Upsert companies
-            result = conn.execute(
-                text("SELECT id FROM companies WHERE registration_number = :no"),
-                {"no": registration_number},
+    Returns:
+        list: 本次套用的版本號
+    """
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-            row = result.first()
-
-            if row:
-                company_id = row.id
-                # update
-                conn.execute(
-                    text(
-                        """
-                    UPDATE companies
-                       SET company_name = :company_name,
-                           registration_authority = :registration_authority,
-                           registration_status = :registration_status,
-                           address = :address,
-                           data_type = :data_type,
-                           approval_date = :approval_date,
-                           last_change_date = :last_change_date,
-                           capital_amount = :capital_amount,
-                           paid_in_capital = :paid_in_capital,
-                           share_value = :share_value,
-                           issued_shares = :issued_shares,
-                           representative = :representative,
-                           foreign_company_name = :foreign_company_name,
-                           special_shares_status = :special_shares_status,
-                           veto_shares_status = :veto_shares_status,
-                           business_items = :business_items,
-                           updated_at = CURRENT_TIMESTAMP
-                     WHERE id = :id
-                """
-                    ),
-                    {**company_values, "id": company_id},
-                )
-            else:
-                # insert
-                result = conn.execute(
-                    text(
-                        """
-                    INSERT INTO companies (
-                        registration_number, company_name, registration_authority,
-                        registration_status, address, data_type,
-                        approval_date, last_change_date, capital_amount,
-                        paid_in_capital, share_value, issued_shares,
-                        representative, foreign_company_name,
-                        special_shares_status, veto_shares_status, business_items
-                    ) VALUES (
-                        :registration_number, :company_name, :registration_authority,
-                        :registration_status, :address, :data_type,
-                        :approval_date, :last_change_date, :capital_amount,
-                        :paid_in_capital, :share_value, :issued_shares,
-                        :representative, :foreign_company_name,
-                        :special_shares_status, :veto_shares_status, :business_items
-                    ) RETURNING id
-                """
-                    ),
-                    company_values,
-                )
-                company_id = result.scalar()
+            """
+        )
 
-            # 3. 董監事（directors）
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        with engine.begin() as conn:
             conn.execute(
-                text("DELETE FROM directors WHERE company_id = :cid"),
-                {"cid": company_id},
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY}
             )
-            directors = company_data.get("董監事資料", [])
-            # 任期資訊
-            tenure = next((d["任期資訊"] for d in directors if "任期資訊" in d), "")
-            directors = [d for d in directors if "任期資訊" not in d]
-            for d in directors:
-                dv = {
-                    "company_id": company_id,
-                    "sequence_number": d.get("序號"),
-                    "position": d.get("職稱"),
-                    "name": d.get("姓名"),
-                    "representing_entity": d.get("所代表法人"),
-                    "shares_held": d.get("持有股份數(股)", "").replace(",", "") or None,
-                    "tenure_info": tenure,
-                }
-                conn.execute(
-                    text(
-                        """
-                    INSERT INTO directors (
-                        company_id, sequence_number, position, name,
-                        representing_entity, shares_held, tenure_info
-                    ) VALUES (
-                        :company_id, :sequence_number, :position, :name,
-                        :representing_entity, :shares_held, :tenure_info
-                    )
-                """
-                    ),
-                    dv,
-                )
+            exists = conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+                {"version": version},
+            ).first()
+            if exists:
+                continue
 
-            # 4. 經理人（managers）
+            logging.info(f"套用資料庫遷移 {version}: {description}")
+            for statement in statements:
+                conn.exec_driver_sql(statement)
             conn.execute(
-                text("DELETE FROM managers WHERE company_id = :cid"),
-                {"cid": company_id},
+                text(
+                    "INSERT INTO schema_migrations (version, description) "
+                    "VALUES (:version, :description)"
+                ),
+                {"version": version, "description": description},
             )
-            for m in company_data.get("經理人資料", []):
-                mv = {
-                    "company_id": company_id,
-                    "sequence_number": m.get("序號"),
-                    "name": m.get("姓名"),
-                    "appointment_date": m.get("到職日期"),
-                }
-                conn.execute(
-                    text(
-                        """
-                    INSERT INTO managers (
-                        company_id, sequence_number, name, appointment_date
-                    ) VALUES (
-                        :company_id, :sequence_number, :name, :appointment_date
-                    )
-                """
-                    ),
-                    mv,
-                )
+            applied.append(version)
 
-            # 5. 分公司（branch_companies）
-            conn.execute(
-                text("DELETE FROM branch_companies WHERE company_id = :cid"),
-                {"cid": company_id},
+    return applied
+
+
+# 以統一編號為衝突鍵寫入或更新公司資料，並回傳公司 id
+_UPSERT_COMPANY_SQL = text(
+    """
+    INSERT INTO companies (
+        registration_number, company_name, registration_authority_id,
+        registration_status_id, address, data_type,
+        approval_date, last_change_date, capital_amount,
+        paid_in_capital, share_value, issued_shares,
+        representative, foreign_company_name,
+        special_shares_status, veto_shares_status, business_items
+    ) VALUES (
+        :registration_number, :company_name, :registration_authority_id,
+        :registration_status_id, :address, :data_type,
+        :approval_date, :last_change_date, :capital_amount,
+        :paid_in_capital, :share_value, :issued_shares,
+        :representative, :foreign_company_name,
+        :special_shares_status, :veto_shares_status, :business_items
+    )
+    ON CONFLICT (registration_number) DO UPDATE
+       SET company_name = EXCLUDED.company_name,
+           registration_authority_id = EXCLUDED.registration_authority_id,
+           registration_status_id = EXCLUDED.registration_status_id,
+           address = EXCLUDED.address,
+           data_type = EXCLUDED.data_type,
+           approval_date = EXCLUDED.approval_date,
+           last_change_date = EXCLUDED.last_change_date,
+           capital_amount = EXCLUDED.capital_amount,
+           paid_in_capital = EXCLUDED.paid_in_capital,
+           share_value = EXCLUDED.share_value,
+           issued_shares = EXCLUDED.issued_shares,
+           representative = EXCLUDED.representative,
+           foreign_company_name = EXCLUDED.foreign_company_name,
+           special_shares_status = EXCLUDED.special_shares_status,
+           veto_shares_status = EXCLUDED.veto_shares_status,
+           business_items = EXCLUDED.business_items,
+           updated_at = CURRENT_TIMESTAMP
+    RETURNING id
+"""
+)
+
+# 一次送出刪除該公司所有子表資料的指令
+_DELETE_CHILDREN_SQL = """
+    DELETE FROM directors WHERE company_id = %(cid)s;
+    DELETE FROM managers WHERE company_id = %(cid)s;
+    DELETE FROM branch_companies WHERE company_id = %(cid)s;
+    DELETE FROM factories WHERE company_id = %(cid)s;
+"""
+
+# 公司資料寫入後，從查無資料快取中移除該統一編號
+_FORGET_NOT_FOUND_SQL = "DELETE FROM not_found_cache WHERE registration_number = %(rn)s"
+
+# 子表的多列 INSERT，VALUES %s 由 execute_values 展開
+_CHILD_INSERT_SQL = {
+    "directors": """
+        INSERT INTO directors (
+            company_id, sequence_number, position, name,
+            representing_entity, shares_held, tenure_info
+        ) VALUES %s
+    """,
+    "managers": """
+        INSERT INTO managers (
+            company_id, sequence_number, name, appointment_date
+        ) VALUES %s
+    """,
+    "branch_companies": """
+        INSERT INTO branch_companies (
+            company_id, sequence_number, registration_number,
+            branch_name, registration_status,
+            approval_date, last_change_date
+        ) VALUES %s
+    """,
+    "factories": """
+        INSERT INTO factories (
+            company_id, sequence_number, registration_number,
+            factory_name, registration_status,
+            approval_date, last_change_date
+        ) VALUES %s
+    """,
+}
+
+
+# 查詢登記現況與登記機關的代碼
+_LOOKUP_IDS_SQL = text(
+    """
+    SELECT (SELECT id FROM registration_statuses WHERE name = :status) AS status_id,
+           (SELECT id FROM registration_authorities WHERE name = :authority) AS authority_id
+"""
+)
+
+_LOOKUP_INSERT_SQL = {
+    "registration_statuses": text(
+        "INSERT INTO registration_statuses (name) VALUES (:name) "
+        "ON CONFLICT (name) DO NOTHING"
+    ),
+    "registration_authorities": text(
+        "INSERT INTO registration_authorities (name) VALUES (:name) "
+        "ON CONFLICT (name) DO NOTHING"
+    ),
+}
+
+_ROC_DATE_PATTERNS = [
+    re.compile(r"(\d{2,3})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日"),
+    re.compile(r"^\s*(\d{2,3})(\d{2})(\d{2})\s*$"),
+    re.compile(r"(\d{2,3})[/.-](\d{1,2})[/.-](\d{1,2})"),
+]
+
+
+def parse_roc_date(value):
+    """
+    將民國日期字串轉為 date，規則與資料庫中的 roc_to_date() 相同
+
+    Args:
+        value: 例如「民國112年03月01日」、「112年03月01日」、「1120301」或「112/03/01」
+
+    Returns:
+        datetime.date 或 None（無法解析時）
+    """
+    if not value:
+        return None
+    for pattern in _ROC_DATE_PATTERNS:
+        match = pattern.search(value)
+        if match:
+            year, month, day = (int(part) for part in match.groups())
+            try:
+                return date(year + 1911, month, day)
+            except ValueError:
+                return None
+    return None
+
+
+def normalize_label(value):
+    """去除登記現況、登記機關等欄位中的所有空白，空字串回傳 None"""
+    value = re.sub(r"\s+", "", value or "")
+    return value or None
+
+
+def _resolve_lookup_ids(conn, status, authority):
+    """
+    取得登記現況與登記機關的代碼，不存在時新增
+
+    Returns:
+        tuple: (registration_status_id, registration_authority_id)
+    """
+    row = conn.execute(_LOOKUP_IDS_SQL, {"status": status, "authority": authority}).one()
+    status_id, authority_id = row.status_id, row.authority_id
+
+    missing = []
+    if status and status_id is None:
+        missing.append(("registration_statuses", status))
+    if authority and authority_id is None:
+        missing.append(("registration_authorities", authority))
+    if missing:
+        for table, name in missing:
+            conn.execute(_LOOKUP_INSERT_SQL[table], {"name": name})
+        row = conn.execute(
+            _LOOKUP_IDS_SQL, {"status": status, "authority": authority}
+        ).one()
+        status_id, authority_id = row.status_id, row.authority_id
+
+    return status_id, authority_id
+
+
+def _company_values(conn, company_data, registration_number):
+    """組裝要寫入 companies 的欄位"""
+    basic_info = company_data.get("基本資料", {})
+    detailed_info = company_data.get("詳細基本資料", {})
+    company_info = {**basic_info, **detailed_info}
+
+    status_id, authority_id = _resolve_lookup_ids(
+        conn,
+        normalize_label(company_info.get("登記現況")),
+        normalize_label(company_info.get("登記機關")),
+    )
+
+    return {
+        "registration_number": registration_number,
+        "company_name": company_info.get("公司名稱", ""),
+        "registration_authority_id": authority_id,
+        "registration_status_id": status_id,
+        "address": company_info.get("公司所在地", ""),
+        "data_type": company_info.get("資料種類", ""),
+        "approval_date": parse_roc_date(company_info.get("核准設立日期")),
+        "last_change_date": parse_roc_date(company_info.get("最後核准變更日期")),
+        "capital_amount": company_info.get("資本總額(元)", "").replace(",", "")
+        or None,
+        "paid_in_capital": company_info.get("實收資本額(元)", "").replace(",", "")
+        or None,
+        "share_value": company_info.get("每股金額(元)", "") or None,
+        "issued_shares": company_info.get("已發行股份總數(股)", "").replace(",", "")
+        or None,
+        "representative": company_info.get("代表人姓名", ""),
+        "foreign_company_name": company_info.get("章程所訂外文公司名稱", ""),
+        "special_shares_status": company_info.get("複數表決權特別股", ""),
+        "veto_shares_status": company_info.get("對於特定事項具否決權特別股", ""),
+        "business_items": company_info.get("所營事業資料", "").replace("\n", " "),
+    }
+
+
+def _child_rows(company_data, company_id):
+    """
+    將董監事、經理人、分公司、工廠資料轉為各子表的資料列
+
+    Returns:
+        dict: 子表名稱對應 tuple 資料列的列表，欄位順序與 _CHILD_INSERT_SQL 相同
+    """
+    # 董監事（directors），任期資訊寫入每一位董監事
+    directors = company_data.get("董監事資料", [])
+    tenure = next((d["任期資訊"] for d in directors if "任期資訊" in d), "")
+    directors = [d for d in directors if "任期資訊" not in d]
+
+    rows = {
+        "directors": [
+            (
+                company_id,
+                d.get("序號"),
+                d.get("職稱"),
+                d.get("姓名"),
+                d.get("所代表法人"),
+                d.get("持有股份數(股)", "").replace(",", "") or None,
+                tenure,
             )
-            branches = company_data.get("分公司資料", [])
-            if branches != ["查無符合結果"]:
-                for idx, b in enumerate(branches, 1):
-                    bv = {
-                        "company_id": company_id,
-                        "sequence_number": b.get("序號") or str(idx),
-                        "registration_number": b.get("統一編號"),
-                        "branch_name": b.get("分公司名稱"),
-                        "registration_status": b.get("登記現況"),
-                        "approval_date": b.get("分公司核准設立日期"),
-                        "last_change_date": b.get("最後核准變更日期"),
-                    }
-                    conn.execute(
-                        text(
-                            """
-                        INSERT INTO branch_companies (
-                            company_id, sequence_number, registration_number,
-                            branch_name, registration_status,
-                            approval_date, last_change_date
-                        ) VALUES (
-                            :company_id, :sequence_number, :registration_number,
-                            :branch_name, :registration_status,
-                            :approval_date, :last_change_date
-                        )
-                    """
-                        ),
-                        bv,
-                    )
+            for d in directors
+        ],
+        "managers": [
+            (company_id, m.get("序號"), m.get("姓名"), parse_roc_date(m.get("到職日期")))
+            for m in company_data.get("經理人資料", [])
+        ],
+        "branch_companies": [],
+        "factories": [],
+    }
+
+    # 分公司（branch_companies）
+    branches = company_data.get("分公司資料", [])
+    if branches != ["查無符合結果"]:
+        rows["branch_companies"] = [
+            (
+                company_id,
+                b.get("序號") or str(idx),
+                b.get("統一編號"),
+                b.get("分公司名稱"),
+                b.get("登記現況"),
+                parse_roc_date(b.get("分公司核准設立日期")),
+                parse_roc_date(b.get("最後核准變更日期")),
+            )
+            for idx, b in enumerate(branches, 1)
+        ]
 
-            # 6. 工廠（factories）
-            conn.execute(
-                text("DELETE FROM factories WHERE company_id = :cid"),
-                {"cid": company_id},
+    # 工廠（factories）
+    factories = company_data.get("工廠資料", [])
+    if factories != ["查無符合結果"]:
+        rows["factories"] = [
+            (
+                company_id,
+                f.get("序號"),
+                f.get("登記編號"),
+                f.get("工廠名稱"),
+                f.get("登記現況"),
+                parse_roc_date(f.get("工廠登記核准日期")),
+                parse_roc_date(f.get("最後核准變更日期")),
             )
-            factories = company_data.get("工廠資料", [])
-            if factories != ["查無符合結果"]:
-                for f in factories:
-                    fv = {
-                        "company_id": company_id,
-                        "sequence_number": f.get("序號"),
-                        "registration_number": f.get("登記編號"),
-                        "factory_name": f.get("工廠名稱"),
-                        "registration_status": f.get("登記現況"),
-                        "approval_date": f.get("工廠登記核准日期"),
-                        "last_change_date": f.get("最後核准變更日期"),
-                    }
-                    conn.execute(
-                        text(
-                            """
-                        INSERT INTO factories (
-                            company_id, sequence_number, registration_number,
-                            factory_name, registration_status,
-                            approval_date, last_change_date
-                        ) VALUES (
-                            :company_id, :sequence_number, :registration_number,
-                            :factory_name, :registration_status,
-                            :approval_date, :last_change_date
-                        )
-                    """
-                        ),
-                        fv,
-                    )
+            for f in factories
+        ]
+
+    return rows
+
+
+def write_company(conn, company_data, registration_number):
+    """
+    在呼叫端的 transaction 中寫入一家公司的資料
+
+    公司本身以 INSERT ... ON CONFLICT 寫入，同一家公司的並行寫入會在該列上排隊，
+    不會發生先查詢再新增的競爭；子表先一次刪除舊資料，再以多列 INSERT 寫入。
+
+    Args:
+        conn: SQLAlchemy Connection（需已在 transaction 中）
+        company_data: query_company 回傳的公司資料
+        registration_number: 8 位統一編號
+
+    Returns:
+        int: companies.id
+    """
+    company_id = conn.execute(
+        _UPSERT_COMPANY_SQL, _company_values(conn, company_data, registration_number)
+    ).scalar()
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(_DELETE_CHILDREN_SQL, {"cid": company_id})
+        # 查得到資料的公司不再視為查無資料
+        cursor.execute(_FORGET_NOT_FOUND_SQL, {"rn": registration_number})
+        for table, rows in _child_rows(company_data, company_id).items():
+            if rows:
+                execute_values(cursor, _CHILD_INSERT_SQL[table], rows, page_size=1000)
+    finally:
+        cursor.close()
+
+    return company_id
+
+
+def save_to_database(company_data, registration_number):
+    """
+    用 SQLAlchemy Engine 將公司資料寫入或更新到 PostgreSQL 資料庫。
+
+    Args:
+        company_data: dict，包含 keys:
+            '基本資料', '詳細基本資料',
+            '董監事資料', '經理人資料', '分公司資料', '工廠資料'
+        registration_number: str，8 位統一編號
+    """
+    try:
+        with metrics.timer("save_to_database"), engine.begin() as conn:
+            write_company(conn, company_data, registration_number)
 
         logging.info(f"已成功將統一編號 {registration_number} 的資料保存到資料庫")
     except Exception as e:
         logging.error(f"保存資料到資料庫時發生錯誤: {e}")
 
+
+class DatabaseWriter:
+    """
+    背景寫入資料庫的階段，讓爬取與資料庫寫入同時進行
+
+    查詢執行緒將公司資料放入有上限的佇列後立即返回；背景執行緒累積到 batch_size 家
+    或距離第一筆資料超過 flush_interval 秒時，將整批公司寫入同一個 transaction。
+    每家公司使用獨立的 SAVEPOINT，單一公司寫入失敗不影響同批的其他公司。
+    資料庫跟不上時佇列會滿，submit() 會阻塞，使爬取速度自然降下來。
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        batch_size=20,
+        flush_interval=2.0,
+        max_queue=100,
+        on_error=None,
+        on_saved=None,
+    ):
+        """
+        Args:
+            batch_size: 每個 transaction 最多寫入的公司數
+            flush_interval: 佇列中的資料最多等待幾秒就寫入
+            max_queue: 佇列上限，超過時 submit() 會等待
+            on_error: 可選的 callable(registration_number, error_message)，寫入失敗時呼叫
+            on_saved: 可選的 callable(registration_numbers)，每批 transaction 提交後呼叫
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.on_saved = on_saved
+        self.errors = {}
+        self.saved = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, company_data, registration_number):
+        """將一家公司的資料放入寫入佇列，佇列已滿時等待"""
+        while True:
+            if not self._thread.is_alive():
+                raise RuntimeError("資料庫寫入執行緒已停止")
+            try:
+                self._queue.put((company_data, registration_number), timeout=1)
+                return
+            except queue.Full:
+                logging.info("資料庫寫入佇列已滿，等待寫入...")
+
+    def close(self):
+        """寫入佇列中剩餘的資料後停止背景執行緒"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        logging.info(
+            f"資料庫寫入階段結束: 成功寫入 {self.saved} 家，失敗 {len(self.errors)} 家"
+        )
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (
+                len(batch) >= self.batch_size or time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, batch):
+        """將一批公司寫入同一個 transaction"""
+        if not batch:
+            return
+
+        saved = []
+        try:
+            with metrics.timer("save_to_database"), engine.begin() as conn:
+                for company_data, registration_number in batch:
+                    try:
+                        with conn.begin_nested():
+                            write_company(conn, company_data, registration_number)
+                        saved.append(registration_number)
+                    except Exception as e:
+                        self._record_error(registration_number, e)
+        except Exception as e:
+            # transaction 提交失敗時整批都沒有寫入
+            for registration_number in saved:
+                self._record_error(registration_number, e)
+            saved = []
+
+        self.saved += len(saved)
+        if saved:
+            logging.info(f"已將 {len(saved)} 家公司的資料批次保存到資料庫")
+            if self.on_saved is not None:
+                try:
+                    self.on_saved(saved)
+                except Exception as e:
+                    logging.error(f"處理寫入完成通知時發生錯誤: {e}")
+
+    def _record_error(self, registration_number, error):
+        logging.error(f"保存統一編號 {registration_number} 的資料到資料庫時發生錯誤: {error}")
+        self.errors[registration_number] = str(error)
+        if self.on_error is not None:
+            self.on_error(registration_number, str(error))
+
+
 def extract_search_result_info(soup):
     """從搜尋結果頁面提取基本資訊"""
     info = {}
@@ -735,395 +2488,1805 @@ def extract_factory_info(soup):
     return info
 
 
-def query_company(registration_number):
+# 分頁資訊文字，例如「共39筆、分2頁」
+_PAGING_INFO_PATTERN = re.compile(r"共\s*([\d,]+)\s*筆\s*[、,，]?\s*分\s*(\d+)\s*頁")
+
+
+def _paging_info_from_text(text):
+    match = _PAGING_INFO_PATTERN.search(text)
+    if not match:
+        return None
+    return {
+        "total": int(match.group(1).replace(",", "")),
+        "pages": max(int(match.group(2)), 1),
+    }
+
+
+def extract_paging_info(soup, container_id):
     """
-    查詢單一公司資料
-    
+    從頁籤內容取得分頁資訊
+
+    優先讀取「共N筆、分M頁」文字；找不到時改用分頁連結中最大的頁碼，此時總筆數為 None。
+
     Args:
-        registration_number: 公司統一編號
-        
+        soup: 頁籤容器或整份頁面的 BeautifulSoup
+        container_id: 頁籤內容容器 id
+
     Returns:
-        dict 或 None: 公司資料或 None (如果查詢失敗)
+        dict: {"total": 總筆數或 None, "pages": 總頁數，沒有分頁時為 1}
     """
-    # 確認統一編號格式正確
-    if not registration_number.isdigit() or len(registration_number) != 8:
-        logging.error(f"統一編號 {registration_number} 格式不正確，應為8位數字")
-        return {"查詢結果": "統一編號格式錯誤"}
-    
-    # 檢查統一編號是否合法（簡單檢查，非完整檢查法）
-    weights = [1, 2, 1, 2, 1, 2, 4, 1]
-    checksum = sum(int(registration_number[i]) * weights[i] // 10 + 
-                   int(registration_number[i]) * weights[i] % 10 
-                   for i in range(8)) % 10
-    
-    if checksum != 0:
-        logging.warning(f"統一編號 {registration_number} 可能不是有效的統一編號")
-        # 不中斷程式，因為有些測試用統一編號可能不符合checksum規則
-    
-    driver = None
-    try:
-        driver = setup_driver()
-        if not driver:
-            logging.error("無法設置 WebDriver")
-            return {"查詢結果": "WebDriver 設置失敗"}
+    container = soup.find(id=container_id) or soup
+    info = _paging_info_from_text(container.get_text())
+    if info:
+        return info
+
+    pages = 1
+    pagination = container.select_one("ul.pagination")
+    if pagination:
+        for link in pagination.select("li a"):
+            link_text = link.get_text(strip=True)
+            if link_text.isdigit():
+                pages = max(pages, int(link_text))
+    return {"total": None, "pages": pages}
+
+
+# 詳細資料頁的各頁籤：(資料名稱, 頁籤 id, 內容容器 id, 解析項目)
+DETAIL_TABS = [
+    ("董監事資料", "tabShareHolder", "tabShareHolderContent", "shareholder"),
+    ("經理人資料", "tabMgr", "tabMgrContent", "manager"),
+    ("分公司資料", "tabBrCmpy", "tabBrCmpyContent", "branch"),
+    ("工廠資料", "tabFactory", "tabFactoryContent", "factory"),
+]
+
+
+def has_all_tab_tables(soup):
+    """檢查詳細資料頁是否已直接包含所有頁籤的資料表格"""
+    for name, _, container_id, _ in DETAIL_TABS:
+        if not soup.select_one(f"#{container_id} table.table"):
+            logging.info(f"頁面中沒有{name}表格")
+            return False
+    return True
+
+
+# ---- lxml 解析後端 ----
+# 以下函數與上方 BeautifulSoup 版本輸出完全相同的資料，改用預先編譯的 XPath 直接走訪 lxml 樹，
+# 在分公司、工廠資料多達數百列的大型公司頁面上速度較快且記憶體用量較少。
+
+
+def _has_class(name):
+    """產生與 CSS 類別選擇器 .name 相同語意的 XPath 條件"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_XP_V_PARAGRAPH = etree.XPath("(//*[@id='vParagraph'])[1]")
+_XP_PANEL = etree.XPath(f"(.//*[{_has_class('panel')}])[1]")
+_XP_PANEL_HEADING_LINK = etree.XPath(f"(.//*[{_has_class('panel-heading')}]//a)[1]")
+_XP_DETAILS_DIV = etree.XPath("(.//div[@style='padding: 5px 10px;'])[1]")
+_XP_CMPY_TABLE = etree.XPath(f"(//*[@id='tabCmpyContent']//table[{_has_class('table')}])[1]")
+_XP_TENURE_DIV = etree.XPath(
+    f"(//*[@id='tabShareHolderContent']//div[not({_has_class('table-responsive')})])[1]"
+)
+_XP_ROWS = etree.XPath(".//tr")
+_XP_CELLS = etree.XPath(".//td")
+_XP_HEADERS = etree.XPath(".//thead//th")
+_XP_BODY_ROWS = etree.XPath(".//tbody//tr")
+_XP_COLSPAN_CELL = etree.XPath("(.//td[@colspan])[1]")
+_XP_COLSPAN6_CELL = etree.XPath("(.//td[@colspan='6'])[1]")
+_XP_NO_RESULT_CELL = etree.XPath("(.//tr//td[@colspan='6'])[1]")
+_XP_LINK = etree.XPath("(.//a)[1]")
+_XP_PAGINATION = etree.XPath(f"(.//ul[{_has_class('pagination')}])[1]")
+_XP_PAGINATION_LINKS = etree.XPath(".//li//a")
+
+
+def _tab_table_xpath(container_id):
+    """頁籤內 .table-responsive 中第一個 table.table"""
+    return etree.XPath(
+        f"(//*[@id='{container_id}']//*[{_has_class('table-responsive')}]"
+        f"//table[{_has_class('table')}])[1]"
+    )
 
-        # 步驟 1: 前往搜尋頁面
-        logging.info("前往網站...")
-        driver.get("https://findbiz.nat.gov.tw/fts/query/QueryBar/queryInit.do")
 
-        # 等待頁面加載
-        wait = WebDriverWait(driver, 20)
+_XP_CONTAINERS = {
+    container_id: etree.XPath(f"(//*[@id='{container_id}'])[1]")
+    for container_id in (
+        "tabShareHolderContent",
+        "tabMgrContent",
+        "tabBrCmpyContent",
+        "tabFactoryContent",
+    )
+}
+_XP_SHAREHOLDER_TABLE = _tab_table_xpath("tabShareHolderContent")
+_XP_MANAGER_TABLE = _tab_table_xpath("tabMgrContent")
+_XP_BRANCH_TABLE = _tab_table_xpath("tabBrCmpyContent")
+_XP_FACTORY_TABLE = _tab_table_xpath("tabFactoryContent")
+_XP_TAB_TABLES = {
+    container_id: etree.XPath(
+        f"(//*[@id='{container_id}']//table[{_has_class('table')}])[1]"
+    )
+    for _, _, container_id, _ in DETAIL_TABS
+}
 
-        # 檢查是否需要同意條款
-        try:
-            agree_button = wait.until(EC.element_to_be_clickable((By.ID, "agree")))
-            logging.info("點擊同意按鈕...")
-            agree_button.click()
-        except (TimeoutException, NoSuchElementException):
-            logging.info("無需點擊同意按鈕")
-
-        # 輸入統一編號
-        logging.info("等待輸入欄位...")
-        try:
-            input_el = wait.until(EC.element_to_be_clickable((By.ID, "qryCond")))
-            input_el.clear()
-            input_el.send_keys(registration_number)
-        except TimeoutException:
-            logging.error("無法找到輸入欄位")
+# BeautifulSoup 的 get_text() 不包含這些元素內的文字
+_SKIPPED_TEXT_TAGS = {"script", "style", "template"}
 
-            return {"查詢結果": "無法找到輸入欄位"}
 
-        # 點擊查詢按鈕
-        logging.info("點擊查詢按鈕...")
-        try:
-            search_button = driver.find_element(By.ID, "qryBtn")
-            driver.execute_script("arguments[0].click();", search_button)
-        except NoSuchElementException:
-            logging.error("無法找到查詢按鈕")
+def _iter_strings(element):
+    """依文件順序產生元素內的文字節點，規則與 BeautifulSoup 的 get_text() 相同"""
+    if element.text is not None and element.tag not in _SKIPPED_TEXT_TAGS:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in _SKIPPED_TEXT_TAGS:
+            yield from _iter_strings(child)
+        if child.tail is not None:
+            yield child.tail
 
-            return {"查詢結果": "無法找到查詢按鈕"}
 
-        # 等待結果頁面加載
-        try:
-            logging.info("等待結果面板...")
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".panel-heading")))
-        except TimeoutException:
-            # 檢查是否顯示「查無資料」的訊息
-            if is_company_not_found(driver):
-                logging.info(f"統一編號 {registration_number} 查無符合資料")
-                return {"查詢結果": "查無符合資料"}
-            
-            logging.error("等待結果面板超時")
+def _text(element, strip=True, separator=""):
+    """與 BeautifulSoup 的 get_text() 相同的文字擷取"""
+    strings = _iter_strings(element)
+    if strip:
+        strings = (text.strip() for text in strings)
+        strings = (text for text in strings if text)
+    return separator.join(strings)
 
-            return {"查詢結果": "查詢超時，無結果"}
 
-        # 確保頁面完全加載
-        time.sleep(2)
+def _first(xpath, node):
+    """回傳 XPath 的第一個結果，沒有結果時回傳 None"""
+    result = xpath(node)
+    return result[0] if result else None
 
-        # 嘗試提取基本資料
-        logging.info("先提取搜尋結果頁的基本資訊...")
-        html = driver.page_source
-        soup = BeautifulSoup(html, "lxml")
-        basic_info = extract_search_result_info(soup)
-        
-        # 檢查是否找到任何基本資訊
-        if not basic_info or len(basic_info) == 0:
-            if is_company_not_found(driver):
-                logging.info(f"統一編號 {registration_number} 查無符合資料")
-                return {"查詢結果": "查無符合資料"}
-            
-            logging.warning("無法從搜尋結果頁提取基本資訊")
 
-        # 嘗試多種方法點擊詳細資料連結
-        logging.info("尋找詳細資料連結...")
-        detail_link_clicked = False
+def parse_html_tree(html):
+    """將 HTML 字串解析為 lxml 樹，空字串也回傳一棵空的文件樹"""
+    if not html or not html.strip():
+        html = "<html></html>"
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # 含有編碼宣告的字串需以位元組解析
+        return lxml.html.document_fromstring(html.encode("utf-8"))
 
-        # 方法1: 透過類別選擇器
-        try:
-            detail_span = wait.until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "span.moreLinkMouseOut"))
-            )
-            logging.info("點擊詳細資料連結(方法1)...")
-            driver.execute_script("arguments[0].click();", detail_span)
-            detail_link_clicked = True
-        except Exception as e:
-            logging.warning(f"方法1點擊詳細資料連結失敗: {e}")
 
-        # 方法2: 透過文字內容
-        if not detail_link_clicked:
-            try:
-                detail_span = wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, "//span[contains(text(), '詳細資料')]")
-                    )
-                )
-                logging.info("點擊詳細資料連結(方法2)...")
-                driver.execute_script("arguments[0].click();", detail_span)
-                detail_link_clicked = True
-            except Exception as e:
-                logging.warning(f"方法2點擊詳細資料連結失敗: {e}")
+def extract_search_result_info_lxml(tree):
+    """從搜尋結果頁面提取基本資訊（lxml 版本）"""
+    info = {}
+    try:
+        vParagraph = _first(_XP_V_PARAGRAPH, tree)
+        if vParagraph is not None:
+            panel = _first(_XP_PANEL, vParagraph)
+            if panel is not None:
+                company_name = _first(_XP_PANEL_HEADING_LINK, panel)
+                if company_name is not None:
+                    info["公司名稱"] = _text(company_name)
+
+                details_div = _first(_XP_DETAILS_DIV, panel)
+                if details_div is not None:
+                    text = _text(details_div, strip=False, separator=",").strip()
+                    parts = [part.strip() for part in text.split(",")]
 
-        # 方法3: 直接透過詳細資料頁URL進入
-        if not detail_link_clicked:
-            logging.info("嘗試透過直接訪問URL獲取詳細資料(方法3)...")
-            driver.get(
-                f"https://findbiz.nat.gov.tw/fts/query/QueryCmpyDetail/queryCmpyDetail.do?banNo={registration_number}"
-            )
-            detail_link_clicked = True
+                    for part in parts:
+                        if ":" in part:
+                            key, value = part.split(":", 1)
+                            info[key.strip()] = value.strip()
+                        elif "：" in part:
+                            key, value = part.split("：", 1)
+                            info[key.strip()] = value.strip()
+    except Exception as e:
+        logging.error(f"提取搜尋結果頁資訊時發生錯誤: {e}")
+    return info
 
-        # 等待詳細資料頁面加載
-        logging.info("等待詳細資料頁面加載...")
-        detail_page_loaded = False
-        try:
-            # 等待頁籤加載完成
-            wait.until(EC.presence_of_element_located((By.ID, "tabCmpy")))
-            time.sleep(2)
-            detail_page_loaded = True
-        except TimeoutException:
-            # 檢查是否顯示「查無資料」的訊息
-            if is_company_not_found(driver):
-                logging.info(f"統一編號 {registration_number} 查無符合資料")
-                
-            logging.error("無法加載詳細資料頁面，可能頁面結構已更改或網站無回應")
-            # 如果無法加載詳細資料頁面，則只返回基本資訊
-            if basic_info and len(basic_info) > 0:
-                return {"查詢結果": "僅獲取基本資訊", "基本資料": basic_info}
-            else:
-                return {"查詢結果": "無法獲取詳細資料"}
 
-        # 步驟 4: 提取公司的各種資訊
-        company_data = {}
-        company_data["查詢結果"] = "成功"
-        company_data["基本資料"] = basic_info  # 保留搜尋結果頁的基本資訊
+def extract_company_base_info_lxml(tree):
+    """從公司基本資料頁籤提取資訊（lxml 版本）"""
+    info = {}
+    try:
+        table = _first(_XP_CMPY_TABLE, tree)
+        if table is not None:
+            for row in _XP_ROWS(table):
+                cells = _XP_CELLS(row)
+                if len(cells) >= 2:
+                    info[_text(cells[0])] = _text(cells[1])
+    except Exception as e:
+        logging.error(f"提取公司基本資料時發生錯誤: {e}")
+    return info
 
-        # 只有在成功加載詳細資料頁面後，才繼續提取資訊
-        if detail_page_loaded:
-            # 提取詳細頁的基本資料
-            logging.info("提取公司詳細基本資料...")
-            html = driver.page_source
-            soup = BeautifulSoup(html, "lxml")
-            company_data["詳細基本資料"] = extract_company_base_info(soup)
-            
-            # 檢查詳細基本資料是否為空
-            if not company_data["詳細基本資料"] or len(company_data["詳細基本資料"]) == 0:
-                logging.warning("無法提取詳細基本資料")
-                company_data["查詢結果"] = "詳細資料提取失敗"
-                return company_data
 
-            # 點擊「董監事資料」頁籤並提取資訊
-            try:
-                logging.info("提取董監事資料...")
-                tab_share_holder = driver.find_element(By.ID, "tabShareHolder")
-                driver.execute_script("arguments[0].click();", tab_share_holder)
-                
-                # 等待董監事資料加載
-                try:
-                    wait.until(EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "#tabShareHolderContent table.table")
-                    ))
-                except TimeoutException:
-                    logging.warning("等待董監事資料表格超時")
-                
-                time.sleep(2)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "lxml")
-                company_data["董監事資料"] = extract_shareholder_info(soup)
-            except Exception as e:
-                logging.error(f"提取董監事資料時發生錯誤: {e}")
-                company_data["董監事資料"] = []
+def _extract_table_rows_lxml(table, min_cells, skip_xpath, link_column=None):
+    """
+    將資料表格的每一列轉為以表頭為 key 的 dict
 
-            # 點擊「經理人資料」頁籤並提取資訊
-            try:
-                logging.info("提取經理人資料...")
-                tab_mgr = driver.find_element(By.ID, "tabMgr")
-                driver.execute_script("arguments[0].click();", tab_mgr)
-                
-                # 等待經理人資料加載
-                try:
-                    wait.until(EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "#tabMgrContent table.table")
-                    ))
-                except TimeoutException:
-                    logging.warning("等待經理人資料表格超時")
-                
-                time.sleep(2)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "lxml")
-                company_data["經理人資料"] = extract_manager_info(soup)
-            except Exception as e:
-                logging.error(f"提取經理人資料時發生錯誤: {e}")
-                company_data["經理人資料"] = []
+    Args:
+        table: table 元素
+        min_cells: 一列至少需有的欄位數
+        skip_xpath: 符合時略過該列的 XPath（分頁資訊列）
+        link_column: 若該欄有連結，只取連結文字的欄位索引
+    """
+    rows = []
+    headers = [_text(th) for th in _XP_HEADERS(table)]
+    for row in _XP_BODY_ROWS(table):
+        # 跳過分頁資訊的行
+        if skip_xpath(row):
+            continue
+
+        cells = _XP_CELLS(row)
+        if len(cells) >= min_cells:
+            item = {}
+            for i, cell in enumerate(cells):
+                if i < len(headers):
+                    if i == link_column:
+                        link = _first(_XP_LINK, cell)
+                        item[headers[i]] = _text(link if link is not None else cell)
+                    else:
+                        item[headers[i]] = _text(cell)
+            if item:
+                rows.append(item)
+    return rows
+
+
+def _has_no_result(table):
+    """表格中是否有「查無符合結果」的訊息"""
+    no_result = _first(_XP_NO_RESULT_CELL, table)
+    return no_result is not None and "查無符合結果" in _text(no_result, strip=False)
+
+
+def extract_shareholder_info_lxml(tree):
+    """從董監事資料頁籤提取資訊（lxml 版本）"""
+    info = []
+    try:
+        tenure_div = _first(_XP_TENURE_DIV, tree)
+        if tenure_div is not None:
+            info.append({"任期資訊": _text(tenure_div)})
 
-            # 點擊「分公司資料」頁籤並提取資訊
-            try:
-                logging.info("提取分公司資料...")
-                tab_br_cmpy = driver.find_element(By.ID, "tabBrCmpy")
-                driver.execute_script("arguments[0].click();", tab_br_cmpy)
-                
-                # 等待分公司資料加載
-                try:
-                    wait.until(EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "#tabBrCmpyContent .table-responsive")
-                    ))
-                except TimeoutException:
-                    logging.warning("等待分公司資料表格超時")
-                
-                time.sleep(2)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "lxml")
-                company_data["分公司資料"] = extract_branch_info(soup)
-            except Exception as e:
-                logging.error(f"提取分公司資料時發生錯誤: {e}")
-                company_data["分公司資料"] = []
+        table = _first(_XP_SHAREHOLDER_TABLE, tree)
+        if table is not None:
+            info.extend(_extract_table_rows_lxml(table, 4, _XP_COLSPAN_CELL))
+    except Exception as e:
+        logging.error(f"提取董監事資料時發生錯誤: {e}")
+    return info
 
-            # 點擊「工廠資料」頁籤並提取資訊
-            try:
-                logging.info("提取工廠資料...")
-                tab_factory = driver.find_element(By.ID, "tabFactory")
-                driver.execute_script("arguments[0].click();", tab_factory)
-                
-                # 等待工廠資料加載
-                try:
-                    wait.until(EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "#tabFactoryContent .table-responsive")
-                    ))
-                except TimeoutException:
-                    logging.warning("等待工廠資料表格超時")
-                
-                time.sleep(2)
-                html = driver.page_source
-                soup = BeautifulSoup(html, "lxml")
-                company_data["工廠資料"] = extract_factory_info(soup)
-
-                # 頁面可能有分頁，處理下一頁工廠資料
-                logging.info("檢查工廠資料是否有多頁...")
-
-                # 更精確地解析分頁資訊
-                pagination = soup.select_one("ul.pagination")
-                if pagination:
-                    # 嘗試找到最後一頁的數字
-                    last_page_num = 1
-
-                    # 方法1: 尋找最後一頁链接前的文字 (通常此頁會是最大頁碼)
-                    last_page_link = pagination.select_one("li:nth-last-child(2) a")
-                    if last_page_link and last_page_link.get_text(strip=True).isdigit():
-                        last_page_num = int(last_page_link.get_text(strip=True))
-
-                    # 方法2: 尋找所有數字链接，找出最大的
-                    if last_page_num == 1:  # 如果方法1沒找到
-                        for link in pagination.select("li a"):
-                            link_text = link.get_text(strip=True)
-                            if link_text.isdigit():
-                                page_num = int(link_text)
-                                if page_num > last_page_num:
-                                    last_page_num = page_num
-
-                    # 方法3: 從分頁信息文字中提取(例如 "共39筆、分2頁")
-                    if last_page_num == 1:  # 如果前兩種方法都沒找到
-                        pagination_info = soup.select_one('tr td[colspan="6"]')
-                        if pagination_info:
-                            pagination_text = pagination_info.get_text(strip=True)
-                            match = re.search(r"共\d+筆、分(\d+)頁", pagination_text)
-                            if match:
-                                last_page_num = int(match.group(1))
-
-                    logging.info(f"工廠資料共 {last_page_num} 頁")
-
-                    # 從第2頁開始處理（第1頁已經處理過）
-                    if last_page_num > 1:
-                        for page_num in range(2, last_page_num + 1):
-                            try:
-                                logging.info(f"提取工廠資料第 {page_num} 頁...")
-
-                                # 嘗試多種方式點擊頁碼
-                                clicked = False
-
-                                # 方法1: 直接點擊數字頁碼
-                                try:
-                                    page_link = driver.find_element(
-                                        By.XPATH,
-                                        f"//ul[contains(@class, 'pagination')]/li/a[text()='{page_num}']",
-                                    )
-                                    driver.execute_script(
-                                        "arguments[0].click();", page_link
-                                    )
-                                    clicked = True
-                                except Exception as e:
-                                    logging.warning(
-                                        f"無法通過數字點擊第 {page_num} 頁: {e}"
-                                    )
 
-                                # 方法2: 使用 gotoPageFact 函數 (通過 JavaScript 直接調用)
-                                if not clicked:
-                                    try:
-                                        logging.info(
-                                            f"嘗試使用 gotoPageFact 函數點擊第 {page_num} 頁..."
-                                        )
-                                        driver.execute_script(f"gotoPageFact({page_num});")
-                                        clicked = True
-                                    except Exception as e:
-                                        logging.warning(f"無法使用 gotoPageFact 函數: {e}")
-
-                                if clicked:
-                                    # 等待頁面加載
-                                    time.sleep(2)
-                                    wait.until(
-                                        EC.presence_of_element_located(
-                                            (
-                                                By.CSS_SELECTOR,
-                                                "#tabFactoryContent .table-responsive table.table",
-                                            )
-                                        )
-                                    )
+def extract_manager_info_lxml(tree):
+    """從經理人資料頁籤提取資訊（lxml 版本）"""
+    info = []
+    try:
+        table = _first(_XP_MANAGER_TABLE, tree)
+        if table is not None:
+            info.extend(_extract_table_rows_lxml(table, 3, _XP_COLSPAN_CELL))
+    except Exception as e:
+        logging.error(f"提取經理人資料時發生錯誤: {e}")
+    return info
 
-                                    html = driver.page_source
-                                    soup = BeautifulSoup(html, "lxml")
-                                    additional_factory_info = extract_factory_info(soup)
-                                    company_data["工廠資料"].extend(additional_factory_info)
-                                else:
-                                    logging.error(
-                                        f"無法點擊到第 {page_num} 頁，嘗試了所有可能的方法"
-                                    )
-                                    break
-
-                            except Exception as e:
-                                logging.warning(
-                                    f"提取工廠資料第 {page_num} 頁時發生錯誤: {e}"
-                                )
-                else:
-                    logging.info("工廠資料只有一頁或無分頁導航")
-            except Exception as e:
-                logging.error(f"提取工廠資料時發生錯誤: {e}")
-                company_data["工廠資料"] = []
 
-            # 使用網頁的友善列印功能生成PDF
+def extract_branch_info_lxml(tree):
+    """從分公司資料頁籤提取資訊（lxml 版本）"""
+    info = []
+    try:
+        table = _first(_XP_BRANCH_TABLE, tree)
+        if table is not None:
+            if _has_no_result(table):
+                return ["查無符合結果"]
+            info.extend(_extract_table_rows_lxml(table, 6, _XP_COLSPAN_CELL))
+    except Exception as e:
+        logging.error(f"提取分公司資料時發生錯誤: {e}")
+    return info
+
+
+def extract_factory_info_lxml(tree):
+    """從工廠資料頁籤提取資訊（lxml 版本）"""
+    info = []
+    try:
+        table = _first(_XP_FACTORY_TABLE, tree)
+        if table is not None:
+            if _has_no_result(table):
+                return ["查無符合結果"]
+            info.extend(
+                _extract_table_rows_lxml(table, 6, _XP_COLSPAN6_CELL, link_column=2)
+            )
+    except Exception as e:
+        logging.error(f"提取工廠資料時發生錯誤: {e}")
+    return info
+
+
+def extract_paging_info_lxml(tree, container_id):
+    """從頁籤內容取得分頁資訊（lxml 版本）"""
+    container = _first(_XP_CONTAINERS[container_id], tree)
+    if container is None:
+        container = tree
+    info = _paging_info_from_text(_text(container, strip=False))
+    if info:
+        return info
+
+    pages = 1
+    pagination = _first(_XP_PAGINATION, container)
+    if pagination is not None:
+        for link in _XP_PAGINATION_LINKS(pagination):
+            link_text = _text(link)
+            if link_text.isdigit():
+                pages = max(pages, int(link_text))
+    return {"total": None, "pages": pages}
+
+
+def has_all_tab_tables_lxml(tree):
+    """檢查詳細資料頁是否已直接包含所有頁籤的資料表格（lxml 版本）"""
+    for name, _, container_id, _ in DETAIL_TABS:
+        if _first(_XP_TAB_TABLES[container_id], tree) is None:
+            logging.info(f"頁面中沒有{name}表格")
+            return False
+    return True
+
+
+# 解析後端："bs4" 使用 BeautifulSoup，"lxml" 使用預先編譯的 XPath
+PARSER_BACKEND = os.environ.get("FINDBIZ_PARSER_BACKEND", "bs4")
+
+# parse_page 可執行的解析項目
+PAGE_EXTRACTORS = {
+    "search": extract_search_result_info,
+    "detail": extract_company_base_info,
+    "shareholder": extract_shareholder_info,
+    "manager": extract_manager_info,
+    "branch": extract_branch_info,
+    "factory": extract_factory_info,
+    "shareholder_paging": partial(extract_paging_info, container_id="tabShareHolderContent"),
+    "manager_paging": partial(extract_paging_info, container_id="tabMgrContent"),
+    "branch_paging": partial(extract_paging_info, container_id="tabBrCmpyContent"),
+    "factory_paging": partial(extract_paging_info, container_id="tabFactoryContent"),
+    "tabs_complete": has_all_tab_tables,
+}
+
+PAGE_EXTRACTORS_LXML = {
+    "search": extract_search_result_info_lxml,
+    "detail": extract_company_base_info_lxml,
+    "shareholder": extract_shareholder_info_lxml,
+    "manager": extract_manager_info_lxml,
+    "branch": extract_branch_info_lxml,
+    "factory": extract_factory_info_lxml,
+    "shareholder_paging": partial(extract_paging_info_lxml, container_id="tabShareHolderContent"),
+    "manager_paging": partial(extract_paging_info_lxml, container_id="tabMgrContent"),
+    "branch_paging": partial(extract_paging_info_lxml, container_id="tabBrCmpyContent"),
+    "factory_paging": partial(extract_paging_info_lxml, container_id="tabFactoryContent"),
+    "tabs_complete": has_all_tab_tables_lxml,
+}
+
+
+def parse_page(html, kinds, backend=None):
+    """
+    解析 HTML 字串並執行指定的解析項目，只建立一次解析樹
+
+    此函數只接收與回傳可序列化的資料，可以在 ProcessPoolExecutor 的子行程中執行。
+
+    Args:
+        html: 頁面 HTML 字串
+        kinds: PAGE_EXTRACTORS 中的解析項目名稱
+        backend: "bs4" 或 "lxml"，預設依環境變數 FINDBIZ_PARSER_BACKEND
+
+    Returns:
+        dict: 解析項目名稱對應的解析結果
+    """
+    if (backend or PARSER_BACKEND) == "lxml":
+        tree = parse_html_tree(html)
+        return {kind: PAGE_EXTRACTORS_LXML[kind](tree) for kind in kinds}
+
+    soup = BeautifulSoup(html, "lxml")
+    return {kind: PAGE_EXTRACTORS[kind](soup) for kind in kinds}
+
+
+class ParsePool:
+    """
+    HTML 解析階段：將頁面 HTML 交給子行程解析，讓操作瀏覽器的執行緒不被 GIL 卡住
+
+    max_workers 為 0 時直接在呼叫端執行緒解析，回傳已完成的 Future，
+    因此呼叫端不需區分兩種模式。
+    """
+
+    def __init__(self, max_workers=0, backend=None):
+        """
+        Args:
+            max_workers: 解析子行程數量，0 表示不使用子行程
+            backend: 解析後端 "bs4" 或 "lxml"，預設依環境變數 FINDBIZ_PARSER_BACKEND
+        """
+        self.max_workers = max_workers
+        self.backend = backend or PARSER_BACKEND
+        self._executor = None
+        if max_workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def submit(self, html, *kinds):
+        """
+        提交一份 HTML 進行解析
+
+        Args:
+            html: 頁面 HTML 字串
+            kinds: PAGE_EXTRACTORS 中的解析項目名稱
+
+        Returns:
+            Future: 結果為 parse_page() 的回傳值
+        """
+        if self._executor is not None:
+            return self._executor.submit(parse_page, html, kinds, self.backend)
+
+        future = Future()
+        try:
+            future.set_result(parse_page(html, kinds, self.backend))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def parse(self, html, *kinds):
+        """提交解析並等待結果"""
+        return self.submit(html, *kinds).result()
+
+    def close(self):
+        """關閉解析子行程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# 未指定解析階段時使用的同步解析
+inline_parser = ParsePool()
+
+
+def compress_bytes(data, codec):
+    """以 "zst" 或 "gz" 壓縮資料"""
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("使用 zst 壓縮需要安裝 zstandard")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress_bytes(data, codec):
+    """解壓縮 compress_bytes() 產生的資料"""
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("讀取 zst 壓縮資料需要安裝 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def default_codec():
+    """已安裝 zstandard 時使用 zst，否則使用 gz"""
+    return "zst" if zstandard is not None else "gz"
+
+
+class HtmlArchive:
+    """
+    原始 HTML 封存：查詢時取得的每一份頁面以內容雜湊為檔名壓縮保存，
+    並依統一編號記錄每次查詢取得了哪些頁面，之後可以不經瀏覽器重新解析
+
+    目錄結構:
+        blobs/<雜湊前兩碼>/<sha256>.html.zst（或 .html.gz）
+        index/<統一編號>.jsonl，每次查詢一行
+    """
+
+    def __init__(self, root=None, codec=None):
+        """
+        Args:
+            root: 封存目錄，預設依環境變數 FINDBIZ_ARCHIVE_DIR
+            codec: "zst" 或 "gz"，預設在已安裝 zstandard 時使用 zst
+        """
+        self.root = root or ARCHIVE_DIR
+        self.codec = codec or default_codec()
+        if self.codec == "zst" and zstandard is None:
+            raise ValueError("使用 zst 壓縮需要安裝 zstandard")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "index"), exist_ok=True)
+
+    def _blob_path(self, digest, codec):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.html.{codec}")
+
+    def _index_path(self, registration_number):
+        return os.path.join(self.root, "index", f"{registration_number}.jsonl")
+
+    def put(self, html):
+        """
+        保存一份 HTML，內容相同的頁面只保存一次
+
+        Returns:
+            tuple: (sha256, codec)
+        """
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        for codec in ("zst", "gz"):
+            if os.path.exists(self._blob_path(digest, codec)):
+                return digest, codec
+
+        compressed = compress_bytes(data, self.codec)
+        path = self._blob_path(digest, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先寫入暫存檔再改名，避免並行寫入或中斷時留下不完整的檔案
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, self.codec
+
+    def get(self, digest, codec):
+        """讀取並解壓縮一份 HTML"""
+        with open(self._blob_path(digest, codec), "rb") as f:
+            return decompress_bytes(f.read(), codec).decode("utf-8")
+
+    def record(self, registration_number, snapshots, outcome, source):
+        """
+        保存一次查詢取得的所有頁面並寫入索引
+
+        Args:
+            registration_number: 統一編號
+            snapshots: (kind, page, html) 列表，kind 為 PAGE_EXTRACTORS 中的解析項目名稱
+            outcome: 查詢結果
+            source: "browser" 或 "http"
+        """
+        pages = []
+        for kind, page, html in snapshots:
+            digest, codec = self.put(html)
+            pages.append({"kind": kind, "page": page, "sha256": digest, "codec": codec})
+
+        entry = {
+            "fetched_at": datetime.now().isoformat(timespec="seconds"),
+            "source": source,
+            "result": outcome,
+            "pages": pages,
+        }
+        with self._lock:
+            with open(self._index_path(registration_number), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def registration_numbers(self):
+        """列出封存中所有的統一編號"""
+        index_dir = os.path.join(self.root, "index")
+        return sorted(
+            name[: -len(".jsonl")]
+            for name in os.listdir(index_dir)
+            if name.endswith(".jsonl")
+        )
+
+    def entries(self, registration_number):
+        """依時間順序讀取某統一編號的所有查詢紀錄"""
+        path = self._index_path(registration_number)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def latest(self, registration_number):
+        """取得最近一次有保存頁面的查詢紀錄，沒有時回傳 None"""
+        for entry in reversed(self.entries(registration_number)):
+            if entry["pages"]:
+                return entry
+        return None
+
+
+def _snapshot(snapshots, kind, html, page=1):
+    """封存啟用時記下一份取得的頁面"""
+    if snapshots is not None and html:
+        snapshots.append((kind, page, html))
+
+
+# 統一編號檢查碼各位數的權數
+_REGISTRATION_WEIGHTS = np.array([1, 2, 1, 2, 1, 2, 4, 1], dtype=np.int64)
+_REGISTRATION_POWERS = 10 ** np.arange(7, -1, -1, dtype=np.int64)
+
+
+def _checksum_valid(digits):
+    """
+    依統一編號檢查碼規則檢查一批統一編號
+
+    各位數乘上權數後將乘積的十位數與個位數相加，總和可被 5 整除即為合法；
+    第七位數為 7 時，總和加 1 後可被 5 整除亦為合法。
+
+    Args:
+        digits: 形狀為 (N, 8) 的整數陣列，每列為一個統一編號的各位數
+
+    Returns:
+        numpy.ndarray: 長度為 N 的布林陣列
+    """
+    products = digits * _REGISTRATION_WEIGHTS
+    total = (products // 10 + products % 10).sum(axis=1)
+    return (total % 5 == 0) | ((digits[:, 6] == 7) & ((total + 1) % 5 == 0))
+
+
+def registration_number_mask(registration_numbers):
+    """
+    一次檢查多個統一編號是否符合格式與檢查碼規則
+
+    Args:
+        registration_numbers: 統一編號字串的序列
+
+    Returns:
+        numpy.ndarray: 與輸入等長的布林陣列
+    """
+    numbers = np.asarray(registration_numbers, dtype=str)
+    mask = np.zeros(numbers.shape, dtype=bool)
+    if numbers.size == 0:
+        return mask
+    well_formed = (np.char.str_len(numbers) == 8) & np.char.isdigit(numbers)
+    if well_formed.any():
+        # 每個字元以 UCS-4 儲存，轉成 (N, 8) 的數字陣列
+        codes = numbers[well_formed].astype("<U8").view(np.uint32).reshape(-1, 8)
+        digits = codes.astype(np.int64) - ord("0")
+        # isdigit 也接受全形等其他數字字元，只有半形 0-9 才是合法的統一編號
+        ascii_digits = ((digits >= 0) & (digits <= 9)).all(axis=1)
+        mask[well_formed] = ascii_digits & _checksum_valid(np.clip(digits, 0, 9))
+    return mask
+
+
+def is_valid_registration_number(registration_number):
+    """檢查單一統一編號是否符合格式與檢查碼規則"""
+    return bool(registration_number_mask([registration_number])[0])
+
+
+def filter_registration_numbers(registration_numbers, chunk_size=100_000):
+    """
+    過濾掉不可能存在的統一編號
+
+    輸入依 chunk_size 分段檢查，數百萬筆的輸入也只需固定的記憶體。
+
+    Args:
+        registration_numbers: 統一編號的可迭代物件，前後空白會被去除，空行略過
+        chunk_size: 每次檢查的筆數
+
+    Yields:
+        str: 符合格式與檢查碼規則的統一編號，順序與輸入相同
+    """
+    rejected = 0
+    chunk = []
+
+    def flush():
+        nonlocal rejected
+        mask = registration_number_mask(chunk)
+        rejected += len(chunk) - int(mask.sum())
+        valid = [number for number, ok in zip(chunk, mask) if ok]
+        chunk.clear()
+        return valid
+
+    for registration_number in registration_numbers:
+        registration_number = str(registration_number).strip()
+        if not registration_number:
+            continue
+        chunk.append(registration_number)
+        if len(chunk) >= chunk_size:
+            yield from flush()
+    if chunk:
+        yield from flush()
+    if rejected:
+        logging.info(f"已略過 {rejected} 個不符合檢查碼規則的統一編號")
+
+
+def valid_registration_numbers(start=0, stop=100_000_000, chunk_size=100_000):
+    """
+    列舉範圍內所有符合檢查碼規則的統一編號
+
+    Args:
+        start: 起始號碼（包含）
+        stop: 結束號碼（不包含），最大為 100000000
+        chunk_size: 每次計算的號碼數
+
+    Yields:
+        str: 補零為 8 位數的統一編號，由小到大
+    """
+    start, stop = max(int(start), 0), min(int(stop), 100_000_000)
+    for chunk_start in range(start, stop, chunk_size):
+        numbers = np.arange(chunk_start, min(chunk_start + chunk_size, stop), dtype=np.int64)
+        digits = numbers[:, None] // _REGISTRATION_POWERS % 10
+        for number in numbers[_checksum_valid(digits)].tolist():
+            yield f"{number:08d}"
+
+
+def iter_registration_numbers(source, column=None):
+    """
+    逐行讀取統一編號，不會將整個輸入載入記憶體
+
+    Args:
+        source: 檔案路徑，`-` 表示標準輸入；副檔名為 .gz 時以 gzip 解壓縮，
+            副檔名為 .csv（或 .csv.gz）時以 CSV 格式讀取
+        column: CSV 中統一編號所在的欄位，可為欄位名稱（第一列為標題）或從 0 起算的欄位索引，
+            預設為第一欄
+
+    Yields:
+        str: 去除前後空白的統一編號，空值略過
+    """
+    if source == "-":
+        # 與檔案相同以 utf-8-sig 讀取，從 Excel 匯出後以管線傳入的 BOM 不會留在第一個值中
+        f = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    elif source.endswith(".gz"):
+        f = gzip.open(source, "rt", encoding="utf-8-sig", newline="")
+    else:
+        f = open(source, encoding="utf-8-sig", newline="")
+    try:
+        if source.removesuffix(".gz").endswith(".csv"):
+            reader = csv.reader(f)
+            index = 0
+            if isinstance(column, str) and not column.isdigit():
+                header = next(reader, [])
+                if column not in header:
+                    raise ValueError(
+                        f"{source} 的標題列中沒有欄位 {column!r}，找到的欄位: {header}"
+                    )
+                index = header.index(column)
+            elif column is not None:
+                index = int(column)
+            rows = (row[index] if len(row) > index else "" for row in reader)
+        else:
+            rows = f
+        for value in rows:
+            value = value.strip()
+            if value:
+                yield value
+    finally:
+        if source == "-":
+            # 不關閉標準輸入本身
+            f.detach()
+        else:
+            f.close()
+
+
+class IdBitmap:
+    """
+    以位元記錄 8 位數統一編號的集合
+
+    10^8 個號碼各佔一個位元，固定使用 12.5 MB 記憶體，新增與查詢都是 O(1)，
+    可以存檔後在下次執行載入，記錄已查詢過的統一編號（執行緒安全）。
+    """
+
+    SIZE = 100_000_000
+
+    def __init__(self, data=None):
+        """
+        Args:
+            data: 可選的位元資料（save 寫出的內容），預設為空集合
+        """
+        if data is None:
+            self.bits = bytearray(self.SIZE // 8)
+            self.count = 0
+        else:
+            if len(data) != self.SIZE // 8:
+                raise ValueError(f"位元資料長度應為 {self.SIZE // 8} 位元組，實際為 {len(data)}")
+            self.bits = bytearray(data)
+            array = np.frombuffer(self.bits, dtype=np.uint8)
+            self.count = sum(
+                int(np.unpackbits(array[i : i + (1 << 20)]).sum())
+                for i in range(0, len(array), 1 << 20)
+            )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _position(registration_number):
+        number = int(registration_number)
+        return number >> 3, 1 << (number & 7)
+
+    def __contains__(self, registration_number):
+        index, mask = self._position(registration_number)
+        return bool(self.bits[index] & mask)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, registration_number):
+        """
+        加入一個統一編號
+
+        Returns:
+            bool: 是否為新加入的統一編號
+        """
+        index, mask = self._position(registration_number)
+        with self._lock:
+            if self.bits[index] & mask:
+                return False
+            self.bits[index] |= mask
+            self.count += 1
+            return True
+
+    def discard(self, registration_number):
+        """移除一個統一編號，不存在時不做任何事"""
+        index, mask = self._position(registration_number)
+        with self._lock:
+            if self.bits[index] & mask:
+                self.bits[index] &= ~mask & 0xFF
+                self.count -= 1
+
+    def save(self, path):
+        """寫入檔案，先寫入暫存檔再改名，中途失敗不會破壞既有的檔案"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.part"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        從檔案載入，檔案不存在時回傳空集合
+
+        Args:
+            path: save 寫出的檔案路徑
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+
+def dedupe_registration_numbers(registration_numbers, skip=None):
+    """
+    去除重複的統一編號
+
+    Args:
+        registration_numbers: 8 位數統一編號的可迭代物件
+        skip: 可選的 IdBitmap，其中的統一編號（例如先前已查詢完成的）一律略過
+
+    Yields:
+        str: 第一次出現且不在 skip 中的統一編號，順序與輸入相同
+    """
+    seen = IdBitmap()
+    duplicates = skipped = 0
+    for registration_number in registration_numbers:
+        if skip is not None and registration_number in skip:
+            skipped += 1
+        elif seen.add(registration_number):
+            yield registration_number
+        else:
+            duplicates += 1
+    logging.info(f"已略過 {duplicates} 個重複與 {skipped} 個先前已完成的統一編號")
+
+
+def create_http_session(pool_size=10):
+    """
+    建立 HTTP 快速路徑使用的 requests.Session
+
+    Args:
+        pool_size: 連線池大小，應不小於同時使用此 Session 的執行緒數
+
+    Returns:
+        requests.Session 實例
+    """
+    session = requests.Session()
+    # 只重試尚未送到網站的連線失敗；5xx 與讀取逾時不在 urllib3 中重送，
+    # 否則重送的請求不經過限速器、不計入請求數，AimdController 也看不到網站過載。
+    # 這些失敗由呼叫端記錄後改用瀏覽器查詢。
+    retries = Retry(total=None, connect=2, read=0, status=0, other=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "User-Agent": (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                "AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/120.0.0.0 Safari/537.36"
+            ),
+            "Accept-Language": "zh-TW,zh;q=0.9",
+        }
+    )
+    return session
+
+
+def fetch_company_via_http(
+    registration_number,
+    session,
+    rate_limiter=None,
+    parse_pool=None,
+    timeout=20,
+    snapshots=None,
+):
+    """
+    不經瀏覽器，直接以 HTTP 取得詳細資料頁並交給既有的 extract_* 函數解析
+
+    詳細資料頁缺少任何頁籤內容（例如改由 AJAX 載入）、工廠資料有多頁，
+    或請求失敗時回傳 None，由呼叫端改用瀏覽器查詢。
+
+    Args:
+        registration_number: 公司統一編號
+        session: create_http_session() 建立的 requests.Session
+        rate_limiter: 可選的 RateLimiter
+        parse_pool: 可選的 ParsePool，未提供時在目前執行緒解析
+        timeout: 單次請求的逾時秒數
+        snapshots: 可選的列表，提供時加入取得的 HTML 供封存
+
+    Returns:
+        dict 或 None: 與瀏覽器查詢相同格式的公司資料，無法取得時為 None
+    """
+    try:
+        logging.info(f"以 HTTP 快速路徑取得統一編號 {registration_number} 的詳細資料...")
+        throttle(rate_limiter)
+        # 只計算請求本身的耗時，不含在限速器中等待的時間
+        with metrics.timer("http_detail"):
+            response = session.get(
+                DETAIL_URL_TEMPLATE.format(registration_number), timeout=timeout
+            )
+        if response.status_code != 200:
+            logging.warning(f"HTTP 快速路徑回應狀態碼 {response.status_code}")
+            metrics.count("http_errors", status=str(response.status_code))
+            return None
+        if not response.encoding or response.encoding.lower() == "iso-8859-1":
+            response.encoding = "utf-8"
+        # 整份詳細資料頁同時包含公司基本資料與各頁籤，內容相同的頁面在封存中只保存一次
+        for kind in ("detail", "shareholder", "manager", "branch", "factory"):
+            _snapshot(snapshots, kind, response.text)
+
+        parsed = (parse_pool or inline_parser).parse(
+            response.text,
+            "detail",
+            "tabs_complete",
+            "shareholder",
+            "manager",
+            "branch",
+            "factory",
+            *(f"{kind}_paging" for _, _, _, kind in DETAIL_TABS),
+        )
+        if not parsed["detail"]:
+            logging.info("HTTP 快速路徑的頁面中沒有公司基本資料")
+            return None
+        if not parsed["tabs_complete"]:
+            return None
+
+        # 分頁需要瀏覽器中的查詢狀態，交給瀏覽器處理
+        for name, _, _, kind in DETAIL_TABS:
+            if parsed[f"{kind}_paging"]["pages"] > 1:
+                logging.info(f"{name}有多頁，HTTP 快速路徑不處理分頁")
+                return None
+
+        company_data = {
+            "查詢結果": "成功",
+            "基本資料": {},
+            "詳細基本資料": parsed["detail"],
+            "董監事資料": parsed["shareholder"],
+            "經理人資料": parsed["manager"],
+            "分公司資料": parsed["branch"],
+            "工廠資料": parsed["factory"],
+        }
+        logging.info(f"HTTP 快速路徑成功取得統一編號 {registration_number} 的資料")
+        return company_data
+
+    except requests.RequestException as e:
+        logging.warning(f"HTTP 快速路徑請求失敗: {e}")
+        metrics.count("http_errors", status=type(e).__name__)
+        return None
+
+
+def query_company(
+    registration_number,
+    driver_pool=None,
+    rate_limiter=None,
+    http_session=None,
+    generate_pdf=True,
+    parse_pool=None,
+    use_fragments=None,
+    writer=None,
+    archive=None,
+    pdf_queue=None,
+    profiler=None,
+):
+    """
+    查詢單一公司資料
+    
+    Args:
+        registration_number: 公司統一編號
+        driver_pool: 可選的 DriverPool，提供時從池中借用 driver 並於查詢後歸還，
+            否則為本次查詢單獨啟動一個 Chrome
+        rate_limiter: 可選的 RateLimiter，每次對網站發出請求前先取得令牌
+        http_session: 可選的 requests.Session，提供且不需產生 PDF 時，
+            先以 HTTP 直接抓取詳細資料頁，失敗時才改用瀏覽器
+        generate_pdf: 是否使用友善列印功能產生 PDF
+        parse_pool: 可選的 ParsePool，提供時 HTML 解析在子行程進行，
+            瀏覽器可以同時繼續操作下一個頁籤
+        use_fragments: 是否只取回各頁籤容器的 HTML，預設依環境變數 FINDBIZ_FRAGMENT_MODE
+        writer: 可選的 DatabaseWriter，提供時資料交由背景寫入，否則直接寫入資料庫
+        archive: 可選的 HtmlArchive，提供時保存本次查詢取得的所有原始 HTML
+        pdf_queue: 可選的 PdfRenderQueue，提供且需要 PDF 時，查詢成功後交由背景佇列產生 PDF，
+            擷取資料本身不再需要瀏覽器產生 PDF
+        profiler: 可選的 Profiler，此統一編號需要剖析時以 cProfile 與 tracemalloc 記錄整個查詢，
+            預設依環境變數 FINDBIZ_PROFILE_IDS 與 FINDBIZ_PROFILE_SAMPLE_RATE
+        
+    Returns:
+        dict 或 None: 公司資料或 None (如果查詢失敗)
+    """
+    with (profiler or default_profiler).profile(registration_number):
+        return _query_company(
+            registration_number,
+            driver_pool,
+            rate_limiter,
+            http_session,
+            generate_pdf,
+            parse_pool,
+            use_fragments,
+            writer,
+            archive,
+            pdf_queue,
+        )
+
+
+def _query_company(
+    registration_number,
+    driver_pool,
+    rate_limiter,
+    http_session,
+    generate_pdf,
+    parse_pool,
+    use_fragments,
+    writer,
+    archive,
+    pdf_queue,
+):
+    """query_company 的查詢流程本身"""
+    # 確認統一編號格式正確
+    if not registration_number.isdigit() or len(registration_number) != 8:
+        logging.error(f"統一編號 {registration_number} 格式不正確，應為8位數字")
+        return {"查詢結果": "統一編號格式錯誤"}
+
+    # 不符合檢查碼規則的統一編號不可能存在，不必開啟瀏覽器查詢
+    if not is_valid_registration_number(registration_number):
+        logging.error(f"統一編號 {registration_number} 不符合檢查碼規則")
+        return {"查詢結果": "統一編號格式錯誤"}
+
+    snapshots = [] if archive is not None else None
+    inline_pdf = generate_pdf and pdf_queue is None
+
+    # 不需要在查詢中產生 PDF 時先嘗試不經瀏覽器的 HTTP 快速路徑
+    if http_session is not None and not inline_pdf:
+        company_data = fetch_company_via_http(
+            registration_number,
+            http_session,
+            rate_limiter=rate_limiter,
+            parse_pool=parse_pool,
+            snapshots=snapshots,
+        )
+        if company_data:
+            save_company_data(company_data, registration_number, writer)
+            _archive_snapshots(archive, registration_number, snapshots, company_data, "http")
+            _queue_pdf(pdf_queue, generate_pdf, registration_number, company_data)
+            return company_data
+        logging.info(f"統一編號 {registration_number} 無法透過 HTTP 快速路徑取得，改用瀏覽器查詢")
+        if snapshots:
+            snapshots.clear()
+
+    if use_fragments is None:
+        use_fragments = USE_FRAGMENTS
+    company_data = _query_company_with_browser(
+        registration_number,
+        driver_pool,
+        rate_limiter,
+        inline_pdf,
+        parse_pool,
+        use_fragments,
+        writer,
+        snapshots,
+    )
+    _archive_snapshots(archive, registration_number, snapshots, company_data, "browser")
+    _queue_pdf(pdf_queue, generate_pdf, registration_number, company_data)
+    return company_data
+
+
+def _queue_pdf(pdf_queue, generate_pdf, registration_number, company_data):
+    """查詢成功且需要 PDF 時排入背景PDF產生佇列"""
+    if pdf_queue is None or not generate_pdf:
+        return
+    if company_data and company_data.get("查詢結果") == "成功":
+        pdf_queue.submit(registration_number, company_fingerprint(company_data))
+
+
+def _archive_snapshots(archive, registration_number, snapshots, company_data, source):
+    """將查詢取得的頁面寫入封存，封存失敗不影響查詢結果"""
+    if archive is None or not snapshots:
+        return
+    try:
+        archive.record(
+            registration_number,
+            snapshots,
+            (company_data or {}).get("查詢結果", "未知"),
+            source,
+        )
+    except Exception as e:
+        logging.warning(f"封存統一編號 {registration_number} 的原始 HTML 失敗: {e}")
+
+
+def _page_html(driver, container_id, use_fragments):
+    """取得解析所需的 HTML：片段模式只取回指定容器，否則取回整份 page_source"""
+    if use_fragments:
+        return fetch_fragments(driver, [container_id])[container_id]
+    return driver.page_source
+
+
+# 記錄頁面發出的 XHR、fetch 與表單送出；存在 sessionStorage 中，換頁造成整頁跳轉後仍可讀取
+_PAGING_CAPTURE_SCRIPT = """
+var KEY = '__findbizPagingRequests';
+if (!window.__findbizPagingHook) {
+    window.__findbizPagingHook = true;
+    var record = function (method, url, body, xhr) {
+        try {
+            method = (method || 'GET').toUpperCase();
+            url = new URL(url, location.href).href;
+            if (method === 'GET' && typeof body === 'string' && body) {
+                url += (url.indexOf('?') < 0 ? '?' : '&') + body;
+                body = null;
+            }
+            var list = JSON.parse(sessionStorage.getItem(KEY) || '[]');
+            list.push({method: method, url: url, xhr: xhr,
+                       body: typeof body === 'string' ? body : null});
+            sessionStorage.setItem(KEY, JSON.stringify(list.slice(-20)));
+        } catch (e) {}
+    };
+    var open = XMLHttpRequest.prototype.open;
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__findbizRequest = [method, url];
+        return open.apply(this, arguments);
+    };
+    XMLHttpRequest.prototype.send = function (body) {
+        if (this.__findbizRequest) {
+            record(this.__findbizRequest[0], this.__findbizRequest[1], body, true);
+        }
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function (input, init) {
+            record((init && init.method) || 'GET',
+                   typeof input === 'string' ? input : input.url,
+                   init && init.body, true);
+            return originalFetch.apply(this, arguments);
+        };
+    }
+    var serialize = function (form) {
+        return new URLSearchParams(new FormData(form)).toString();
+    };
+    var submit = HTMLFormElement.prototype.submit;
+    HTMLFormElement.prototype.submit = function () {
+        record(this.method, this.action, serialize(this), false);
+        return submit.apply(this, arguments);
+    };
+    document.addEventListener('submit', function (event) {
+        record(event.target.method, event.target.action, serialize(event.target), false);
+    }, true);
+}
+sessionStorage.removeItem(KEY);
+"""
+
+_PAGING_REQUESTS_SCRIPT = """
+return JSON.parse(sessionStorage.getItem('__findbizPagingRequests') || '[]');
+"""
+
+# 在瀏覽器中同時重送多個換頁請求，沿用瀏覽器的 cookie 與查詢狀態
+_PAGING_FETCH_SCRIPT = """
+var requests = arguments[0];
+var done = arguments[arguments.length - 1];
+Promise.all(requests.map(function (request) {
+    var headers = {};
+    if (request.xhr) {
+        headers['X-Requested-With'] = 'XMLHttpRequest';
+    }
+    if (request.method !== 'GET') {
+        headers['Content-Type'] = 'application/x-www-form-urlencoded; charset=UTF-8';
+    }
+    return fetch(request.url, {
+        method: request.method,
+        body: request.method === 'GET' ? undefined : request.body,
+        headers: headers,
+        credentials: 'same-origin'
+    }).then(function (response) {
+        if (!response.ok) {
+            throw new Error('HTTP ' + response.status);
+        }
+        return response.text();
+    });
+})).then(function (pages) {
+    done({pages: pages});
+}, function (error) {
+    done({error: String(error)});
+});
+"""
+
+# 頁籤頁面提供的換頁函數
+PAGING_FUNCTIONS = {"factory": "gotoPageFact"}
+
+# 同時重送的換頁請求數
+PAGING_CONCURRENCY = int(os.environ.get("FINDBIZ_PAGING_CONCURRENCY", "4"))
+
+
+def find_paging_request(requests, page_num):
+    """
+    從頁面換頁時發出的請求中找出換頁請求，並找出哪一個參數是頁碼
+
+    Args:
+        requests: _PAGING_REQUESTS_SCRIPT 取回的請求列表
+        page_num: 換頁的目標頁碼
+
+    Returns:
+        dict 或 None: 請求內容加上 "location"（頁碼參數在 "url" 或 "body"）與 "param"（參數名稱）
+    """
+    page_value = str(page_num)
+    for request in reversed(requests):
+        candidates = []
+        for location in ("body", "url"):
+            query = request.get("body") if location == "body" else urlsplit(request["url"]).query
+            for key, value in parse_qsl(query or "", keep_blank_values=True):
+                if value == page_value:
+                    candidates.append((location, key))
+        if candidates:
+            # 同時有多個參數等於頁碼時，名稱含有 page 的最可能是頁碼
+            candidates.sort(key=lambda candidate: "page" not in candidate[1].lower())
+            location, param = candidates[0]
+            return {**request, "location": location, "param": param}
+    return None
+
+
+def build_paging_request(template, page_num):
+    """以 find_paging_request() 找到的換頁請求為範本，產生指定頁碼的請求"""
+
+    def replace(query):
+        return urlencode(
+            [
+                (key, str(page_num) if key == template["param"] else value)
+                for key, value in parse_qsl(query or "", keep_blank_values=True)
+            ]
+        )
+
+    if template["location"] == "body":
+        return {**template, "body": replace(template["body"])}
+    parts = urlsplit(template["url"])
+    return {**template, "url": urlunsplit(parts._replace(query=replace(parts.query)))}
+
+
+def _wrap_fragment(html, container_id):
+    """換頁請求只回傳頁籤內容時，補上容器讓 extract_* 函數可以找到表格"""
+    if f'id="{container_id}"' in html or f"id='{container_id}'" in html:
+        return html
+    return f'<div id="{container_id}">{html}</div>'
+
+
+class TabPaginator:
+    """
+    詳細資料頁各頁籤共用的分頁擷取
+
+    第 2 頁以點擊頁碼（或頁面提供的換頁函數）取得，同時記錄頁面為換頁發出的請求；
+    其餘頁面直接在瀏覽器中重送該請求，一次同時取回多頁，不再逐頁點擊並等待表格重繪。
+    無法重送時改回逐頁點擊。
+    """
+
+    def __init__(
+        self,
+        driver,
+        rate_limiter,
+        parser,
+        use_fragments,
+        concurrency=None,
+        snapshots=None,
+    ):
+        """
+        Args:
+            driver: 已停在詳細資料頁且已切換到目標頁籤的 WebDriver
+            rate_limiter: 可選的 RateLimiter，每一頁都計入一次請求
+            parser: ParsePool
+            use_fragments: 是否只取回頁籤容器的 HTML
+            concurrency: 同時重送的換頁請求數，預設讀取環境變數 FINDBIZ_PAGING_CONCURRENCY
+            snapshots: 可選的列表，提供時加入取得的各頁 HTML 供封存
+        """
+        self.driver = driver
+        self.rate_limiter = rate_limiter
+        self.parser = parser
+        self.use_fragments = use_fragments
+        self.concurrency = max(concurrency or PAGING_CONCURRENCY, 1)
+        self.snapshots = snapshots
+
+    def _submit(self, kind, html, page_num):
+        _snapshot(self.snapshots, kind, html, page_num)
+        return self.parser.submit(html, kind)
+
+    def fetch_pages(self, name, container_id, kind, page_count):
+        """
+        取得第 2 頁到最後一頁並交給解析階段
+
+        任何一頁發生錯誤時停止，回傳在此之前已取得的各頁。
+
+        Returns:
+            list: 依頁碼排序的 (頁碼, Future)，Future 的結果為 parse_page() 的回傳值
+        """
+        try:
+            self.driver.execute_script(_PAGING_CAPTURE_SCRIPT)
+        except WebDriverException as e:
+            logging.warning(f"無法記錄{name}的換頁請求: {e}")
+
+        pending = []
+        html = self._goto_page_safely(name, container_id, kind, 2)
+        if html is None:
+            return pending
+        pending.append((2, self._submit(kind, html, 2)))
+
+        next_page = 3
+        if page_count > 2:
+            template = None
+            try:
+                template = find_paging_request(
+                    self.driver.execute_script(_PAGING_REQUESTS_SCRIPT) or [], 2
+                )
+            except WebDriverException as e:
+                logging.warning(f"無法取得{name}的換頁請求: {e}")
+
+            if template is not None:
+                replayed, next_page = self._replay(
+                    name, template, container_id, kind, range(3, page_count + 1)
+                )
+                pending.extend(replayed)
+            else:
+                logging.info(f"找不到{name}的換頁請求，改為逐頁點擊")
+
+        # 重送換頁請求不會改變瀏覽器顯示的頁面，此時瀏覽器仍停在第 2 頁
+        current_page = 2
+        for page_num in range(next_page, page_count + 1):
+            # 分頁列只顯示目前頁附近的頁碼，目標頁不在分頁列中且沒有換頁函數時逐頁往後點擊
+            while (
+                current_page < page_num - 1
+                and kind not in PAGING_FUNCTIONS
+                and not self._has_page_link(container_id, page_num)
+            ):
+                if self._goto_page_safely(name, container_id, kind, current_page + 1) is None:
+                    return pending
+                current_page += 1
+            html = self._goto_page_safely(name, container_id, kind, page_num)
+            if html is None:
+                break
+            current_page = page_num
+            pending.append((page_num, self._submit(kind, html, page_num)))
+        return pending
+
+    def _has_page_link(self, container_id, page_num):
+        """頁籤的分頁列中是否有指定頁碼的連結"""
+        try:
+            links = self.driver.find_elements(By.XPATH, self._page_link_xpath(container_id, page_num))
+        except WebDriverException:
+            return False
+        return bool(links)
+
+    @staticmethod
+    def _page_link_xpath(container_id, page_num):
+        return (
+            f"//*[@id='{container_id}']//ul[contains(@class, 'pagination')]"
+            f"/li/a[normalize-space(text())='{page_num}']"
+        )
+
+    def _goto_page_safely(self, name, container_id, kind, page_num):
+        """同 _goto_page，發生錯誤時記錄並回傳 None"""
+        try:
+            return self._goto_page(name, container_id, kind, page_num)
+        except Exception as e:
+            logging.warning(f"切換到{name}第 {page_num} 頁時發生錯誤: {e}")
+            return None
+
+    def _replay(self, name, template, container_id, kind, page_nums):
+        """
+        以換頁請求範本分批同時取回多頁
+
+        Returns:
+            tuple: ((頁碼, Future) 列表, 下一個尚未取得的頁碼)
+        """
+        page_nums = list(page_nums)
+        pending = []
+        for start in range(0, len(page_nums), self.concurrency):
+            chunk = page_nums[start : start + self.concurrency]
+            logging.info(f"同時取得{name}第 {chunk[0]}-{chunk[-1]} 頁...")
+            for _ in chunk:
+                throttle(self.rate_limiter)
             try:
-                downloads_dir = create_output_directory()  # 不傳入參數，只獲取downloads資料夾路徑
-                pdf_filename = os.path.join(
-                    downloads_dir, f"company_{registration_number}_complete.pdf"
+                with metrics.timer(f"{kind}_page_replay"):
+                    result = self.driver.execute_async_script(
+                        _PAGING_FETCH_SCRIPT,
+                        [build_paging_request(template, page_num) for page_num in chunk],
+                    )
+            except WebDriverException as e:
+                result = {"error": str(e)}
+            if not result or result.get("error"):
+                logging.warning(
+                    f"重送{name}換頁請求失敗，改為逐頁點擊: {(result or {}).get('error')}"
                 )
-                pdf_result = print_friendly_to_pdf(driver, pdf_filename)
-                if pdf_result:
-                    company_data["PDF路徑"] = pdf_filename
-                    logging.info(f"成功生成PDF: {pdf_filename}")
-                else:
-                    logging.warning(f"生成PDF失敗")
+                return pending, chunk[0]
+
+            pages = [_wrap_fragment(html, container_id) for html in result["pages"]]
+            futures = [self.parser.submit(html, kind) for html in pages]
+            # 回應中沒有資料表格（例如回傳的不是 HTML）時，從該頁起改為逐頁點擊
+            for page_num, html, future in zip(chunk, pages, futures):
+                try:
+                    rows = future.result()[kind]
+                except Exception as e:
+                    logging.warning(f"解析{name}第 {page_num} 頁的換頁回應時發生錯誤: {e}")
+                    rows = None
+                if not rows:
+                    logging.warning(f"{name}第 {page_num} 頁的換頁回應中沒有資料，改為逐頁點擊")
+                    return pending, page_num
+                _snapshot(self.snapshots, kind, html, page_num)
+                pending.append((page_num, future))
+        return pending, page_nums[-1] + 1
+
+    def _goto_page(self, name, container_id, kind, page_num):
+        """以瀏覽器操作切換到指定頁，回傳該頁的 HTML，無法切換時回傳 None"""
+        with metrics.timer(f"{kind}_page"):
+            return self._click_page(name, container_id, kind, page_num)
+
+    def _click_page(self, name, container_id, kind, page_num):
+        logging.info(f"提取{name}第 {page_num} 頁...")
+        selector = f"#{container_id} .table-responsive table.table"
+        # 記下目前表格內容，換頁後等待表格換成新的一頁
+        previous_signature = table_signature(self.driver, selector)
+
+        clicked = False
+        # 方法1: 點擊頁籤分頁列中的頁碼
+        try:
+            page_link = self.driver.find_element(
+                By.XPATH, self._page_link_xpath(container_id, page_num)
+            )
+            throttle(self.rate_limiter)
+            self.driver.execute_script("arguments[0].click();", page_link)
+            clicked = True
+        except Exception as e:
+            logging.warning(f"無法通過數字點擊{name}第 {page_num} 頁: {e}")
+
+        # 方法2: 直接呼叫頁面提供的換頁函數，例如 gotoPageFact
+        function = PAGING_FUNCTIONS.get(kind)
+        if not clicked and function:
+            try:
+                logging.info(f"嘗試使用 {function} 函數切換到第 {page_num} 頁...")
+                throttle(self.rate_limiter)
+                self.driver.execute_script(f"{function}({page_num});")
+                clicked = True
             except Exception as e:
-                logging.error(f"生成PDF時發生錯誤: {e}")
+                logging.warning(f"無法使用 {function} 函數: {e}")
+
+        if not clicked:
+            logging.error(f"無法切換到{name}第 {page_num} 頁，嘗試了所有可能的方法")
+            return None
+
+        try:
+            wait_engine.wait(
+                self.driver,
+                f"{kind}_page",
+                wait_engine.table_stable(selector, previous=previous_signature),
+            )
+        except TimeoutException:
+            logging.warning(f"等待{name}第 {page_num} 頁表格超時")
+            return None
+        return _page_html(self.driver, container_id, self.use_fragments)
+
+
+def _search_company(driver, registration_number, rate_limiter):
+    """
+    在查詢頁面同意條款、輸入統一編號並等待搜尋結果
+
+    Returns:
+        dict 或 None: 搜尋成功時為 None，否則為包含「查詢結果」的失敗結果
+    """
+    # 步驟 1: 前往搜尋頁面（從連線池借出的 driver 已停在搜尋頁面）
+    if not driver.current_url.startswith(QUERY_INIT_URL):
+        logging.info("前往網站...")
+        throttle(rate_limiter)
+        with metrics.timer("query_init"):
+            driver.get(QUERY_INIT_URL)
+
+    # 等待頁面加載
+    wait = WebDriverWait(driver, 20)
+
+    # 檢查是否需要同意條款
+    agree_started = time.monotonic()
+    try:
+        agree_button = wait.until(EC.element_to_be_clickable((By.ID, "agree")))
+        logging.info("點擊同意按鈕...")
+        agree_button.click()
+    except (TimeoutException, NoSuchElementException):
+        logging.info("無需點擊同意按鈕")
+    finally:
+        metrics.observe("agree", time.monotonic() - agree_started)
+
+    # 輸入統一編號
+    logging.info("等待輸入欄位...")
+    try:
+        input_el = wait.until(EC.element_to_be_clickable((By.ID, "qryCond")))
+        input_el.clear()
+        input_el.send_keys(registration_number)
+    except TimeoutException:
+        logging.error("無法找到輸入欄位")
+
+        return {"查詢結果": "無法找到輸入欄位"}
+
+    # 點擊查詢按鈕
+    logging.info("點擊查詢按鈕...")
+    try:
+        search_button = driver.find_element(By.ID, "qryBtn")
+        throttle(rate_limiter)
+        driver.execute_script("arguments[0].click();", search_button)
+    except NoSuchElementException:
+        logging.error("無法找到查詢按鈕")
+
+        return {"查詢結果": "無法找到查詢按鈕"}
+
+    # 等待結果頁面加載，網站顯示查無資料時不必等到逾時
+    search_started = time.monotonic()
+    try:
+        logging.info("等待結果面板...")
+        wait_engine.wait(
+            driver,
+            "search_result",
+            EC.any_of(
+                wait_engine.element_ready((By.CSS_SELECTOR, ".panel-heading")),
+                EC.visibility_of_element_located(NOT_FOUND_LOCATOR),
+            ),
+        )
+        if not driver.find_elements(By.CSS_SELECTOR, ".panel-heading"):
+            logging.info(f"統一編號 {registration_number} 查無符合資料")
+            return {"查詢結果": "查無符合資料"}
+    except TimeoutException:
+        # 檢查是否顯示「查無資料」的訊息
+        if is_company_not_found(driver):
+            logging.info(f"統一編號 {registration_number} 查無符合資料")
+            return {"查詢結果": "查無符合資料"}
+
+        logging.error("等待結果面板超時")
+
+        return {"查詢結果": "查詢超時，無結果"}
+    finally:
+        metrics.observe("search", time.monotonic() - search_started)
+    return None
+
+
+def _open_detail_link(driver, registration_number, rate_limiter):
+    """
+    在搜尋結果頁以多種方法點擊詳細資料連結，都失敗時直接前往詳細資料頁網址
+
+    Returns:
+        float: 取得限速器令牌、實際送出請求時的 time.monotonic()，用來計算頁面載入時間
+    """
+    wait = WebDriverWait(driver, 20)
+    logging.info("尋找詳細資料連結...")
+
+    # 方法1: 透過類別選擇器，方法2: 透過文字內容
+    locators = [
+        (By.CSS_SELECTOR, "span.moreLinkMouseOut"),
+        (By.XPATH, "//span[contains(text(), '詳細資料')]"),
+    ]
+    for method, locator in enumerate(locators, 1):
+        try:
+            detail_span = wait.until(EC.element_to_be_clickable(locator))
+            logging.info(f"點擊詳細資料連結(方法{method})...")
+            throttle(rate_limiter)
+            requested_at = time.monotonic()
+            driver.execute_script("arguments[0].click();", detail_span)
+            return requested_at
+        except Exception as e:
+            logging.warning(f"方法{method}點擊詳細資料連結失敗: {e}")
+
+    # 方法3: 直接透過詳細資料頁URL進入
+    logging.info("嘗試透過直接訪問URL獲取詳細資料(方法3)...")
+    throttle(rate_limiter)
+    requested_at = time.monotonic()
+    driver.get(DETAIL_URL_TEMPLATE.format(registration_number))
+    return requested_at
+
+
+def _query_company_with_browser(
+    registration_number,
+    driver_pool,
+    rate_limiter,
+    generate_pdf,
+    parse_pool,
+    use_fragments,
+    writer,
+    snapshots=None,
+):
+    """
+    以 Selenium 操作查詢頁面取得公司資料，參數同 query_company
+
+    snapshots 不為 None 時，解析過的每份 HTML 會以 (kind, page, html) 加入其中。
+    """
+    parser = parse_pool or inline_parser
+    driver = None
+    driver_reusable = True
+    try:
+        with metrics.timer("driver_setup"):
+            driver = driver_pool.acquire() if driver_pool else setup_driver()
+        if not driver:
+            logging.error("無法設置 WebDriver")
+            return {"查詢結果": "WebDriver 設置失敗"}
+
+        # 步驟 1 到 3: 同意條款、輸入統一編號並等待搜尋結果
+        failure = _search_company(driver, registration_number, rate_limiter)
+        if failure is not None:
+            return failure
+        wait = WebDriverWait(driver, 20)
+
+        # 嘗試提取基本資料
+        logging.info("先提取搜尋結果頁的基本資訊...")
+        search_html = _page_html(driver, "vParagraph", use_fragments)
+        _snapshot(snapshots, "search", search_html)
+        basic_info = parser.parse(search_html, "search")["search"]
         
+        # 檢查是否找到任何基本資訊
+        if not basic_info or len(basic_info) == 0:
+            if is_company_not_found(driver):
+                logging.info(f"統一編號 {registration_number} 查無符合資料")
+                return {"查詢結果": "查無符合資料"}
+            
+            logging.warning("無法從搜尋結果頁提取基本資訊")
+
+        detail_started = _open_detail_link(driver, registration_number, rate_limiter)
+
+        # 等待詳細資料頁面加載
+        logging.info("等待詳細資料頁面加載...")
+        detail_page_loaded = False
+        try:
+            # 等待頁籤與公司基本資料表格加載完成
+            wait.until(EC.presence_of_element_located((By.ID, "tabCmpy")))
+            wait_engine.wait(
+                driver, "detail_page", wait_engine.table_stable("#tabCmpyContent table.table")
+            )
+            detail_page_loaded = True
+        except TimeoutException:
+            # 檢查是否顯示「查無資料」的訊息
+            if is_company_not_found(driver):
+                logging.info(f"統一編號 {registration_number} 查無符合資料")
+                
+            logging.error("無法加載詳細資料頁面，可能頁面結構已更改或網站無回應")
+            # 如果無法加載詳細資料頁面，則只返回基本資訊
+            if basic_info and len(basic_info) > 0:
+                return {"查詢結果": "僅獲取基本資訊", "基本資料": basic_info}
+            else:
+                return {"查詢結果": "無法獲取詳細資料"}
+        finally:
+            metrics.observe("detail_page", time.monotonic() - detail_started)
+
+        # 步驟 4: 提取公司的各種資訊
+        company_data = {}
+        company_data["查詢結果"] = "成功"
+        company_data["基本資料"] = basic_info  # 保留搜尋結果頁的基本資訊
+
+        # 只有在成功加載詳細資料頁面後，才繼續提取資訊
+        if detail_page_loaded:
+            # 提取詳細頁的基本資料
+            logging.info("提取公司詳細基本資料...")
+            detail_html = _page_html(driver, "tabCmpyContent", use_fragments)
+            _snapshot(snapshots, "detail", detail_html)
+            company_data["詳細基本資料"] = parser.parse(detail_html, "detail")["detail"]
+            
+            # 檢查詳細基本資料是否為空
+            if not company_data["詳細基本資料"] or len(company_data["詳細基本資料"]) == 0:
+                logging.warning("無法提取詳細基本資料")
+                company_data["查詢結果"] = "詳細資料提取失敗"
+                return company_data
+
+            # 依序點擊各頁籤並等待表格載入完成
+            tab_html = {}
+            for name, tab_id, container_id, kind in DETAIL_TABS:
+                tab_started = time.monotonic()
+                try:
+                    logging.info(f"提取{name}...")
+                    tab = driver.find_element(By.ID, tab_id)
+                    throttle(rate_limiter)
+                    driver.execute_script("arguments[0].click();", tab)
+
+                    # 等待頁籤資料加載
+                    try:
+                        wait_engine.wait(
+                            driver,
+                            tab_id,
+                            wait_engine.table_stable(f"#{container_id} table.table"),
+                        )
+                    except TimeoutException:
+                        logging.warning(f"等待{name}表格超時")
+
+                    if not use_fragments:
+                        tab_html[name] = driver.page_source
+                except Exception as e:
+                    logging.error(f"提取{name}時發生錯誤: {e}")
+                    company_data[name] = []
+                finally:
+                    metrics.observe(f"{kind}_tab", time.monotonic() - tab_started)
+
+            # 片段模式：以單次指令取回所有頁籤容器的 HTML
+            if use_fragments:
+                try:
+                    fragments = fetch_fragments(
+                        driver, [container_id for _, _, container_id, _ in DETAIL_TABS]
+                    )
+                    for name, _, container_id, _ in DETAIL_TABS:
+                        if name not in company_data:
+                            tab_html[name] = fragments[container_id]
+                except Exception as e:
+                    logging.error(f"取得頁籤內容時發生錯誤: {e}")
+
+            # 各頁籤的 HTML 交給解析階段處理，同時取得分頁資訊
+            pending_tabs = {}
+            parse_seconds = {}
+            for name, _, _, kind in DETAIL_TABS:
+                if name in tab_html:
+                    _snapshot(snapshots, kind, tab_html[name])
+                    parse_started = time.monotonic()
+                    pending_tabs[name] = parser.submit(tab_html[name], kind, f"{kind}_paging")
+                    parse_seconds[name] = time.monotonic() - parse_started
+
+            # 依序收集各頁籤第一頁的解析結果，有多頁的頁籤切換回該頁籤後取得其餘各頁
+            paginator = TabPaginator(
+                driver, rate_limiter, parser, use_fragments, snapshots=snapshots
+            )
+            for name, tab_id, container_id, kind in DETAIL_TABS:
+                if name not in pending_tabs:
+                    continue
+                try:
+                    # 記錄查詢執行緒花在解析（或等待解析結果）上的時間
+                    parse_started = time.monotonic()
+                    parsed = pending_tabs[name].result()
+                    metrics.observe(
+                        f"{kind}_parse", parse_seconds[name] + time.monotonic() - parse_started
+                    )
+                    company_data[name] = parsed[kind]
+                    paging = parsed[f"{kind}_paging"]
+                except Exception as e:
+                    logging.error(f"解析{name}時發生錯誤: {e}")
+                    company_data[name] = []
+                    continue
+
+                if paging["pages"] <= 1:
+                    continue
+                logging.info(f"{name}共 {paging['pages']} 頁")
+                try:
+                    tab = driver.find_element(By.ID, tab_id)
+                    throttle(rate_limiter)
+                    driver.execute_script("arguments[0].click();", tab)
+                    wait_engine.wait(
+                        driver,
+                        tab_id,
+                        wait_engine.table_stable(f"#{container_id} table.table"),
+                    )
+                    pages = paginator.fetch_pages(name, container_id, kind, paging["pages"])
+                except Exception as e:
+                    logging.warning(f"提取{name}分頁時發生錯誤: {e}")
+                    pages = []
+
+                # 依頁碼順序收集其餘各頁的解析結果
+                for page_num, future in pages:
+                    try:
+                        company_data[name].extend(future.result()[kind])
+                    except Exception as e:
+                        logging.warning(f"解析{name}第 {page_num} 頁時發生錯誤: {e}")
+                if paging["total"] is not None and len(company_data[name]) < paging["total"]:
+                    logging.warning(
+                        f"{name}共 {paging['total']} 筆，只取得 {len(company_data[name])} 筆"
+                    )
+
+            # 使用網頁的友善列印功能生成PDF
+            if generate_pdf:
+                try:
+                    pdf_store = PdfStore()
+                    fingerprint = company_fingerprint(company_data)
+                    if pdf_store.is_current(registration_number, fingerprint):
+                        # 資料與產生目前PDF時相同，不需重新產生
+                        company_data["PDF路徑"] = pdf_store.pdf_path(registration_number)
+                        logging.info(f"資料未變更，沿用既有PDF: {company_data['PDF路徑']}")
+                    else:
+                        staged_path = pdf_store.staging_path(registration_number)
+                        throttle(rate_limiter)
+                        start = time.monotonic()
+                        pdf_result = print_friendly_to_pdf(driver, staged_path)
+                        metrics.observe("pdf_render", time.monotonic() - start)
+                        if pdf_result:
+                            pdf_filename = pdf_store.commit(
+                                registration_number,
+                                fingerprint,
+                                staged_path,
+                                time.monotonic() - start,
+                            )
+                            company_data["PDF路徑"] = pdf_filename
+                            logging.info(f"成功生成PDF: {pdf_filename}")
+                        else:
+                            logging.warning(f"生成PDF失敗")
+                except Exception as e:
+                    logging.error(f"生成PDF時發生錯誤: {e}")
+
         # 判斷是否成功獲取到有意義的資料
         if company_data.get("詳細基本資料") and len(company_data.get("詳細基本資料", {})) > 0:
-            # 保存資料到資料庫
-            try:
-                save_to_database(company_data, registration_number)
-                logging.info(f"統一編號 {registration_number} 的資料已成功保存到資料庫")
-            except Exception as e:
-                logging.error(f"保存資料到資料庫時發生錯誤: {e}")
-                company_data["資料庫保存結果"] = "失敗"
-            
-            # 記錄查詢成功
-            logging.info(f"成功提取統一編號為 {registration_number} 的公司詳細資料")
-            
+            save_company_data(company_data, registration_number, writer)
             return company_data
         else:
             if basic_info and len(basic_info) > 0:
@@ -1139,12 +4302,36 @@ def query_company(registration_number):
 
     except Exception as e:
         logging.error(f"查詢過程中發生未預期錯誤: {e}")
+        # 瀏覽器層級的錯誤代表 driver 可能已損壞，不放回連線池
+        if isinstance(e, WebDriverException):
+            driver_reusable = False
 
         return {"查詢結果": "發生錯誤", "錯誤訊息": str(e)}
 
     finally:
         if driver:
-            driver.quit()
+            if driver_pool:
+                driver_pool.release(driver, reusable=driver_reusable)
+            else:
+                driver.quit()
+
+
+def save_company_data(company_data, registration_number, writer=None):
+    """保存查詢成功的公司資料到資料庫，失敗時在 company_data 中標記"""
+    try:
+        if writer is not None:
+            writer.submit(company_data, registration_number)
+            logging.info(f"統一編號 {registration_number} 的資料已排入資料庫寫入佇列")
+        else:
+            save_to_database(company_data, registration_number)
+            logging.info(f"統一編號 {registration_number} 的資料已成功保存到資料庫")
+    except Exception as e:
+        logging.error(f"保存資料到資料庫時發生錯誤: {e}")
+        company_data["資料庫保存結果"] = "失敗"
+
+    # 記錄查詢成功
+    logging.info(f"成功提取統一編號為 {registration_number} 的公司詳細資料")
+
 
 def is_company_not_found(driver):
     """
@@ -1171,8 +4358,7 @@ def is_company_not_found(driver):
                 
         # 也可以嘗試透過 XPath 或 CSS 選擇器找具體元素
         try:
-            error_element = driver.find_element(By.XPATH, 
-                "//div[contains(text(), '查無') or contains(text(), '無此統一編號')]")
+            error_element = driver.find_element(*NOT_FOUND_LOCATOR)
             if error_element:
                 return True
         except NoSuchElementException:
@@ -1184,6 +4370,97 @@ def is_company_not_found(driver):
         return False
 
 
+_RECORD_NOT_FOUND_SQL = """
+    INSERT INTO not_found_cache (registration_number)
+    VALUES %s
+    ON CONFLICT (registration_number) DO UPDATE
+       SET checked_at = CURRENT_TIMESTAMP,
+           hits = not_found_cache.hits + 1
+"""
+
+_CACHED_NOT_FOUND_SQL = text(
+    """
+    SELECT registration_number
+      FROM not_found_cache
+     WHERE registration_number = ANY(:numbers)
+       AND checked_at > CURRENT_TIMESTAMP - :ttl_days * INTERVAL '1 day'
+"""
+)
+
+
+def record_not_found(registration_numbers):
+    """
+    將查無符合資料的統一編號記入快取，已存在時更新查詢時間
+
+    Args:
+        registration_numbers: 統一編號的可迭代物件
+    """
+    rows = [(number,) for number in dict.fromkeys(registration_numbers)]
+    if not rows:
+        return
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        execute_values(cursor, _RECORD_NOT_FOUND_SQL, rows)
+
+
+def cached_not_found(registration_numbers, ttl_days=None):
+    """
+    查詢哪些統一編號在有效期限內被記為查無符合資料
+
+    Args:
+        registration_numbers: 統一編號列表
+        ttl_days: 快取有效天數，預設依環境變數 FINDBIZ_NOT_FOUND_TTL_DAYS
+
+    Returns:
+        set: 仍在有效期限內的統一編號
+    """
+    if ttl_days is None:
+        ttl_days = NOT_FOUND_TTL_DAYS
+    if not registration_numbers or ttl_days <= 0:
+        return set()
+    with engine.connect() as conn:
+        rows = conn.execute(
+            _CACHED_NOT_FOUND_SQL,
+            {"numbers": list(registration_numbers), "ttl_days": ttl_days},
+        )
+        return {row.registration_number for row in rows}
+
+
+def skip_cached_not_found(registration_numbers, ttl_days=None, on_skip=None, chunk_size=500):
+    """
+    略過快取中仍在有效期限內的查無資料統一編號
+
+    輸入依 chunk_size 分段向資料庫查詢，因此可以是不會一次載入記憶體的產生器。
+
+    Args:
+        registration_numbers: 統一編號的可迭代物件
+        ttl_days: 快取有效天數，預設依環境變數 FINDBIZ_NOT_FOUND_TTL_DAYS
+        on_skip: 可選的回呼函數 on_skip(統一編號)，每略過一個統一編號時呼叫
+        chunk_size: 每次向資料庫查詢的筆數
+
+    Yields:
+        str: 需要查詢的統一編號，順序與輸入相同
+    """
+    chunk = []
+
+    def flush():
+        cached = cached_not_found(chunk, ttl_days)
+        for number in chunk:
+            if number in cached:
+                if on_skip is not None:
+                    on_skip(number)
+            else:
+                yield number
+        chunk.clear()
+
+    for registration_number in registration_numbers:
+        chunk.append(registration_number)
+        if len(chunk) >= chunk_size:
+            yield from flush()
+    if chunk:
+        yield from flush()
+
+
 
 
 def main():
@@ -1215,12 +4492,58 @@ def main():
 
 
 # 參數化爬蟲程式
-def batch_query_companies(registration_numbers):
+def batch_query_companies(
+    registration_numbers,
+    workers=1,
+    requests_per_second=None,
+    generate_pdf=True,
+    use_http=True,
+    parse_workers=None,
+    db_batch_size=20,
+    archive_dir=None,
+    request_budget=None,
+    on_result=None,
+    resume=False,
+    checkpoint_path=None,
+    pdf_workers=None,
+    not_found_ttl_days=None,
+    profile_ids=None,
+    profile_sample_rate=None,
+    adaptive=None,
+    on_saved=None,
+):
     """
     批量查詢公司資料
 
     Args:
-        registration_numbers: 統一編號列表
+        registration_numbers: 統一編號列表（或任何可迭代物件）
+        workers: 同時進行查詢的瀏覽器數量
+        requests_per_second: 所有 workers 合計對網站的請求速率上限，
+            預設讀取環境變數 FINDBIZ_REQUESTS_PER_SECOND
+        generate_pdf: 是否為每家公司產生友善列印 PDF
+        use_http: 是否先以 HTTP 快速路徑抓取詳細資料頁（PDF 在查詢中產生時不使用）
+        parse_workers: HTML 解析子行程數量，0 表示在查詢執行緒中直接解析，
+            預設讀取環境變數 FINDBIZ_PARSE_WORKERS
+        db_batch_size: 背景寫入資料庫時每個 transaction 最多包含的公司數
+        archive_dir: 原始 HTML 封存目錄，預設依環境變數 FINDBIZ_ARCHIVE_DIR，空字串表示不封存
+        request_budget: 本次批次對網站的請求數上限，用完後不再開始新的查詢
+        on_result: 可選的回呼函數 on_result(統一編號, 查詢結果)，每家公司查詢結束
+            以及背景寫入資料庫失敗時呼叫；查詢成功時資料可能尚未寫入資料庫
+        resume: 是否從進度檔繼續，跳過已完成（FINAL_OUTCOMES）的統一編號；
+            為 False 時重新建立進度檔
+        checkpoint_path: 進度檔路徑，預設依環境變數 FINDBIZ_CHECKPOINT，空字串表示不記錄進度
+        pdf_workers: 背景產生 PDF 的瀏覽器數量，0 表示在查詢中直接產生，
+            預設讀取環境變數 FINDBIZ_PDF_WORKERS
+        not_found_ttl_days: 查無符合資料的統一編號在多少天內略過不查，0 表示不使用快取，
+            預設讀取環境變數 FINDBIZ_NOT_FOUND_TTL_DAYS
+        profile_ids: 以 cProfile 與 tracemalloc 剖析的統一編號，預設讀取環境變數 FINDBIZ_PROFILE_IDS
+        profile_sample_rate: 其餘統一編號中被剖析的比例，預設讀取環境變數 FINDBIZ_PROFILE_SAMPLE_RATE
+        adaptive: 是否以 AimdController 依網站回應狀況調整同時查詢數與請求速率，
+            此時 workers 與 requests_per_second 為上限，預設讀取環境變數 FINDBIZ_ADAPTIVE
+        on_saved: 可選的回呼函數 on_saved(統一編號列表)，查詢成功的公司資料實際寫入資料庫後呼叫
+
+    Returns:
+        dict 或 None: 批次統計報告，包含各查詢結果的數量、失敗清單與各 worker 的處理量
     """
     try:
         # 初始化資料庫
@@ -1231,31 +4554,989 @@ def batch_query_companies(registration_numbers):
         downloads_dir = create_output_directory()
         logging.info(f"PDF輸出目錄: {downloads_dir}")
 
+        if requests_per_second is None:
+            requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+        rate_limiter = RateLimiter(requests_per_second)
+        driver_pool = DriverPool(size=workers, rate_limiter=rate_limiter)
+        if pdf_workers is None:
+            pdf_workers = int(os.environ.get("FINDBIZ_PDF_WORKERS", "0"))
+        # PDF 產生失敗的統一編號，資料寫入資料庫後也不視為完成
+        pdf_failed = set()
+
+        def on_pdf_error(registration_number, error):
+            report.record_pdf_error(registration_number, error)
+            pdf_failed.add(registration_number)
+            handle_result(registration_number, "PDF產生失敗")
+
+        pdf_queue = (
+            PdfRenderQueue(workers=pdf_workers, rate_limiter=rate_limiter, on_error=on_pdf_error)
+            if generate_pdf and pdf_workers > 0
+            else None
+        )
+        http_session = (
+            create_http_session(pool_size=workers)
+            if use_http and (not generate_pdf or pdf_queue is not None)
+            else None
+        )
+        if parse_workers is None:
+            parse_workers = int(os.environ.get("FINDBIZ_PARSE_WORKERS", "0"))
+        parse_pool = ParsePool(max_workers=parse_workers)
+        report = BatchReport()
+
+        if checkpoint_path is None:
+            checkpoint_path = CHECKPOINT_PATH
+        checkpoint = BatchCheckpoint(checkpoint_path, resume=resume) if checkpoint_path else None
+        if checkpoint is not None and resume:
+            registration_numbers = checkpoint.pending(registration_numbers)
+
+        if not_found_ttl_days is None:
+            not_found_ttl_days = NOT_FOUND_TTL_DAYS
+
+        def handle_result(registration_number, outcome, cached=False):
+            if outcome == "查無符合資料" and not cached and not_found_ttl_days > 0:
+                try:
+                    record_not_found([registration_number])
+                except Exception as e:
+                    logging.warning(f"無法記錄統一編號 {registration_number} 的查無資料快取: {e}")
+            # 成功的結果等資料實際寫入資料庫後才記錄到進度檔
+            if checkpoint is not None and outcome != "成功":
+                checkpoint.record(registration_number, outcome)
+            if on_result is not None:
+                on_result(registration_number, outcome)
+
+        def on_cached_not_found(registration_number):
+            report.record_cached_not_found(registration_number)
+            metrics.count("not_found_cache_hits")
+            handle_result(registration_number, "查無符合資料", cached=True)
+
+        if not_found_ttl_days > 0:
+            registration_numbers = skip_cached_not_found(
+                registration_numbers, not_found_ttl_days, on_skip=on_cached_not_found
+            )
+
+        def on_save_error(registration_number, error):
+            report.record_save_error(registration_number, error)
+            handle_result(registration_number, "資料庫保存失敗")
+
+        def handle_saved(saved_numbers):
+            saved_numbers = [number for number in saved_numbers if number not in pdf_failed]
+            if checkpoint is not None:
+                for registration_number in saved_numbers:
+                    checkpoint.record(registration_number, "成功")
+            if on_saved is not None and saved_numbers:
+                on_saved(saved_numbers)
+
+        writer = DatabaseWriter(
+            batch_size=db_batch_size,
+            max_queue=db_batch_size * 5,
+            on_error=on_save_error,
+            on_saved=handle_saved,
+        )
+        if archive_dir is None:
+            archive_dir = ARCHIVE_DIR
+        archive = HtmlArchive(archive_dir) if archive_dir else None
+        metrics_server = start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+        profiler = Profiler(profile_ids, profile_sample_rate)
+        if profiler.enabled:
+            logging.info(f"剖析結果將寫入 {profiler.output_dir}")
+        if adaptive is None:
+            adaptive = ADAPTIVE_CONCURRENCY
+        controller = (
+            AimdController(rate_limiter, max_concurrency=workers, max_rate=requests_per_second)
+            if adaptive
+            else None
+        )
+        if controller is not None:
+            metrics.add_listener(controller)
+        if request_budget is not None:
+            registration_numbers = _within_budget(
+                registration_numbers, rate_limiter, request_budget
+            )
+        try:
+            _run_batch(
+                registration_numbers,
+                workers,
+                report,
+                on_result=handle_result,
+                controller=controller,
+                driver_pool=driver_pool,
+                rate_limiter=rate_limiter,
+                http_session=http_session,
+                generate_pdf=generate_pdf,
+                parse_pool=parse_pool,
+                writer=writer,
+                archive=archive,
+                pdf_queue=pdf_queue,
+                profiler=profiler,
+            )
+        finally:
+            driver_pool.close()
+            if pdf_queue is not None:
+                pdf_queue.close()
+            parse_pool.close()
+            writer.close()
+            if http_session is not None:
+                http_session.close()
+            if checkpoint is not None:
+                checkpoint.close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+            if controller is not None:
+                metrics.remove_listener(controller)
+
+        summary = report.summary()
+        if controller is not None:
+            summary["自動調整"] = controller.summary()
+            logging.info(f"自動調整結束時的狀態: {summary['自動調整']}")
+        report.log_summary(summary)
+        metrics.log_summary()
+        metrics.write(downloads_dir)
+        return summary
+
+    except Exception as e:
+        logging.error(f"批量查詢程序執行錯誤: {e}")
+
+
+class BatchCheckpoint:
+    """
+    批次查詢進度檔：每家公司查詢結束時附加一行 JSON，程序中斷或容器重啟後
+    以 resume=True 重新執行即可跳過已完成的統一編號（執行緒安全）
+
+    進度檔只會附加，不會清空：每次執行開始時先寫入一行執行開始的標記，
+    未指定 resume 時同樣附加在既有的進度之後，只是不依進度跳過統一編號。
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        Args:
+            path: 進度檔路徑
+            resume: 是否讀取既有的進度並跳過已完成的統一編號，為 False 時重新查詢全部，
+                但仍保留既有的進度
+        """
+        self.path = path
+        self.outcomes = {}
+        self.skipped = 0
+        if resume and os.path.exists(path):
+            self.outcomes = self._load(path)
+            logging.info(
+                f"從進度檔 {path} 讀取 {len(self.outcomes)} 筆進度，"
+                f"其中 {len(self.completed())} 筆已完成"
+            )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0:
+            # 上次中斷時寫到一半的最後一行不能與新的紀錄接在一起
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+        self._lock = threading.Lock()
+        self._write(
+            {"run_started_at": datetime.now().isoformat(timespec="seconds"), "resume": resume}
+        )
+
+    @staticmethod
+    def _load(path):
+        outcomes = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 程序中斷時最後一行可能只寫入一半
+                    continue
+                # 略過執行開始的標記；同一統一編號以最後一次的結果為準
+                if "registration_number" in entry:
+                    outcomes[entry["registration_number"]] = entry["outcome"]
+        return outcomes
+
+    def completed(self):
+        """已完成、不需要重新查詢的統一編號"""
+        return {
+            registration_number
+            for registration_number, outcome in self.outcomes.items()
+            if outcome in FINAL_OUTCOMES
+        }
+
+    def pending(self, registration_numbers):
+        """逐一產生尚未完成的統一編號，未完成或暫時性失敗的統一編號會重新查詢"""
+        completed = self.completed()
         for registration_number in registration_numbers:
-            logging.info(f"開始查詢統一編號為 {registration_number} 的公司資料")
+            if registration_number in completed:
+                self.skipped += 1
+                continue
+            yield registration_number
+
+    def record(self, registration_number, outcome):
+        """記錄一家公司的查詢結果並立即寫入磁碟"""
+        entry = {
+            "registration_number": registration_number,
+            "outcome": outcome,
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self.outcomes[registration_number] = outcome
+            self._write(entry)
+
+    def _write(self, entry):
+        """附加一行 JSON 並立即寫入磁碟，呼叫端需持有 self._lock 或尚未開放其他執行緒使用"""
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        if self.skipped:
+            logging.info(f"依進度檔跳過 {self.skipped} 家已完成的公司")
+
+
+class BatchReport:
+    """彙整批次查詢的結果、失敗清單以及各 worker 的處理量（執行緒安全）"""
+
+    def __init__(self, max_failures=None):
+        """
+        Args:
+            max_failures: 失敗清單最多保留的統一編號數，超過的只計數，
+                預設讀取環境變數 FINDBIZ_REPORT_MAX_FAILURES
+        """
+        # 各查詢結果只保留數量；統一編號只保留可重試的失敗（不在 FINAL_OUTCOMES 中的結果），
+        # 且最多 max_failures 筆。查無符合資料等最終結果只計數，每筆結果另記錄在進度檔中。
+        self.max_failures = MAX_REPORTED_FAILURES if max_failures is None else max_failures
+        self.total = 0
+        self.outcomes = {}
+        self.failures = {}
+        self.omitted_failures = 0
+        # 查詢成功後才產生 PDF 或寫入資料庫失敗的統一編號與改計的結果，數量只隨這類失敗增加
+        self.late_failures = {}
+        self.save_errors = {}
+        self.pdf_errors = {}
+        self.workers = {}
+        self.cached_not_found = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _add_failure(self, registration_number, outcome):
+        """將統一編號加入失敗清單，清單已滿時只計數並回傳 False"""
+        if registration_number in self.failures or len(self.failures) < self.max_failures:
+            self.failures[registration_number] = outcome
+            return True
+        self.omitted_failures += 1
+        return False
 
-            try:
-                company_data = query_company(registration_number)
+    def _move(self, previous, outcome):
+        """將一筆已計數的結果從 previous 改計為 outcome"""
+        self.outcomes[previous] = self.outcomes.get(previous, 0) - 1
+        if not self.outcomes[previous]:
+            del self.outcomes[previous]
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def record(self, registration_number, outcome, elapsed):
+        """
+        記錄單一統一編號的查詢結果
+
+        Args:
+            registration_number: 統一編號
+            outcome: 查詢結果（company_data 中的「查詢結果」欄位）
+            elapsed: 查詢耗時（秒）
+        """
+        worker = threading.current_thread().name
+        with self._lock:
+            self.total += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome not in FINAL_OUTCOMES:
+                self._add_failure(registration_number, outcome)
+            stats = self.workers.setdefault(worker, {"公司數": 0, "耗時(秒)": 0.0})
+            stats["公司數"] += 1
+            stats["耗時(秒)"] += elapsed
+
+    def record_cached_not_found(self, registration_number):
+        """記錄因查無資料快取而略過的統一編號"""
+        with self._lock:
+            self.cached_not_found += 1
+
+    def record_save_error(self, registration_number, error):
+        """記錄背景寫入資料庫失敗的統一編號，原本的查詢結果改計為資料庫保存失敗"""
+        with self._lock:
+            # 只有查詢成功的資料會送到寫入執行緒，先前可能已改計為 PDF產生失敗
+            previous = self.late_failures.get(registration_number, "成功")
+            if previous == "資料庫保存失敗":
+                return
+            self.late_failures[registration_number] = "資料庫保存失敗"
+            self._move(previous, "資料庫保存失敗")
+            # 先前因清單已滿而未列出的統一編號已經計入未列出的失敗數
+            listed = registration_number in self.failures
+            if (listed or previous == "成功") and self._add_failure(
+                registration_number, "資料庫保存失敗"
+            ):
+                self.save_errors[registration_number] = error
+
+    def record_pdf_error(self, registration_number, error):
+        """記錄背景產生 PDF 失敗的統一編號，已經寫入資料庫失敗的仍計為資料庫保存失敗"""
+        with self._lock:
+            if registration_number in self.late_failures:
+                return
+            self.late_failures[registration_number] = "PDF產生失敗"
+            self._move("成功", "PDF產生失敗")
+            if self._add_failure(registration_number, "PDF產生失敗"):
+                self.pdf_errors[registration_number] = error
+
+    def summary(self):
+        """產生批次統計報告"""
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            outcomes = dict(self.outcomes)
+
+            workers = {}
+            for name, stats in sorted(self.workers.items()):
+                busy = stats["耗時(秒)"]
+                workers[name] = {
+                    "公司數": stats["公司數"],
+                    "耗時(秒)": round(busy, 1),
+                    "每分鐘公司數": round(stats["公司數"] * 60 / busy, 2) if busy else 0.0,
+                }
 
-                if company_data:
-                    logging.info(
-                        f"成功提取統一編號為 {registration_number} 的公司詳細資料，資料已保存到資料庫"
-                    )
-                else:
-                    logging.error(
-                        f"無法獲取統一編號為 {registration_number} 的公司詳細資料"
-                    )
+            return {
+                "總數": self.total,
+                "成功數": outcomes.get("成功", 0),
+                "失敗數": self.total - outcomes.get("成功", 0),
+                "快取略過數": self.cached_not_found,
+                "總耗時(秒)": round(elapsed, 1),
+                "每分鐘公司數": round(self.total * 60 / elapsed, 2) if elapsed else 0.0,
+                "查詢結果統計": outcomes,
+                "失敗清單": dict(self.failures),
+                "未列出失敗數": self.omitted_failures,
+                "資料庫錯誤": dict(self.save_errors),
+                "PDF錯誤": dict(self.pdf_errors),
+                "worker統計": workers,
+            }
 
-                # 間隔一段時間，避免頻繁請求
-                time.sleep(5)
-            except Exception as e:
+    @staticmethod
+    def log_summary(summary):
+        """將批次統計報告寫入日誌"""
+        logging.info(
+            f"批次查詢完成: 共 {summary['總數']} 家，成功 {summary['成功數']} 家，"
+            f"失敗 {summary['失敗數']} 家，耗時 {summary['總耗時(秒)']} 秒，"
+            f"每分鐘 {summary['每分鐘公司數']} 家"
+        )
+        if summary["快取略過數"]:
+            logging.info(f"  因查無資料快取略過: {summary['快取略過數']} 家")
+        for outcome, count in summary["查詢結果統計"].items():
+            logging.info(f"  {outcome}: {count}")
+        for name, stats in summary["worker統計"].items():
+            logging.info(
+                f"  {name}: {stats['公司數']} 家，耗時 {stats['耗時(秒)']} 秒，"
+                f"每分鐘 {stats['每分鐘公司數']} 家"
+            )
+        failures = list(summary["失敗清單"].items())
+        for registration_number, outcome in failures[:50]:
+            logging.warning(f"  失敗: {registration_number} - {outcome}")
+        if len(failures) > 50:
+            logging.warning(f"  ...其餘 {len(failures) - 50} 筆失敗請參考回傳的報告")
+        if summary["未列出失敗數"]:
+            logging.warning(
+                f"  另有 {summary['未列出失敗數']} 筆失敗超過清單上限未列出，請參考進度檔"
+            )
+
+
+def _within_budget(registration_numbers, rate_limiter, request_budget):
+    """逐一取出統一編號，直到限速器累計的請求數達到預算"""
+    for registration_number in registration_numbers:
+        if rate_limiter.requests >= request_budget:
+            logging.warning(
+                f"已使用 {rate_limiter.requests} 次請求，達到預算 {request_budget}，停止開始新的查詢"
+            )
+            return
+        yield registration_number
+
+
+def _run_batch(
+    registration_numbers, workers, report, on_result=None, controller=None, **query_options
+):
+    """
+    以 workers 個執行緒並行查詢，所有查詢共用 query_options 中的 WebDriver 連線池與限速器
+
+    統一編號逐一從輸入中取出並提交，同時進行中的工作數量有上限，
+    因此輸入可以是不會一次載入記憶體的產生器。提供 AimdController 時，
+    實際同時查詢的公司數由控制器決定（不超過 workers）。
+    """
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def worker(registration_number):
+        if controller is not None:
+            controller.acquire()
+        start = time.monotonic()
+        try:
+            company_data = query_company(registration_number, **query_options)
+
+            if company_data:
+                logging.info(
+                    f"統一編號為 {registration_number} 的查詢結果: {company_data.get('查詢結果')}"
+                )
+                outcome = company_data.get("查詢結果", "未知")
+            else:
                 logging.error(
-                    f"查詢統一編號為 {registration_number} 的公司資料時發生錯誤: {e}"
+                    f"無法獲取統一編號為 {registration_number} 的公司詳細資料"
                 )
-                continue
+                outcome = "無法獲取資料"
+        except Exception as e:
+            logging.error(
+                f"查詢統一編號為 {registration_number} 的公司資料時發生錯誤: {e}"
+            )
+            outcome = "發生錯誤"
+        finally:
+            if controller is not None:
+                controller.release()
+            in_flight.release()
+        elapsed = time.monotonic() - start
+        report.record(registration_number, outcome, elapsed)
+        metrics.observe("company", elapsed)
+        metrics.count("outcomes", outcome=outcome)
+        if on_result is not None:
+            try:
+                on_result(registration_number, outcome)
+            except Exception as e:
+                logging.error(f"記錄統一編號 {registration_number} 的查詢結果時發生錯誤: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scraper") as executor:
+        for registration_number in registration_numbers:
+            in_flight.acquire()
+            logging.info(f"開始查詢統一編號為 {registration_number} 的公司資料")
+            executor.submit(worker, registration_number)
+
+
+def _submit_archived_pages(archive, entry, parser):
+    """將一筆封存紀錄的頁面交給解析階段，同一份 HTML 只解析一次"""
+    by_blob = {}
+    for page in entry["pages"]:
+        by_blob.setdefault((page["sha256"], page["codec"]), []).append(page)
+
+    pending = []
+    for (digest, codec), pages in by_blob.items():
+        kinds = sorted({page["kind"] for page in pages})
+        pending.append((pages, parser.submit(archive.get(digest, codec), *kinds)))
+    return pending
+
+
+def _rebuild_company_data(entry, pending):
+    """依封存紀錄的解析結果組回與 query_company 相同格式的公司資料"""
+    results = {}
+    for pages, future in pending:
+        parsed = future.result()
+        for page in pages:
+            results[(page["kind"], page["page"])] = parsed[page["kind"]]
+
+    basic_info = results.get(("search", 1)) or {}
+    detailed_info = results.get(("detail", 1)) or {}
+    if not detailed_info:
+        # 原本就沒有取得詳細資料的紀錄，沿用當時的查詢結果
+        company_data = {"查詢結果": entry.get("result") or "無法獲取資料"}
+        if basic_info:
+            company_data["基本資料"] = basic_info
+        return company_data
+
+    company_data = {"查詢結果": "成功", "基本資料": basic_info, "詳細基本資料": detailed_info}
+    for name, _, _, kind in DETAIL_TABS:
+        rows = []
+        for page_num in sorted(page for key, page in results if key == kind):
+            rows.extend(results[(kind, page_num)])
+        company_data[name] = rows
+    return company_data
+
+
+def replay_archive(
+    registration_numbers=None,
+    archive_dir=None,
+    save=True,
+    parse_workers=None,
+    backend=None,
+    db_batch_size=20,
+):
+    """
+    不經瀏覽器與網路，以目前的 extract_* 函數重新解析封存的原始 HTML 並寫入資料庫
+
+    每個統一編號只重播最近一次有保存頁面的查詢紀錄。
+
+    Args:
+        registration_numbers: 要重播的統一編號，預設為封存中的全部統一編號
+        archive_dir: 封存目錄，預設依環境變數 FINDBIZ_ARCHIVE_DIR
+        save: 是否將解析結果寫入資料庫
+        parse_workers: HTML 解析子行程數量，預設讀取環境變數 FINDBIZ_PARSE_WORKERS
+        backend: 解析後端 "bs4" 或 "lxml"，預設依環境變數 FINDBIZ_PARSER_BACKEND
+        db_batch_size: 寫入資料庫時每個 transaction 最多包含的公司數
+
+    Returns:
+        dict 或 None: 與 batch_query_companies 相同格式的統計報告
+    """
+    try:
+        archive = HtmlArchive(archive_dir)
+        if registration_numbers is None:
+            registration_numbers = archive.registration_numbers()
+        if save and not init_database():
+            logging.error("無法初始化資料庫，程序終止")
+            return
+
+        if parse_workers is None:
+            parse_workers = int(os.environ.get("FINDBIZ_PARSE_WORKERS", "0"))
+        parse_pool = ParsePool(max_workers=parse_workers, backend=backend)
+        report = BatchReport()
+        writer = (
+            DatabaseWriter(
+                batch_size=db_batch_size,
+                max_queue=db_batch_size * 5,
+                on_error=report.record_save_error,
+            )
+            if save
+            else None
+        )
+
+        def finish(registration_number, entry, pending, start):
+            try:
+                company_data = _rebuild_company_data(entry, pending)
+                outcome = company_data["查詢結果"]
+                if writer is not None and outcome == "成功":
+                    writer.submit(company_data, registration_number)
+            except Exception as e:
+                logging.error(f"重播統一編號 {registration_number} 時發生錯誤: {e}")
+                outcome = "發生錯誤"
+            report.record(registration_number, outcome, time.monotonic() - start)
+
+        # 讀取與提交下一家公司的頁面時，前面的公司在子行程中解析，保持固定數量的進行中工作
+        window = max(parse_workers, 1) * 4
+        in_flight = []
+        try:
+            for registration_number in registration_numbers:
+                start = time.monotonic()
+                entry = archive.latest(registration_number)
+                if entry is None:
+                    report.record(registration_number, "封存中無資料", 0.0)
+                    continue
+                try:
+                    pending = _submit_archived_pages(archive, entry, parse_pool)
+                except Exception as e:
+                    logging.error(f"讀取統一編號 {registration_number} 的封存時發生錯誤: {e}")
+                    report.record(registration_number, "發生錯誤", time.monotonic() - start)
+                    continue
+                in_flight.append((registration_number, entry, pending, start))
+                if len(in_flight) >= window:
+                    finish(*in_flight.pop(0))
+            for item in in_flight:
+                finish(*item)
+        finally:
+            parse_pool.close()
+            if writer is not None:
+                writer.close()
+
+        summary = report.summary()
+        report.log_summary(summary)
+        return summary
 
     except Exception as e:
-        logging.error(f"批量查詢程序執行錯誤: {e}")
+        logging.error(f"重播封存程序執行錯誤: {e}")
+
+
+# 各類公司的重新查詢間隔（天）：剛變更過登記的公司最可能再次變更，已解散或廢止的公司幾乎不會變動
+REFRESH_INTERVAL_DAYS = {
+    "recently_changed": 14,
+    "active": 60,
+    "other": 90,
+    "inactive": 365,
+}
+
+# 視為「最近變更」的最後核准變更日期範圍（天）
+RECENT_CHANGE_DAYS = 365
+
+# 不再營運的登記現況
+INACTIVE_STATUS_PATTERN = "解散|廢止|撤銷|撤回|歇業|破產|清算|合併"
+
+# 每家公司預估的網站請求數（搜尋、詳細資料、各頁籤與 PDF）
+REQUESTS_PER_COMPANY = int(os.environ.get("FINDBIZ_REQUESTS_PER_COMPANY", "8"))
+
+# 每晚的網站請求預算
+DEFAULT_REFRESH_BUDGET = int(os.environ.get("FINDBIZ_REFRESH_BUDGET", "5000"))
+
+_REFRESH_CANDIDATES_SQL = text(
+    """
+    WITH scored AS (
+        SELECT registration_number,
+               EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - COALESCE(updated_at, created_at))
+                   / 86400.0
+                   / CASE
+                         WHEN registration_status ~ :inactive_pattern THEN :inactive_days
+                         WHEN last_change_date >= CURRENT_DATE - :recent_change_days
+                             THEN :recently_changed_days
+                         WHEN registration_status = '核准設立' THEN :active_days
+                         ELSE :other_days
+                     END AS priority
+          FROM company_overview
+    )
+    SELECT registration_number, priority
+      FROM scored
+     WHERE priority >= :min_priority
+     ORDER BY priority DESC
+     LIMIT :limit
+"""
+)
+
+
+def select_refresh_candidates(limit, min_priority=1.0, intervals=None):
+    """
+    依資料新舊程度與變更可能性挑選下一批要重新查詢的公司
+
+    優先度為距上次查詢的天數除以該類公司的重新查詢間隔，
+    大於等於 1 表示已超過間隔，數值越大越優先。
+
+    Args:
+        limit: 最多挑選的公司數
+        min_priority: 優先度下限，0 表示不論是否到期都依優先度排序挑選
+        intervals: 覆寫 REFRESH_INTERVAL_DAYS 中的部分間隔
+
+    Returns:
+        list: (統一編號, 優先度) 列表，依優先度由高到低排序
+    """
+    intervals = {**REFRESH_INTERVAL_DAYS, **(intervals or {})}
+    with engine.connect() as conn:
+        rows = conn.execute(
+            _REFRESH_CANDIDATES_SQL,
+            {
+                "inactive_pattern": INACTIVE_STATUS_PATTERN,
+                "recent_change_days": RECENT_CHANGE_DAYS,
+                "recently_changed_days": intervals["recently_changed"],
+                "active_days": intervals["active"],
+                "other_days": intervals["other"],
+                "inactive_days": intervals["inactive"],
+                "min_priority": min_priority,
+                "limit": limit,
+            },
+        ).all()
+    return [(row.registration_number, float(row.priority)) for row in rows]
+
+
+def refresh_stale_companies(
+    request_budget=None,
+    requests_per_company=None,
+    min_priority=1.0,
+    intervals=None,
+    **batch_options,
+):
+    """
+    在請求預算內重新查詢最需要更新的公司
+
+    Args:
+        request_budget: 本次可使用的網站請求數，預設讀取環境變數 FINDBIZ_REFRESH_BUDGET
+        requests_per_company: 每家公司預估的請求數，用來決定挑選的公司數，
+            預設讀取環境變數 FINDBIZ_REQUESTS_PER_COMPANY
+        min_priority: 優先度下限，參見 select_refresh_candidates
+        intervals: 覆寫 REFRESH_INTERVAL_DAYS 中的部分間隔
+        batch_options: 傳給 batch_query_companies 的其他參數
+
+    Returns:
+        dict 或 None: batch_query_companies 的統計報告
+    """
+    try:
+        if not init_database():
+            logging.error("無法初始化資料庫，程序終止")
+            return
+
+        if request_budget is None:
+            request_budget = DEFAULT_REFRESH_BUDGET
+        if requests_per_company is None:
+            requests_per_company = REQUESTS_PER_COMPANY
+        limit = max(request_budget // max(requests_per_company, 1), 0)
+
+        candidates = select_refresh_candidates(limit, min_priority, intervals)
+        if not candidates:
+            logging.info("沒有需要重新查詢的公司")
+            return
+        logging.info(
+            f"請求預算 {request_budget}，挑選 {len(candidates)} 家公司重新查詢，"
+            f"最高優先度 {candidates[0][1]:.2f}"
+        )
+
+        # 重新挑選時已依 updated_at 排除剛查詢過的公司，不需要進度檔
+        batch_options.setdefault("checkpoint_path", "")
+        return batch_query_companies(
+            [registration_number for registration_number, _ in candidates],
+            request_budget=request_budget,
+            **batch_options,
+        )
+
+    except Exception as e:
+        logging.error(f"重新查詢排程執行錯誤: {e}")
+
+
+# 工作失敗後重新排入佇列前的等待秒數（依嘗試次數加倍）
+JOB_RETRY_BACKOFF_SECONDS = 60
+
+_ENQUEUE_JOBS_SQL = """
+    INSERT INTO scrape_jobs (registration_number, priority, max_attempts)
+    VALUES %s
+    ON CONFLICT (registration_number) DO UPDATE
+       SET status = 'pending',
+           priority = EXCLUDED.priority,
+           max_attempts = EXCLUDED.max_attempts,
+           attempts = 0,
+           available_at = CURRENT_TIMESTAMP,
+           updated_at = CURRENT_TIMESTAMP
+     WHERE scrape_jobs.status IN ('done', 'failed')
+"""
+
+# 租約過期且已用完嘗試次數的工作標記為失敗
+_EXPIRE_JOBS_SQL = text(
+    """
+    UPDATE scrape_jobs
+       SET status = 'failed',
+           result = COALESCE(result, '租約逾期'),
+           finished_at = CURRENT_TIMESTAMP,
+           updated_at = CURRENT_TIMESTAMP
+     WHERE status = 'running'
+       AND lease_expires_at < CURRENT_TIMESTAMP
+       AND attempts >= max_attempts
+"""
+)
+
+# 認領待處理或租約已過期的工作，其他節點正在認領的列直接跳過
+_CLAIM_JOBS_SQL = text(
+    """
+    UPDATE scrape_jobs j
+       SET status = 'running',
+           worker_id = :worker_id,
+           attempts = j.attempts + 1,
+           lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => :lease_seconds),
+           heartbeat_at = CURRENT_TIMESTAMP,
+           updated_at = CURRENT_TIMESTAMP
+      FROM (
+            SELECT id
+              FROM scrape_jobs
+             WHERE status IN ('pending', 'running')
+               AND (status = 'pending' OR lease_expires_at < CURRENT_TIMESTAMP)
+               AND available_at <= CURRENT_TIMESTAMP
+               AND attempts < max_attempts
+             ORDER BY priority DESC, id
+             LIMIT :limit
+             FOR UPDATE SKIP LOCKED
+           ) claimable
+     WHERE j.id = claimable.id
+    RETURNING j.registration_number
+"""
+)
+
+_HEARTBEAT_SQL = text(
+    """
+    UPDATE scrape_jobs
+       SET heartbeat_at = CURRENT_TIMESTAMP,
+           lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => :lease_seconds)
+     WHERE worker_id = :worker_id AND status = 'running'
+"""
+)
+
+# 只更新仍由此節點執行中的工作，租約已被其他節點接手或已記錄過結果時不覆寫；
+# 唯一的例外是已完成的工作之後才產生 PDF 失敗，此時重新排入佇列
+_COMPLETE_JOB_SQL = text(
+    """
+    UPDATE scrape_jobs
+       SET status = CASE
+                        WHEN :final THEN 'done'
+                        WHEN attempts >= max_attempts THEN 'failed'
+                        ELSE 'pending'
+                    END,
+           result = :result,
+           lease_expires_at = NULL,
+           available_at = CURRENT_TIMESTAMP
+               + make_interval(secs => :backoff_seconds * power(2, attempts - 1)),
+           finished_at = CASE WHEN :final THEN CURRENT_TIMESTAMP END,
+           updated_at = CURRENT_TIMESTAMP
+     WHERE registration_number = :registration_number
+       AND worker_id = :worker_id
+       AND (status = 'running' OR (status = 'done' AND NOT :final))
+"""
+)
+
+
+def default_worker_id():
+    """以主機名稱與行程編號識別爬蟲節點"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def enqueue_jobs(registration_numbers, priority=0, max_attempts=3, chunk_size=1000):
+    """
+    將統一編號加入查詢工作佇列
+
+    已完成或已失敗的工作會重新排入佇列，等待中或執行中的工作維持不變；
+    不符合檢查碼規則的統一編號直接略過。
+
+    Args:
+        registration_numbers: 統一編號的可迭代物件
+        priority: 優先度，數值越大越先被認領
+        max_attempts: 每個工作最多嘗試次數
+        chunk_size: 每次寫入資料庫的筆數
+
+    Returns:
+        int: 新增或重新排入佇列的工作數
+    """
+    if not init_database():
+        raise RuntimeError("無法初始化資料庫")
+
+    queued = 0
+    chunk = []
+
+    def flush():
+        nonlocal queued
+        with engine.begin() as conn:
+            cursor = conn.connection.cursor()
+            execute_values(
+                cursor,
+                _ENQUEUE_JOBS_SQL,
+                [(number, priority, max_attempts) for number in dict.fromkeys(chunk)],
+                page_size=chunk_size,
+            )
+            queued += cursor.rowcount
+        chunk.clear()
+
+    # 不符合檢查碼規則的統一編號不會進入佇列
+    for registration_number in filter_registration_numbers(registration_numbers):
+        chunk.append(registration_number)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    logging.info(f"已將 {queued} 個統一編號加入查詢工作佇列")
+    return queued
+
+
+def claim_jobs(worker_id, limit, lease_seconds=300):
+    """
+    認領工作佇列中優先度最高的工作
+
+    Returns:
+        list: 認領到的統一編號
+    """
+    with engine.begin() as conn:
+        conn.execute(_EXPIRE_JOBS_SQL)
+        rows = conn.execute(
+            _CLAIM_JOBS_SQL,
+            {"worker_id": worker_id, "limit": limit, "lease_seconds": lease_seconds},
+        ).all()
+    return [row.registration_number for row in rows]
+
+
+def complete_job(worker_id, registration_number, outcome):
+    """
+    記錄工作的查詢結果
+
+    FINAL_OUTCOMES 中的結果標記為完成；其餘結果在未用完嘗試次數前重新排入佇列，
+    並依嘗試次數延後可再次認領的時間。
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            _COMPLETE_JOB_SQL,
+            {
+                "worker_id": worker_id,
+                "registration_number": registration_number,
+                "result": outcome,
+                "final": outcome in FINAL_OUTCOMES,
+                "backoff_seconds": JOB_RETRY_BACKOFF_SECONDS,
+            },
+        )
+
+
+class JobHeartbeat:
+    """背景執行緒，定期延長此節點持有的所有工作的租約"""
+
+    def __init__(self, worker_id, lease_seconds):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = max(self.lease_seconds / 3, 1)
+        while not self._stopped.wait(interval):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        _HEARTBEAT_SQL,
+                        {"worker_id": self.worker_id, "lease_seconds": self.lease_seconds},
+                    )
+            except Exception as e:
+                logging.warning(f"更新工作租約失敗: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def _claimed_jobs(worker_id, batch_size, lease_seconds, idle_timeout, poll_interval):
+    """逐批認領工作並逐一產生統一編號，佇列持續空閒超過 idle_timeout 秒後結束"""
+    idle_since = None
+    while True:
+        jobs = claim_jobs(worker_id, batch_size, lease_seconds)
+        if not jobs:
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since >= idle_timeout:
+                logging.info("工作佇列中沒有可認領的工作")
+                return
+            time.sleep(poll_interval)
+            continue
+
+        idle_since = None
+        logging.info(f"節點 {worker_id} 認領 {len(jobs)} 個工作")
+        yield from jobs
+
+
+def work_queue(
+    worker_id=None,
+    lease_seconds=300,
+    idle_timeout=0,
+    poll_interval=10,
+    **batch_options,
+):
+    """
+    從共用的工作佇列認領統一編號並查詢，多個節點可以同時對同一個資料庫執行
+
+    Args:
+        worker_id: 節點識別碼，預設為主機名稱與行程編號
+        lease_seconds: 工作租約秒數，節點當機時其他節點在租約逾期後接手
+        idle_timeout: 佇列空閒多少秒後結束，0 表示佇列清空就結束
+        poll_interval: 佇列空閒時重新檢查的間隔秒數
+        batch_options: 傳給 batch_query_companies 的其他參數
+
+    Returns:
+        dict 或 None: batch_query_companies 的統計報告
+    """
+    if not init_database():
+        logging.error("無法初始化資料庫，程序終止")
+        return
+
+    worker_id = worker_id or default_worker_id()
+    workers = batch_options.get("workers", 1)
+
+    def on_result(registration_number, outcome):
+        # 查詢成功的工作等資料實際寫入資料庫後才標記為完成，寫入失敗時會以資料庫保存失敗回報
+        if outcome != "成功":
+            complete_job(worker_id, registration_number, outcome)
+
+    def on_saved(saved_numbers):
+        for registration_number in saved_numbers:
+            complete_job(worker_id, registration_number, "成功")
+
+    heartbeat = JobHeartbeat(worker_id, lease_seconds)
+    try:
+        return batch_query_companies(
+            _claimed_jobs(worker_id, workers, lease_seconds, idle_timeout, poll_interval),
+            on_result=on_result,
+            on_saved=on_saved,
+            # 進度記錄在 scrape_jobs 表中，不需要進度檔
+            checkpoint_path="",
+            **batch_options,
+        )
+    finally:
+        heartbeat.stop()
 
 
 if __name__ == "__main__":
@@ -1275,4 +5556,121 @@ if __name__ == "__main__":
         "73008303", # 大成長城
         "11111111" # 測試
         ]
-    batch_query_companies(companies_to_query)
+
+    parser = argparse.ArgumentParser(description="台灣公司資料爬蟲")
+    subparsers = parser.add_subparsers(dest="command")
+    replay_parser = subparsers.add_parser(
+        "replay", help="不經瀏覽器，重新解析封存的原始 HTML 並寫入資料庫"
+    )
+    replay_parser.add_argument(
+        "registration_numbers", nargs="*", help="要重播的統一編號，預設為封存中的全部"
+    )
+    replay_parser.add_argument("--archive-dir", help="封存目錄，預設依 FINDBIZ_ARCHIVE_DIR")
+    replay_parser.add_argument("--parse-workers", type=int, help="HTML 解析子行程數量")
+    replay_parser.add_argument("--backend", choices=["bs4", "lxml"], help="解析後端")
+    replay_parser.add_argument(
+        "--no-save", action="store_true", help="只解析不寫入資料庫"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="從進度檔繼續，跳過已完成的統一編號"
+    )
+    parser.add_argument(
+        "--input", help="統一編號來源檔案（每行一個，或 .csv），`-` 表示標準輸入"
+    )
+    parser.add_argument("--column", help="CSV 中統一編號的欄位名稱或索引，預設為第一欄")
+    parser.add_argument(
+        "--done-bitmap", help="記錄已完成統一編號的位元檔，已完成的統一編號會略過"
+    )
+    refresh_parser = subparsers.add_parser(
+        "refresh", help="在請求預算內重新查詢最久未更新或最可能已變更的公司"
+    )
+    refresh_parser.add_argument(
+        "--budget", type=int, help="網站請求預算，預設依 FINDBIZ_REFRESH_BUDGET"
+    )
+    refresh_parser.add_argument(
+        "--requests-per-company", type=int, help="每家公司預估的請求數"
+    )
+    enqueue_parser = subparsers.add_parser("enqueue", help="將統一編號加入共用的查詢工作佇列")
+    enqueue_parser.add_argument("registration_numbers", nargs="*", help="要查詢的統一編號")
+    enqueue_parser.add_argument(
+        "--file", help="每行一個統一編號的檔案（或 .csv 的第一欄），`-` 表示標準輸入"
+    )
+    enqueue_parser.add_argument(
+        "--range",
+        nargs=2,
+        type=int,
+        metavar=("START", "STOP"),
+        help="加入 START 到 STOP（不含）之間所有符合檢查碼規則的統一編號",
+    )
+    enqueue_parser.add_argument("--priority", type=int, default=0, help="優先度，越大越先查詢")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=3, help="最多嘗試次數")
+    work_parser = subparsers.add_parser("work", help="從共用的查詢工作佇列認領並查詢")
+    work_parser.add_argument("--worker-id", help="節點識別碼，預設為主機名稱與行程編號")
+    work_parser.add_argument("--lease", type=int, default=300, help="工作租約秒數")
+    work_parser.add_argument(
+        "--idle-timeout", type=int, default=0, help="佇列空閒多少秒後結束，0 表示清空就結束"
+    )
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay_archive(
+            args.registration_numbers or None,
+            archive_dir=args.archive_dir,
+            save=not args.no_save,
+            parse_workers=args.parse_workers,
+            backend=args.backend,
+        )
+    elif args.command == "enqueue":
+        numbers = iter(args.registration_numbers)
+        if args.file:
+            numbers = itertools.chain(numbers, iter_registration_numbers(args.file))
+        if args.range:
+            numbers = itertools.chain(numbers, valid_registration_numbers(*args.range))
+        enqueue_jobs(numbers, priority=args.priority, max_attempts=args.max_attempts)
+    elif args.command == "work":
+        work_queue(
+            worker_id=args.worker_id,
+            lease_seconds=args.lease,
+            idle_timeout=args.idle_timeout,
+            workers=int(os.environ.get("FINDBIZ_WORKERS", "1")),
+            generate_pdf=os.environ.get("FINDBIZ_GENERATE_PDF", "1") != "0",
+        )
+    elif args.command == "refresh":
+        refresh_stale_companies(
+            request_budget=args.budget,
+            requests_per_company=args.requests_per_company,
+            workers=int(os.environ.get("FINDBIZ_WORKERS", "1")),
+            generate_pdf=os.environ.get("FINDBIZ_GENERATE_PDF", "1") != "0",
+        )
+    else:
+        numbers = (
+            iter_registration_numbers(args.input, args.column)
+            if args.input
+            else companies_to_query
+        )
+        done = IdBitmap.load(args.done_bitmap) if args.done_bitmap else None
+
+        def mark_done(registration_number, outcome):
+            # 查詢成功的統一編號等資料實際寫入資料庫後才由 mark_saved 標記
+            if outcome in FINAL_OUTCOMES and outcome != "成功":
+                done.add(registration_number)
+            elif outcome not in FINAL_OUTCOMES:
+                # 寫入資料庫或產生 PDF 失敗時會再回報一次
+                done.discard(registration_number)
+
+        def mark_saved(saved_numbers):
+            for registration_number in saved_numbers:
+                done.add(registration_number)
+
+        try:
+            batch_query_companies(
+                dedupe_registration_numbers(filter_registration_numbers(numbers), skip=done),
+                workers=int(os.environ.get("FINDBIZ_WORKERS", "1")),
+                generate_pdf=os.environ.get("FINDBIZ_GENERATE_PDF", "1") != "0",
+                resume=args.resume,
+                on_result=mark_done if done is not None else None,
+                on_saved=mark_saved if done is not None else None,
+            )
+        finally:
+            if done is not None:
+                done.save(args.done_bitmap)
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+import scrape_and_print as scraper
+
+
+def _checkpoint_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_checkpoint_resume_skips_final_outcomes(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = scraper.BatchCheckpoint(path)
+    checkpoint.record("22099131", "成功")
+    checkpoint.record("04595257", "查無符合資料")
+    checkpoint.record("10458575", "查詢超時，無結果")
+    checkpoint.record("11111111", "統一編號格式錯誤")
+    checkpoint.close()
+
+    resumed = scraper.BatchCheckpoint(path, resume=True)
+    pending = list(resumed.pending(["22099131", "04595257", "10458575", "11111111", "10458570"]))
+    resumed.close()
+    assert pending == ["10458575", "10458570"]
+    assert resumed.skipped == 3
+
+
+def test_checkpoint_latest_outcome_wins(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = scraper.BatchCheckpoint(path)
+    checkpoint.record("22099131", "成功")
+    # 查詢成功後寫入資料庫失敗，再次回報的結果取代先前的成功
+    checkpoint.record("22099131", "資料庫保存失敗")
+    checkpoint.record("04595257", "發生錯誤")
+    checkpoint.record("04595257", "成功")
+    checkpoint.close()
+
+    resumed = scraper.BatchCheckpoint(path, resume=True)
+    resumed.close()
+    assert resumed.completed() == {"04595257"}
+
+
+def test_checkpoint_ignores_truncated_last_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    checkpoint = scraper.BatchCheckpoint(str(path))
+    checkpoint.record("22099131", "成功")
+    checkpoint.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"registration_number": "04595257", "outc')
+
+    resumed = scraper.BatchCheckpoint(str(path), resume=True)
+    resumed.record("04595257", "成功")
+    resumed.close()
+    assert resumed.completed() == {"22099131", "04595257"}
+
+    reloaded = scraper.BatchCheckpoint(str(path), resume=True)
+    reloaded.close()
+    assert reloaded.completed() == {"22099131", "04595257"}
+
+
+def test_checkpoint_without_resume_keeps_progress(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = scraper.BatchCheckpoint(path)
+    checkpoint.record("22099131", "成功")
+    checkpoint.close()
+
+    # 沒有 resume 時重新查詢全部，但不清空先前的進度
+    restarted = scraper.BatchCheckpoint(path)
+    assert list(restarted.pending(["22099131"])) == ["22099131"]
+    restarted.record("04595257", "查無符合資料")
+    restarted.close()
+
+    lines = _checkpoint_lines(path)
+    assert [line.get("resume") for line in lines if "run_started_at" in line] == [False, False]
+    resumed = scraper.BatchCheckpoint(path, resume=True)
+    resumed.close()
+    assert resumed.completed() == {"22099131", "04595257"}
+
+
+class _FakeRateLimiter:
+    def __init__(self):
+        self.rates = []
+
+    def set_rate(self, rate):
+        self.rates.append(rate)
+
+
+def _controller(**options):
+    options = {
+        "max_concurrency": 8,
+        "max_rate": 10.0,
+        "cooldown": 0.0,
+        **options,
+    }
+    return scraper.AimdController(_FakeRateLimiter(), **options)
+
+
+def test_aimd_starts_low():
+    controller = _controller()
+    assert controller.limit == 1
+    assert controller.rate == 5.0
+    assert controller.rate_limiter.rates == [5.0]
+
+
+def test_aimd_increases_after_a_round_of_successes():
+    controller = _controller()
+    controller.on_count("outcomes", 1, {"outcome": "成功"})
+    assert controller.limit == 2
+    assert controller.rate == pytest.approx(6.0)
+
+    # 同時查詢數為 2 時，需要再完成 2 家才增加
+    controller.on_count("outcomes", 1, {"outcome": "查無符合資料"})
+    assert controller.limit == 2
+    controller.on_count("outcomes", 1, {"outcome": "成功"})
+    assert controller.limit == 3
+    assert controller.rate == pytest.approx(7.0)
+
+
+def test_aimd_increase_is_capped():
+    controller = _controller(max_concurrency=2)
+    for _ in range(50):
+        controller.on_count("outcomes", 1, {"outcome": "成功"})
+    assert controller.limit == 2
+    assert controller.rate == pytest.approx(10.0)
+
+
+def test_aimd_decreases_on_congestion_outcome():
+    controller = _controller(initial_concurrency=8, initial_rate=8.0)
+    controller.on_count("outcomes", 1, {"outcome": "查詢超時，無結果"})
+    assert controller.limit == 4
+    assert controller.rate == pytest.approx(4.0)
+    assert controller.decreases == 1
+
+
+def test_aimd_decrease_respects_floor():
+    controller = _controller(initial_concurrency=2, initial_rate=1.0, min_rate=0.75)
+    for _ in range(5):
+        controller.on_count("outcomes", 1, {"outcome": "發生錯誤"})
+    assert controller.limit == 1
+    assert controller.rate == pytest.approx(0.75)
+
+
+@pytest.mark.parametrize(
+    "status, congested",
+    [("503", True), ("500", True), ("429", True), ("ConnectionError", True),
+     ("404", False), ("403", False)],
+)
+def test_aimd_http_errors(status, congested):
+    controller = _controller(initial_concurrency=8, initial_rate=8.0)
+    controller.on_count("http_errors", 1, {"status": status})
+    assert (controller.decreases == 1) is congested
+    assert controller.limit == (4 if congested else 8)
+
+
+def test_aimd_decreases_on_slow_pages():
+    controller = _controller(initial_concurrency=8, initial_rate=8.0, min_latency=0.5)
+    controller.on_observe("search", 1.0)
+    controller.on_observe("search", 2.0)
+    assert controller.decreases == 0
+    controller.on_observe("search", 10.0)
+    assert controller.decreases == 1
+    # 非頁面載入的階段不影響
+    controller.on_observe("save_to_database", 60.0)
+    assert controller.decreases == 1
+
+
+def test_aimd_cooldown_limits_decreases():
+    controller = _controller(initial_concurrency=8, initial_rate=8.0, cooldown=60.0)
+    controller.on_count("outcomes", 1, {"outcome": "發生錯誤"})
+    controller.on_count("outcomes", 1, {"outcome": "發生錯誤"})
+    assert controller.decreases == 1
+    assert controller.limit == 4
@@ -0,0 +1,108 @@
+from datetime import date
+
+import bs4
+import pytest
+
+import bench_parsers
+import scrape_and_print as scraper
+
+CORPUS = bench_parsers.load_corpus(bench_parsers.DEFAULT_CORPUS)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("民國112年03月01日", date(2023, 3, 1)),
+        ("112年3月1日", date(2023, 3, 1)),
+        ("076年02月21日", date(1987, 2, 21)),
+        ("99 年 12 月 31 日", date(2010, 12, 31)),
+        ("1120301", date(2023, 3, 1)),
+        ("0760221", date(1987, 2, 21)),
+        ("112/03/01", date(2023, 3, 1)),
+        ("112-3-1", date(2023, 3, 1)),
+        ("112.03.01", date(2023, 3, 1)),
+        ("112年02月30日", None),
+        ("112年13月01日", None),
+        ("", None),
+        (None, None),
+        ("查無資料", None),
+    ],
+)
+def test_parse_roc_date(value, expected):
+    assert scraper.parse_roc_date(value) == expected
+
+
+def test_corpus_is_not_empty():
+    names = [name for name, _, _ in CORPUS]
+    assert "file:detail_company.html" in names
+    assert "file:search_result.html" in names
+
+
+@pytest.mark.parametrize("name, html, kinds", CORPUS, ids=[sample[0] for sample in CORPUS])
+def test_lxml_matches_bs4(name, html, kinds):
+    soup = bs4.BeautifulSoup(html, "lxml")
+    tree = scraper.parse_html_tree(html)
+    for kind in kinds:
+        expected = scraper.PAGE_EXTRACTORS[kind](soup)
+        assert scraper.PAGE_EXTRACTORS_LXML[kind](tree) == expected, kind
+
+
+def test_corpus_extracts_expected_rows():
+    samples = {name: html for name, html, _ in CORPUS}
+    tree = scraper.parse_html_tree(samples["file:detail_many_branches.html"])
+    extractors = scraper.PAGE_EXTRACTORS_LXML
+    assert len(extractors["branch"](tree)) == 10
+    assert extractors["branch_paging"](tree) == {"total": 512, "pages": 52}
+    assert extractors["tabs_complete"](tree) is True
+
+    tree = scraper.parse_html_tree(samples["file:detail_sole_proprietor.html"])
+    assert extractors["branch"](tree) == ["查無符合結果"]
+    assert extractors["branch_paging"](tree) == {"total": None, "pages": 1}
+
+    tree = scraper.parse_html_tree(samples["file:search_not_found.html"])
+    assert extractors["search"](tree) == {}
+
+
+def test_find_paging_request_in_body():
+    requests = [
+        {"method": "GET", "url": "https://example.test/fts/js/common.js", "body": None},
+        {
+            "method": "POST",
+            "url": "https://example.test/queryCmpyDetailFact.do",
+            "body": "banNo=22099131&objectId=SC22099131&pageNo=2",
+        },
+    ]
+    found = scraper.find_paging_request(requests, 2)
+    assert found["location"] == "body"
+    assert found["param"] == "pageNo"
+    assert found["url"] == "https://example.test/queryCmpyDetailFact.do"
+
+    rebuilt = scraper.build_paging_request(found, 7)
+    assert rebuilt["body"] == "banNo=22099131&objectId=SC22099131&pageNo=7"
+    assert rebuilt["url"] == found["url"]
+
+
+def test_find_paging_request_prefers_page_param():
+    requests = [
+        {"method": "GET", "url": "https://example.test/page.do?tab=2&pageNo=2&size=10", "body": ""},
+    ]
+    found = scraper.find_paging_request(requests, 2)
+    assert found["location"] == "url"
+    assert found["param"] == "pageNo"
+
+    rebuilt = scraper.build_paging_request(found, 11)
+    assert rebuilt["url"] == "https://example.test/page.do?tab=2&pageNo=11&size=10"
+
+
+def test_find_paging_request_uses_latest_request():
+    requests = [
+        {"method": "POST", "url": "https://example.test/a.do", "body": "pageNo=2&x=1"},
+        {"method": "POST", "url": "https://example.test/b.do", "body": "pageNo=2&x=2"},
+    ]
+    assert scraper.find_paging_request(requests, 2)["url"] == "https://example.test/b.do"
+
+
+def test_find_paging_request_without_match():
+    requests = [{"method": "POST", "url": "https://example.test/a.do", "body": "pageNo=3"}]
+    assert scraper.find_paging_request(requests, 2) is None
+    assert scraper.find_paging_request([], 2) is None
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+import scrape_and_print as scraper
+
+
+def _reference_valid(registration_number):
+    """逐位數計算的統一編號檢查碼規則，作為向量化實作的對照"""
+    if len(registration_number) != 8 or not registration_number.isascii():
+        return False
+    if not registration_number.isdigit():
+        return False
+    weights = [1, 2, 1, 2, 1, 2, 4, 1]
+    total = sum(
+        sum(divmod(int(digit) * weight, 10))
+        for digit, weight in zip(registration_number, weights)
+    )
+    return total % 5 == 0 or (registration_number[6] == "7" and (total + 1) % 5 == 0)
+
+
+@pytest.mark.parametrize(
+    "registration_number, expected",
+    [
+        ("22099131", True),
+        ("04595257", True),
+        ("11111111", False),
+        ("22099132", False),
+        # 第七位數為 7：總和可被 5 整除，或加 1 後可被 5 整除都合法
+        ("10458570", True),
+        ("10458574", True),
+        ("10458575", True),
+        ("10458579", True),
+        ("10458571", False),
+        ("1234567", False),
+        ("123456789", False),
+        ("2209913a", False),
+        (" 22099131", False),
+        ("", False),
+    ],
+)
+def test_checksum(registration_number, expected):
+    assert scraper.is_valid_registration_number(registration_number) is expected
+    assert _reference_valid(registration_number) is expected
+
+
+def test_full_width_digits_are_rejected():
+    full_width = str.maketrans("0123456789", "０１２３４５６７８９")
+    numbers = [f"{number:08d}".translate(full_width) for number in range(0, 100_000, 7)]
+    assert not scraper.registration_number_mask(numbers).any()
+    assert not scraper.is_valid_registration_number("２２０９９１３１")
+
+
+def test_mask_matches_reference():
+    numbers = [f"{number:08d}" for number in range(10_450_000, 10_470_000)]
+    mask = scraper.registration_number_mask(numbers)
+    assert mask.tolist() == [_reference_valid(number) for number in numbers]
+
+
+def test_mask_empty_input():
+    mask = scraper.registration_number_mask([])
+    assert mask.shape == (0,)
+    assert mask.dtype == np.bool_
+
+
+def test_valid_registration_numbers_matches_reference():
+    expected = [
+        f"{number:08d}"
+        for number in range(10_450_000, 10_470_000)
+        if _reference_valid(f"{number:08d}")
+    ]
+    # chunk_size 不整除範圍時，分段邊界上的號碼也不能遺漏或重複
+    assert list(scraper.valid_registration_numbers(10_450_000, 10_470_000, chunk_size=333)) == expected
+
+
+def test_valid_registration_numbers_clamps_range():
+    assert list(scraper.valid_registration_numbers(99_999_990, 200_000_000)) == [
+        number
+        for number in (f"{n:08d}" for n in range(99_999_990, 100_000_000))
+        if _reference_valid(number)
+    ]
+
+
+def test_filter_registration_numbers_keeps_order_and_strips():
+    numbers = [" 22099131 ", "11111111", "", "04595257", "２２０９９１３１", "22099131"]
+    assert list(scraper.filter_registration_numbers(numbers, chunk_size=2)) == [
+        "22099131",
+        "04595257",
+        "22099131",
+    ]
+
+
+def test_id_bitmap_membership():
+    bitmap = scraper.IdBitmap()
+    assert bitmap.add("22099131") is True
+    assert bitmap.add("22099131") is False
+    assert bitmap.add("00000000") is True
+    assert bitmap.add("99999999") is True
+    assert "22099131" in bitmap
+    assert "22099130" not in bitmap
+    assert len(bitmap) == 3
+
+    bitmap.discard("22099131")
+    bitmap.discard("12345678")
+    assert "22099131" not in bitmap
+    assert len(bitmap) == 2
+
+
+def test_id_bitmap_save_and_load(tmp_path):
+    path = tmp_path / "done" / "done.bin"
+    bitmap = scraper.IdBitmap()
+    for number in ("00000001", "04595257", "22099131", "99999999"):
+        bitmap.add(number)
+    bitmap.save(str(path))
+
+    loaded = scraper.IdBitmap.load(str(path))
+    assert len(loaded) == 4
+    for number in ("00000001", "04595257", "22099131", "99999999"):
+        assert number in loaded
+    assert "00000000" not in loaded
+    assert not (tmp_path / "done" / "done.bin.part").exists()
+
+
+def test_id_bitmap_rejects_wrong_size():
+    with pytest.raises(ValueError):
+        scraper.IdBitmap(b"\x00" * 10)
+
+
+def test_iter_registration_numbers_csv_with_bom(tmp_path):
+    path = tmp_path / "ids.csv"
+    path.write_text("名稱,ban\n甲,22099131\n乙,\n丙,04595257\n", encoding="utf-8-sig")
+    assert list(scraper.iter_registration_numbers(str(path), "ban")) == ["22099131", "04595257"]
+
+    with pytest.raises(ValueError, match="ban_no"):
+        list(scraper.iter_registration_numbers(str(path), "ban_no"))